@@ -16,6 +16,7 @@ from sqlalchemy import (
     Float,
     DECIMAL,
     Boolean,
+    LargeBinary,
     inspect
 )
 from sqlalchemy.ext.declarative import declarative_base
@@ -83,6 +84,8 @@ class TransactionStatusWithSignature(Base):
         Index("ix_transactions_block_time", "block_time"),
         Index("ix_transactions_signature", "signature"),
         Index("ix_transactions_source", "source"),
+        # Slots of transactions whose data are yet to be collected.
+        Index("ix_transactions_pending_slot", "slot", postgresql_where=transaction_data.is_(None)),
         {"schema": SCHEMA_LENDERS},
     )
 
@@ -93,6 +96,30 @@ class TransactionStatusWithSignature(Base):
         )
 
 
+class BlockAssignments(Base):
+    """
+    Blocks with transactions whose data are yet to be collected by historical collectors. Each collector claims a
+    batch of blocks with a lease, renews the lease while collecting and deletes the blocks once they are collected.
+    Blocks with expired leases can be claimed by other collectors.
+    """
+    __tablename__ = "block_assignments"
+
+    slot = Column(BigInteger, primary_key=True)
+    worker = Column(String, nullable=True)
+    lease_expires_at = Column(BigInteger, nullable=True)  # unix timestamp
+
+    __table_args__ = (
+        Index("ix_block_assignments_lease_expires_at", "lease_expires_at"),
+        {"schema": SCHEMA_LENDERS},
+    )
+
+    def __repr__(self):
+        return (
+            f"<BlockAssignments(slot={self.slot}, worker='{self.worker}', "
+            f"lease_expires_at={self.lease_expires_at})>"
+        )
+
+
 class TransactionStatusError(Base):
     __tablename__ = "tx_status_errors"
     __table_args__ = {"schema": SCHEMA_LENDERS}
@@ -506,6 +533,65 @@ class DexNormalizedLiquidity(Base):
         )
 
 
+class LiquidityHistory(Base):
+    """
+    Compact history of orderbook-like liquidity. Bids and asks are stored as zlib-compressed float32 arrays of
+    (price, size) levels. Keyframes contain the full book, other rows contain only levels that changed since the
+    previous row of the same market, where a NaN size marks a removed level. See
+    `src.protocols.dexes.liquidity_history` for encoding and reconstruction.
+    """
+    __abstract__ = True
+
+    timestamp = Column(BigInteger, nullable=False)
+    dex = Column(String, nullable=False)
+    market_address = Column(String, nullable=False)
+    is_keyframe = Column(Boolean, nullable=False)
+    bids = Column(LargeBinary, nullable=False)
+    asks = Column(LargeBinary, nullable=False)
+
+
+class CLOBLiquidityHistory(LiquidityHistory):
+    __tablename__ = "orderbook_liquidity_history"
+    __table_args__ = (
+        PrimaryKeyConstraint("dex", "pair", "market_address", "timestamp"),
+        {"schema": SCHEMA},
+    )
+
+    pair = Column(String, nullable=False)
+
+    def __repr__(self):
+        return (
+            "CLOBLiquidityHistory("
+            f"timestamp={self.timestamp},"
+            f"dex={self.dex},"
+            f"pair={self.pair},"
+            f"market_address={self.market_address},"
+            f"is_keyframe={self.is_keyframe})"
+        )
+
+
+class DexNormalizedLiquidityHistory(LiquidityHistory):
+    __tablename__ = 'dex_normalized_liquidity_history'
+    __table_args__ = (
+        PrimaryKeyConstraint("dex", "token_x_address", "token_y_address", "market_address", "timestamp"),
+        {"schema": SCHEMA},
+    )
+
+    token_x_address = Column(String, nullable=False)
+    token_y_address = Column(String, nullable=False)
+
+    def __repr__(self):
+        return (
+            "DexNormalizedLiquidityHistory("
+            f"timestamp={self.timestamp},"
+            f"dex={self.dex},"
+            f"market_address={self.market_address},"
+            f"token_x_address={self.token_x_address},"
+            f"token_y_address={self.token_y_address},"
+            f"is_keyframe={self.is_keyframe})"
+        )
+
+
 class TokenLendingSupplies(Base):
     __tablename__ = 'token_lending_supplies'
     __table_args__ = (
@@ -548,6 +634,41 @@ class Protocols(Base):
     last_block_collected = Column(Integer, nullable=True)
 
 
+class SignatureCursors(Base):
+    """
+    Progress of the collection of historical signatures of every protocol, paged from the newest to the oldest.
+    """
+    __tablename__ = 'signature_cursors'
+    __table_args__ = {'schema': SCHEMA_LENDERS}
+
+    public_key = Column(String, ForeignKey(f'{SCHEMA_LENDERS}.protocols.public_key'), primary_key=True)
+    # The oldest signature stored, the next page is fetched before it.
+    oldest_signature = Column(String, nullable=False)
+    is_completed = Column(Boolean, default=False, nullable=False)
+
+    def __repr__(self):
+        return (
+            f"<SignatureCursors(public_key='{self.public_key}', oldest_signature='{self.oldest_signature}', "
+            f"is_completed={self.is_completed})>"
+        )
+
+
+class RpcRateLimits(Base):
+    """
+    Shared state of RPC rate limiters of all collectors. Every limiter reserves its calls by moving `next_call_at` of
+    its bucket forward.
+    """
+    __tablename__ = 'rpc_rate_limits'
+    __table_args__ = {'schema': SCHEMA_LENDERS}
+
+    name = Column(String, primary_key=True)
+    # Unix time at which the bucket is empty, i.e. the theoretical arrival time of the next call.
+    next_call_at = Column(Float, nullable=False)
+
+    def __repr__(self):
+        return f"<RpcRateLimits(name='{self.name}', next_call_at={self.next_call_at})>"
+
+
 class LoanStates(Base):
     __abstract__ = True
     __tablename__ = 'loan_states'
@@ -603,6 +724,28 @@ class SolendLoanStatesEA(LoanStates):
     __tablename__ = "solend_loan_states_easy_access"
 
 
+class LoanStateHashes(Base):
+    """
+    Content hash of the latest stored loan state of every user, used to store only new and changed loan states.
+    """
+    __tablename__ = "loan_state_hashes"
+    __table_args__ = {"schema": SCHEMA_LENDERS}
+
+    protocol = Column(String, primary_key=True, nullable=False)
+    user = Column(String, primary_key=True, nullable=False)
+    slot = Column(BigInteger, nullable=False)
+    content_hash = Column(String, nullable=False)
+
+    def __repr__(self):
+        return (
+            "LoanStateHashes("
+            f"protocol={self.protocol},"
+            f"user={self.user},"
+            f"slot={self.slot},"
+            f"content_hash={self.content_hash})"
+        )
+
+
 class HealthRatio(Base):
     __abstract__ = True
     __tablename__ = "health_ratios"
@@ -787,3 +930,7 @@ if __name__ == "__main__":
     cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA};")
 
     Base.metadata.create_all(ENGINE)
+    # `create_all` skips existing tables, create indexes which were added to them later.
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(ENGINE, checkfirst=True)
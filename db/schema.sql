@@ -31,6 +31,32 @@ CREATE TABLE public.dex_normalized_liquidity (
     asks float[][] NOT NULL
 );
 
+CREATE TABLE public.orderbook_liquidity_history (
+    -- Compact history of public.orderbook_liquidity. Bids and asks are zlib-compressed
+    -- float32 arrays of (price, size) levels. Keyframes contain the full book, other rows
+    -- contain only changed levels, NaN size marks a removed level.
+    timestamp bigint NOT NULL,
+    dex character varying NOT NULL,
+    pair character varying NOT NULL,
+    market_address character varying NOT NULL,
+    is_keyframe boolean NOT NULL,
+    bids bytea NOT NULL,
+    asks bytea NOT NULL
+);
+
+CREATE TABLE public.dex_normalized_liquidity_history (
+    -- Compact history of public.dex_normalized_liquidity, same format as
+    -- public.orderbook_liquidity_history.
+    timestamp bigint NOT NULL,
+    dex character varying NOT NULL,
+    market_address character varying NOT NULL,
+    token_x_address character varying NOT NULL,
+    token_y_address character varying NOT NULL,
+    is_keyframe boolean NOT NULL,
+    bids bytea NOT NULL,
+    asks bytea NOT NULL
+);
+
 CREATE TABLE public.token_lending_supplies (
     -- When was entry obtained
     timestamp bigint NOT NULL,
@@ -112,6 +138,18 @@ ADD
     CONSTRAINT dex_normalized_liquidity_pkey 
     PRIMARY KEY (dex, token_x_address, token_y_address, market_address, timestamp);
 
+ALTER TABLE 
+    ONLY public.orderbook_liquidity_history
+ADD 
+    CONSTRAINT orderbook_liquidity_history_pkey 
+    PRIMARY KEY (dex, pair, market_address, timestamp);
+
+ALTER TABLE 
+    ONLY public.dex_normalized_liquidity_history
+ADD 
+    CONSTRAINT dex_normalized_liquidity_history_pkey 
+    PRIMARY KEY (dex, token_x_address, token_y_address, market_address, timestamp);
+
 ALTER TABLE 
     ONLY public.token_lending_supplies
 ADD 
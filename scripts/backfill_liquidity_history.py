@@ -0,0 +1,19 @@
+"""
+Script for storing compact history of liquidity collected before the history tables existed.
+"""
+
+import logging
+
+import sys
+sys.path.append(".")
+
+import db  # pylint: disable=C0413
+from src.protocols.dexes.liquidity_history import backfill_liquidity_history  # pylint: disable=C0413
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    backfill_liquidity_history(db.CLOBLiqudity)
+    backfill_liquidity_history(db.DexNormalizedLiquidity)
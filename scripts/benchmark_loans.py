@@ -0,0 +1,343 @@
+"""
+Benchmarks of loan state processing and liquidable debt computation on synthetic data at production scale.
+
+Usage: python scripts/benchmark_loans.py [benchmark] [number of users] [seed]
+
+Benchmarks:
+- marginfi, mango, kamino, solend: `process_<protocol>_loan_states` on synthetic loan states.
+- all: All of the above, which is the default.
+
+Prices, token parameters, banks and reserves are synthetic, so no RPC or external API is called. Results are not
+stored, unless `BENCHMARK_STORE` env variable is set. Then they are stored to the database given by `POSTGRES_*` env
+variables, which must be a local one as the health ratio tables are overwritten.
+"""
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+import types
+from typing import Any, Callable
+
+sys.path.append(".")
+
+import pandas  # pylint: disable=C0413
+from solders.pubkey import Pubkey  # pylint: disable=C0413
+
+LOGGER = logging.getLogger(__name__)
+
+USERS_COUNT = 1_000_000
+TOKENS_COUNT = 20
+SEED = 0
+SLOT = 250_000_000
+# Fixed-point scales used by the protocols.
+MARGINFI_SCALE = 2**48
+KAMINO_SCALE = 2**60
+WAD = 10**18
+LOCAL_HOSTS = {'localhost', '127.0.0.1', 'postgres', 'db'}
+
+
+def generate_addresses(count: int) -> list[str]:
+    return [str(Pubkey.new_unique()) for _ in range(count)]
+
+
+def generate_positions(
+    rng: random.Random,
+    tokens: list[str],
+    max_collateral_tokens: int = 3,
+    max_debt_tokens: int = 2,
+) -> tuple[dict[str, int], dict[str, int]]:
+    """
+    Generates raw collateral and debt amounts of one user. Every user has some collateral, most of them have debt worth
+    a fraction of the collateral, some of them close to being liquidable.
+    """
+    collateral = {
+        token: rng.randint(10**6, 10**12)
+        for token in rng.sample(tokens, rng.randint(1, max_collateral_tokens))
+    }
+    debt = {
+        token: int(sum(collateral.values()) / len(collateral) * rng.uniform(0.05, 0.95))
+        for token in rng.sample(tokens, rng.randint(0, max_debt_tokens))
+    }
+    return collateral, debt
+
+
+def generate_loan_states(protocol: str, users: list[str], tokens: list[str], rng: random.Random) -> pandas.DataFrame:
+    """
+    Generates loan states in the format of `<protocol>_loan_states` tables, with collateral and debt amounts by token.
+    """
+    positions = [generate_positions(rng, tokens) for _ in users]
+    return pandas.DataFrame(
+        {
+            'protocol': protocol,
+            'slot': SLOT,
+            'user': users,
+            'collateral': [collateral for collateral, _ in positions],
+            'debt': [debt for _, debt in positions],
+        }
+    )
+
+
+def generate_reserve_loan_states(
+    protocol: str,
+    users: list[str],
+    reserves: list[dict[str, str]],
+    rng: random.Random,
+) -> pandas.DataFrame:
+    """
+    Generates loan states in the format of Solend and Kamino loan states tables, with positions keyed by the mint and
+    holding the reserve. Collateral is keyed by the collateral mint and debt by the liquidity mint of the reserve.
+    """
+    reserves_by_address = {reserve['address']: reserve for reserve in reserves}
+    collateral, debt = [], []
+    for _ in users:
+        raw_collateral, raw_debt = generate_positions(rng, list(reserves_by_address))
+        collateral.append({
+            reserves_by_address[reserve]['collateral_mint']: {
+                'reserve': reserve,
+                'amount': amount,
+                'elevation_group': 0,
+            }
+            for reserve, amount in raw_collateral.items()
+        })
+        debt.append({
+            reserves_by_address[reserve]['liquidity_mint']: {'reserve': reserve, 'rawAmount': amount}
+            for reserve, amount in raw_debt.items()
+        })
+    return pandas.DataFrame(
+        {'protocol': protocol, 'slot': SLOT, 'user': users, 'collateral': collateral, 'debt': debt}
+    )
+
+
+def generate_prices(tokens: list[str], rng: random.Random) -> dict[str, float]:
+    return {token: rng.choice([0.5, 1.0, 25.0, 150.0, 3_000.0]) * rng.uniform(0.9, 1.1) for token in tokens}
+
+
+def generate_solend_reserve_configs(reserves: list[dict[str, str]], prices: dict[str, float]) -> dict[str, Any]:
+    """
+    Generates reserve configs in the format of the Solend API.
+    """
+    return {
+        reserve['address']: {
+            'cTokenExchangeRate': '1.05',
+            'reserve': {
+                'address': reserve['address'],
+                'lastUpdate': {'slot': str(SLOT)},
+                'liquidity': {
+                    'mintPubkey': reserve['liquidity_mint'],
+                    'mintDecimals': 6,
+                    'marketPrice': str(int(prices[reserve['liquidity_mint']] * WAD)),
+                    'cumulativeBorrowRateWads': str(int(1.1 * WAD)),
+                },
+                'config': {
+                    'loanToValueRatio': 75,
+                    'liquidationThreshold': 80,
+                    'liquidationBonus': 5,
+                    'borrowWeight': '1',
+                },
+            },
+        }
+        for reserve in reserves
+    }
+
+
+def generate_kamino_reserve_configs(reserves: list[dict[str, str]], prices: dict[str, float]) -> dict[str, Any]:
+    """
+    Generates reserve configs with the attributes of decoded Kamino `Reserve` accounts read by `KaminoLoanEntity`.
+    """
+    return {
+        reserve['address']: types.SimpleNamespace(
+            liquidity=types.SimpleNamespace(
+                mint_pubkey=reserve['liquidity_mint'],
+                mint_decimals=6,
+                available_amount=10**12,
+                borrowed_amount_sf=5 * 10**11 * KAMINO_SCALE,
+                accumulated_protocol_fees_sf=0,
+                accumulated_referrer_fees_sf=0,
+                pending_referrer_fees_sf=0,
+                market_price_sf=int(prices[reserve['liquidity_mint']] * KAMINO_SCALE),
+                cumulative_borrow_rate_bsf=types.SimpleNamespace(value=[int(1.1 * KAMINO_SCALE)]),
+            ),
+            collateral=types.SimpleNamespace(mint_total_supply=14 * 10**11),
+            config=types.SimpleNamespace(
+                loan_to_value_pct=75,
+                liquidation_threshold_pct=80,
+                min_liquidation_bonus_bps=500,
+                borrow_factor_pct=100,
+            ),
+        )
+        for reserve in reserves
+    }
+
+
+def generate_reserves(count: int) -> list[dict[str, str]]:
+    return [
+        {'address': address, 'liquidity_mint': liquidity_mint, 'collateral_mint': collateral_mint}
+        for address, liquidity_mint, collateral_mint in zip(
+            generate_addresses(count), generate_addresses(count), generate_addresses(count)
+        )
+    ]
+
+
+def patch_storage() -> None:
+    """
+    Replaces storing of results to the database with no-ops, unless `BENCHMARK_STORE` is set.
+    """
+    if os.getenv("BENCHMARK_STORE"):
+        if os.getenv("POSTGRES_HOST", "").split(':')[0] not in LOCAL_HOSTS:
+            raise ValueError("Results can only be stored to a local database, `POSTGRES_HOST` is not local.")
+        LOGGER.info("Results are stored to the database.")
+        return
+
+    import src.loans.liquidable_debt  # pylint: disable=C0415
+
+    def store(df: pandas.DataFrame, *args, **kwargs) -> str:  # pylint: disable=unused-argument
+        return 'not stored'
+
+    src.loans.liquidable_debt.store_liquidable_debts = store
+    src.loans.liquidable_debt.store_marginfi_health_ratios = store
+    src.loans.liquidable_debt.store_marginfi_health_ratios_for_easy_access = store
+
+
+def benchmark_marginfi(users: list[str], tokens: list[str], rng: random.Random) -> None:
+    import src.loans.liquidable_debt  # pylint: disable=C0415
+    import src.prices  # pylint: disable=C0415
+
+    mints = {token: mint for token, mint in zip(tokens, generate_addresses(len(tokens)))}
+    prices = generate_prices(list(mints.values()), rng)
+    src.prices.get_prices_for_tokens = lambda tokens: {token: prices[token] for token in tokens}
+
+    async def get_bank(client, token: str) -> types.SimpleNamespace:  # pylint: disable=unused-argument
+        return types.SimpleNamespace(
+            mint=mints[token],
+            mint_decimals=6,
+            asset_share_value=types.SimpleNamespace(value=int(1.02 * MARGINFI_SCALE)),
+            liability_share_value=types.SimpleNamespace(value=int(1.05 * MARGINFI_SCALE)),
+            asset_factor=int(0.8 * MARGINFI_SCALE),
+            liab_factor=int(1.2 * MARGINFI_SCALE),
+        )
+
+    src.loans.liquidable_debt.get_bank = get_bank
+    os.environ.setdefault("AUTHENTICATED_RPC_URL", "http://127.0.0.1:8899")
+    loan_states = generate_loan_states('marginfi', users, tokens, rng)
+    timed(
+        "process_marginfi_loan_states",
+        lambda: asyncio.run(
+            src.loans.liquidable_debt.process_marginfi_loan_states(loan_states, pandas.DataFrame())
+        ),
+        len(users),
+        'user',
+    )
+
+
+def benchmark_mango(users: list[str], tokens: list[str], rng: random.Random) -> None:
+    import src.loans.liquidable_debt  # pylint: disable=C0415
+    import src.mango_token_params_map  # pylint: disable=C0415
+    import src.prices  # pylint: disable=C0415
+    import src.protocols.dexes.amms.utils  # pylint: disable=C0415
+
+    prices = generate_prices(tokens, rng)
+    src.prices.get_prices_for_tokens = lambda tokens: {token: prices[token] for token in tokens}
+    src.mango_token_params_map.get_mango_token_params_map = lambda: {
+        token: {'maint_asset_weight': 0.9, 'maint_liab_weight': 1.1} for token in tokens
+    }
+    src.protocols.dexes.amms.utils.get_tokens_address_to_info_map = lambda: {
+        token: {'decimals': 6} for token in tokens
+    }
+    loan_states = generate_loan_states('mango', users, tokens, rng)
+    timed(
+        "process_mango_loan_states",
+        lambda: src.loans.liquidable_debt.process_mango_loan_states(loan_states),
+        len(users),
+        'user',
+    )
+
+
+def _benchmark_reserve_protocol(
+    protocol: str,
+    state_class: type,
+    generate_reserve_configs: Callable[[list[dict[str, str]], dict[str, float]], dict[str, Any]],
+    process: Callable[[pandas.DataFrame], Any],
+    users: list[str],
+    rng: random.Random,
+) -> None:
+    reserves = generate_reserves(TOKENS_COUNT)
+    prices = generate_prices([reserve['liquidity_mint'] for reserve in reserves], rng)
+    reserve_configs = generate_reserve_configs(reserves, prices)
+
+    def get_reserve_configs(self) -> None:
+        self.reserve_configs = reserve_configs
+        self.token_prices = prices
+
+    state_class._get_reserve_configs = get_reserve_configs
+    loan_states = generate_reserve_loan_states(protocol, users, reserves, rng)
+    timed(f"process_{protocol}_loan_states", lambda: process(loan_states), len(users), 'user')
+
+
+def benchmark_kamino(users: list[str], tokens: list[str], rng: random.Random) -> None:  # pylint: disable=W0613
+    import src.loans.kamino  # pylint: disable=C0415
+    import src.loans.liquidable_debt  # pylint: disable=C0415
+
+    _benchmark_reserve_protocol(
+        protocol='kamino',
+        state_class=src.loans.kamino.KaminoState,
+        generate_reserve_configs=generate_kamino_reserve_configs,
+        process=src.loans.liquidable_debt.process_kamino_loan_states,
+        users=users,
+        rng=rng,
+    )
+
+
+def benchmark_solend(users: list[str], tokens: list[str], rng: random.Random) -> None:  # pylint: disable=W0613
+    import src.loans.liquidable_debt  # pylint: disable=C0415
+    import src.loans.solend  # pylint: disable=C0415
+
+    _benchmark_reserve_protocol(
+        protocol='solend',
+        state_class=src.loans.solend.SolendState,
+        generate_reserve_configs=generate_solend_reserve_configs,
+        process=src.loans.liquidable_debt.process_solend_loan_states,
+        users=users,
+        rng=rng,
+    )
+
+
+def timed(name: str, function: Callable[[], Any], count: int, unit: str) -> float:
+    start_time = time.perf_counter()
+    function()
+    elapsed_time = time.perf_counter() - start_time
+    LOGGER.info(f"{name}: {elapsed_time:.2f}s for {count} {unit}s, {elapsed_time / count * 1e6:.2f}us per {unit}.")
+    return elapsed_time
+
+
+BENCHMARKS: dict[str, Callable[[list[str], list[str], random.Random], None]] = {
+    'marginfi': benchmark_marginfi,
+    'mango': benchmark_mango,
+    'kamino': benchmark_kamino,
+    'solend': benchmark_solend,
+}
+
+
+def run_benchmarks(benchmark: str = 'all', users_count: int = USERS_COUNT, seed: int = SEED) -> None:
+    if benchmark != 'all' and benchmark not in BENCHMARKS:
+        raise ValueError(f"{benchmark} is not a valid benchmark, choose from {['all', *BENCHMARKS]}.")
+    rng = random.Random(seed)
+    start_time = time.perf_counter()
+    users = generate_addresses(users_count)
+    tokens = generate_addresses(TOKENS_COUNT)
+    LOGGER.info(f"Generated {users_count} users and {TOKENS_COUNT} tokens in {time.perf_counter() - start_time:.2f}s.")
+    patch_storage()
+    for name, run_benchmark in BENCHMARKS.items():
+        if benchmark in {'all', name}:
+            run_benchmark(users, tokens, rng)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    run_benchmarks(
+        benchmark=sys.argv[1] if len(sys.argv) > 1 else 'all',
+        users_count=int(sys.argv[2]) if len(sys.argv) > 2 else USERS_COUNT,
+        seed=int(sys.argv[3]) if len(sys.argv) > 3 else SEED,
+    )
@@ -0,0 +1,94 @@
+"""
+Micro-benchmark of Solend instruction decoding on transactions recorded in the database.
+
+Usage: python scripts/benchmark_solend_parser.py [number of transactions] [number of repeats]
+"""
+import logging
+import sys
+import timeit
+
+sys.path.append(".")
+
+from solders.transaction_status import EncodedTransactionWithStatusMeta, UiPartiallyDecodedInstruction
+
+from db import TransactionStatusWithSignature, get_db_session
+from src.parser.solend_parser import SolendTransactionParser, unpack_data
+from src.protocols.addresses import SOLEND_ADDRESS
+
+LOGGER = logging.getLogger(__name__)
+
+TRANSACTIONS_COUNT = 10_000
+REPEATS = 5
+
+
+def fetch_recorded_transactions(count: int) -> list[EncodedTransactionWithStatusMeta]:
+    """
+    Fetches the latest recorded Solend transactions with their data.
+    """
+    with get_db_session() as session:
+        rows = session.query(
+            TransactionStatusWithSignature.transaction_data
+        ).filter(
+            TransactionStatusWithSignature.source == SOLEND_ADDRESS
+        ).filter(
+            TransactionStatusWithSignature.transaction_data.isnot(None)
+        ).order_by(
+            TransactionStatusWithSignature.slot.desc()
+        ).limit(count).all()
+    return [EncodedTransactionWithStatusMeta.from_json(row.transaction_data) for row in rows]
+
+
+def get_instruction_data(
+    transactions: list[EncodedTransactionWithStatusMeta],
+    parser: SolendTransactionParser,
+) -> list[str]:
+    """
+    Collects data of all Solend instructions, including inner instructions, of the transactions.
+    """
+    instruction_data = []
+    for transaction in transactions:
+        instructions = list(transaction.transaction.message.instructions)
+        if transaction.meta and transaction.meta.inner_instructions:
+            for inner_instructions in transaction.meta.inner_instructions:
+                instructions.extend(inner_instructions.instructions)
+        instruction_data.extend(
+            instruction.data
+            for instruction in instructions
+            if isinstance(instruction, UiPartiallyDecodedInstruction) and instruction.program_id == parser.program_id
+        )
+    return instruction_data
+
+
+def run_benchmark(transactions_count: int = TRANSACTIONS_COUNT, repeats: int = REPEATS):
+    parser = SolendTransactionParser()
+    # Measure the decoding only, the events are thrown away.
+    parser._processor = lambda event: None  # pylint: disable=protected-access
+
+    transactions = fetch_recorded_transactions(transactions_count)
+    instruction_data = get_instruction_data(transactions, parser)
+    LOGGER.info(f"Loaded {len(transactions)} transactions with {len(instruction_data)} Solend instructions.")
+    if not instruction_data:
+        return
+
+    def unpack_all():
+        for data in instruction_data:
+            unpack_data(data)
+
+    def parse_all():
+        for transaction in transactions:
+            parser.parse_transaction(transaction)
+
+    unpack_time = min(timeit.repeat(unpack_all, number=1, repeat=repeats))
+    LOGGER.info(
+        f"unpack_data: {unpack_time:.3f}s, {unpack_time / len(instruction_data) * 1e6:.2f}us per instruction."
+    )
+    parse_time = min(timeit.repeat(parse_all, number=1, repeat=repeats))
+    LOGGER.info(
+        f"parse_transaction: {parse_time:.3f}s, {parse_time / len(transactions) * 1e6:.2f}us per transaction."
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    run_benchmark(*(int(arg) for arg in sys.argv[1:3]))
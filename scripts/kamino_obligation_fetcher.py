@@ -8,13 +8,12 @@ import os
 import sys
 import time
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 # Related third-party imports
-import pandas as pd
 from solana.exceptions import SolanaRpcException
 from solana.rpc.async_api import AsyncClient
-from solana.rpc.types import MemcmpOpts
+from solana.rpc.types import DataSliceOpts, MemcmpOpts
 from solders.pubkey import Pubkey
 from solders.rpc.responses import RpcKeyedAccount
 
@@ -24,6 +23,7 @@ sys.path.append('.')
 import db
 from src.loans.kamino import KaminoState
 from src.loans.loan_state import store_loan_states, store_loan_states_for_easy_access
+from src.loans.obligations import KAMINO_OBLIGATION_SLICE, ObligationColumns, decode_obligations
 from src.parser import TransactionDecoder
 from src.protocols.addresses import KAMINO_ADDRESS
 from src.protocols.anchor_clients.kamino_client.accounts.obligation import Obligation
@@ -44,12 +44,18 @@ ALTCOIN_MARKET = 'ByYiZxp8QrdN9qbdtaAiePN8AAr3qvTPppNJDpf5DVJ5'
 
 
 
-async def fetch_accounts(pool_pubkey: str, client: AsyncClient, filters: List[Any]) -> List[RpcKeyedAccount]:
-    """ Fetch Solend obligations for pool. """
+async def fetch_accounts(
+    pool_pubkey: str,
+    client: AsyncClient,
+    filters: List[Any],
+    data_slice: Optional[DataSliceOpts] = None,
+) -> List[RpcKeyedAccount]:
+    """ Fetch Kamino accounts for pool, optionally only the given slice of their data. """
     try:
         response = await client.get_program_accounts(
             KAMINO_PROGRAM_ID,
             encoding='base64',
+            data_slice=data_slice,
             filters=filters
         )
 
@@ -58,7 +64,7 @@ async def fetch_accounts(pool_pubkey: str, client: AsyncClient, filters: List[An
     except SolanaRpcException as e:
         LOGGER.error(f"SolanaRpcException: {e} while collecting obligations for `{pool_pubkey}`.")
         time.sleep(0.5)
-        return await fetch_accounts(pool_pubkey, client, filters)
+        return await fetch_accounts(pool_pubkey, client, filters, data_slice)
 
 
 async def get_slot_number(client: AsyncClient) -> int:
@@ -108,97 +114,33 @@ async def get_reserve_to_supply_map(decoder: TransactionDecoder, client: AsyncCl
     }
 
 
-def process_collateral(obligation: Any, reserve_to_supply_map: Dict[str, Any]):
-    """
-    Format collateral data:
-     - replace reserve with corresponding supply
-    """
-    collateral_raw = obligation.deposits
-    collateral = {}
-    for position in collateral_raw:
-        amount = position.deposited_amount
-        if amount == 0:
-            continue
-        reserve = str(position.deposit_reserve)
-        collateral_mint = reserve_to_supply_map[reserve]['collateralMint']
-        collateral[str(collateral_mint)] = {
-            'amount': amount,
-            'reserve': reserve,
-            'elevation_group': obligation.elevation_group,
-        }
-    return collateral
-
-
-def process_debt(obligation: Any, reserve_to_supply_map: Dict[str, Any]):
-    """
-    Format debt data:
-    - replace reserve with corresponding supply
-    - calculate borrowed amount by accounting for interest.
-    """
-    debt_raw = obligation.borrows
-    debt = {}
-    for position in debt_raw:
-        borrowed_amount = position.borrowed_amount_sf
-        if borrowed_amount == 0:
-            continue
-        reserve = str(position.borrow_reserve)
-        liquidity_mint = reserve_to_supply_map[reserve]['liquidityMint']
-        cumulative_borrow_rate = position.cumulative_borrow_rate_bsf.value[0]
-
-        debt[str(liquidity_mint)] = {
-            'rawAmount': borrowed_amount / cumulative_borrow_rate,
-            'reserve': reserve
-        }
-
-    return debt
-
-
 async def obtain_loan_states():
     """ Obtain Solend loan states. """
     LOGGER.info("Start loan states collection.")
     # get current slot number
     client = AsyncClient(AUTHENTICATED_RPC_URL)
     slot = await get_slot_number(client)
-    # get and decode main pool obligations
-    obligations = await fetch_accounts(
-        str(LENDING_MARKET_MAIN), client, filters = [
-            Obligation.layout.sizeof() + 8,
-            MemcmpOpts(32, str(LENDING_MARKET_MAIN)),
-        ]
-    )
-
-    LOGGER.info("Loan states for KAMINO MAIN pool successfully collected.")
-    # get and decode obligations for isolated pools
-    for market_address in [JLP_MARKET, ALTCOIN_MARKET]:
+    # Fetch obligations market by market, decoding only the sliced positions. Each response is released as soon as
+    # it's decoded into the columns.
+    columns = ObligationColumns()
+    for market_address in [LENDING_MARKET_MAIN, JLP_MARKET, ALTCOIN_MARKET]:
         filters = [
             Obligation.layout.sizeof() + 8,
             MemcmpOpts(32, market_address),
         ]
-        response = await fetch_accounts(market_address, client=client, filters=filters)
-        obligations.extend(response)
-    LOGGER.info("Loan states for KAMINO ALTCOIN and JLP pools successfully collected.")
+        response = await fetch_accounts(
+            market_address, client=client, filters=filters, data_slice=KAMINO_OBLIGATION_SLICE,
+        )
+        decode_obligations(columns, response, 'kamino')
+        LOGGER.info(f"Loan states for KAMINO `{market_address}` pool successfully collected and decoded.")
     # Create Kamino program decoder
     decoder = TransactionDecoder(path_to_idl=Path(KAMINO_IDL_PATH), program_id=Pubkey.from_string(KAMINO_ADDRESS))
-    decoded_obligations = {}
-    # decode obligations
-    for obligation in obligations:
-        decoded_obligations[str(obligation.pubkey)] = decoder.program.coder.accounts.decode(obligation.account.data)
-    LOGGER.info("All obligations are successfully decoded.")
     # decode reserves and create reserve_to_supply_map
     reserve_to_supply_map = await get_reserve_to_supply_map(decoder, client)
 
     # Format decoded obligation data
-    obligations_processed = []
-    for user, obligation in decoded_obligations.items():
-        processed_obligation = {
-            'slot': slot,
-            'protocol': 'kamino',
-            'user': user,
-            'collateral': process_collateral(obligation, reserve_to_supply_map),
-            'debt': process_debt(obligation, reserve_to_supply_map)
-        }
-        obligations_processed.append(processed_obligation)
-    new_loan_states = pd.DataFrame(obligations_processed)
+    new_loan_states = columns.to_loan_states(slot, 'kamino', reserve_to_supply_map, with_elevation_group=True)
+    del columns
     # store loan states to database
     easy_access_table_name = store_loan_states_for_easy_access(new_loan_states, 'kamino')
     logging.info(f"New loan states are available in {easy_access_table_name}")
@@ -0,0 +1,12 @@
+import logging
+import sys
+
+sys.path.append(".")
+
+import src.visualizations.precompute
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    src.visualizations.precompute.precompute_dashboard_data_continuously()
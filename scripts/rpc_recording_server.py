@@ -0,0 +1,33 @@
+"""
+Local JSON-RPC server recording responses of the RPC or replaying them, to benchmark collectors offline.
+
+Usage: python scripts/rpc_recording_server.py record|replay [recording path]
+
+Point `RPC_URL` of the collectors to `http://127.0.0.1:<RECORDING_PORT>`. The upstream RPC is taken from
+`UPSTREAM_RPC_URL` env variable in the `record` mode. Replayed responses are delayed by `REPLAY_LATENCY` seconds.
+"""
+import logging
+import os
+import sys
+
+sys.path.append(".")
+
+from src.collection.shared.rpc_recording import serve  # pylint: disable=C0413
+
+RECORDING_PATH = 'rpc_recording.jsonl'
+RECORDING_PORT = 8899
+REPLAY_LATENCY = 0.05
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if len(sys.argv) < 2:
+        raise ValueError("Usage: python scripts/rpc_recording_server.py record|replay [recording path]")
+    serve(
+        mode=sys.argv[1],
+        path=sys.argv[2] if len(sys.argv) > 2 else RECORDING_PATH,
+        port=int(os.getenv("RECORDING_PORT", RECORDING_PORT)),
+        upstream_url=os.getenv("UPSTREAM_RPC_URL"),
+        latency=float(os.getenv("REPLAY_LATENCY", REPLAY_LATENCY)),
+    )
@@ -13,6 +13,7 @@ import src.prices
 import src.visualizations.protocol_stats
 import src.protocols
 import src.visualizations.main_chart
+import src.visualizations.precompute
 import src.visualizations.settings
 from src.prices import get_prices_for_tokens
 from src.protocols.dexes.amms.utils import get_tokens_address_to_info_map
@@ -27,17 +28,20 @@ def main():
     st.title("DeRisk Solana")
     logging.info('Start loading the Dashboard')
 
-    tokens_available = src.visualizations.protocol_stats.get_unique_token_supply_mints()
-    if not tokens_available:
-        tokens_available = [
-            "So11111111111111111111111111111111111111112", # SOL
-            "EPjFWdd5AufqSSqeM2qN1xzybapC8G4wEGGkZwyTDt1v", # USDC
-        ]
-        # TODO: handle better
+    # Prefer data precomputed by `scripts/precompute_dashboard_data.py`, compute it here only when it's unavailable.
+    tokens_info = src.visualizations.precompute.load_tokens_info()
+    tokens_prices = src.visualizations.precompute.load_prices()
+    tokens_with_tvl = src.visualizations.precompute.load_tokens_with_tvl()
 
-    tokens_info = get_tokens_address_to_info_map()
-    tokens_prices = get_prices_for_tokens(tokens_available)
-    tokens_with_tvl = src.visualizations.protocol_stats.get_lending_tokens_with_tvl(tokens_prices, tokens_info)
+    if tokens_info is None or tokens_prices is None or tokens_with_tvl is None:
+        tokens_available = src.visualizations.protocol_stats.get_unique_token_supply_mints()
+        if not tokens_available:
+            tokens_available = src.visualizations.precompute.DEFAULT_TOKENS
+            # TODO: handle better
+
+        tokens_info = get_tokens_address_to_info_map()
+        tokens_prices = get_prices_for_tokens(tokens_available)
+        tokens_with_tvl = src.visualizations.protocol_stats.get_lending_tokens_with_tvl(tokens_prices, tokens_info)
 
     tokens_to_offer = [i[0] for i in tokens_with_tvl]
 
@@ -77,11 +81,20 @@ def main():
     )
 
     # # Load relevant data and plot the liquidable debt against the available supply.
-    main_chart_data = src.visualizations.main_chart.get_main_chart_data(
+    main_chart_data = src.visualizations.precompute.load_main_chart_data(
         protocols=protocols,
-        token_selection=selected_tokens,  # type: ignore
-        prices=tokens_prices,
+        token_pair=selected_tokens,
     )
+    if main_chart_data is None:
+        main_chart_data = src.visualizations.main_chart.get_main_chart_data(
+            protocols=protocols,
+            token_selection=selected_tokens,  # type: ignore
+            prices=tokens_prices,
+        )
+    elif main_chart_data.empty:
+        # Precomputed, but there is no liquidity or liquidable debt for the pair.
+        main_chart_data = None
+
     if main_chart_data is None:
         st.plotly_chart(px.bar(), use_container_width=True)
         st.subheader(':exclamation: No liquidable debt found for the selected pair.')
@@ -194,7 +207,9 @@ def main():
                 st.plotly_chart(figure, True)
 
     st.header("Loans with the lowest health factor")
-    _user_health_ratios_df = src.visualizations.loans_table.load_user_health_ratios(protocols)
+    _user_health_ratios_df = src.visualizations.precompute.load_user_health_ratios(protocols)
+    if _user_health_ratios_df is None:
+        _user_health_ratios_df = src.visualizations.loans_table.load_user_health_ratios(protocols)
 
     try:
         # There isn't enough time to test this righ now
@@ -4,7 +4,7 @@ lending protocols.
 Collection logic:
     t_O - watershed block, block that we assign as divider of historical and current data.
     Takes `t_0` from db.
-    PPK (protocol public key) is collected from environmental variable.
+    PPKs (protocol public keys) are collected from environmental variable, each of them is collected concurrently.
     Collects all historical data as follows:
     1) starts from any transaction (`tx_0`) from block `t_0`.
     2) Collects 1000 tx signatures starting with `tx_0`.
@@ -17,22 +17,27 @@ Collection logic:
     5) repeat 3-4 until reaching the first transaction.
     6) As first (earliest) transaction is reached - consider historical data (signatures only) for given PPK
     at time t_0 collected.
-    If being restarted - fetch block number from last tx signature for given PPK and flag `signature`.
-    Use this block instead of `t_0`
+    The oldest stored signature of each PPK is kept in `signature_cursors` table, updated together with the signatures.
+    If being restarted - continue from the cursor of given PPK, or from the last tx signature for given PPK and flag
+    `signature` if there is no cursor. Use this signature instead of `t_0`
 """
+import asyncio
 import logging
 import os
 import time
-import traceback
-from typing import List
+from typing import List, Tuple
 
+import sqlalchemy
+import sqlalchemy.dialects.postgresql
+from solders.pubkey import Pubkey
 from solders.rpc.responses import RpcConfirmedTransactionStatusWithSignature
 from solders.signature import Signature
 from solders.transaction_status import TransactionErrorFieldless
 from solana.exceptions import SolanaRpcException
-import solana.rpc.api
+from solana.rpc.async_api import AsyncClient
 
-from src.collection.shared.generic_collector import GenericSolanaConnector, log_performance_time
+from src.collection.shared.generic_collector import SolanaConnector
+from src.metrics import REGISTRY, ROWS_WRITTEN, measure_time
 import db
 
 
@@ -41,169 +46,217 @@ LOGGER = logging.getLogger(__name__)
 TX_BATCH_SIZE = 1000
 
 
-class SignatureCollector(GenericSolanaConnector):
-    def __init__(self):
+def get_protocol_public_keys() -> List[str]:
+    """
+    Get public keys of protocols to collect from `PROTOCOL_PUBLIC_KEYS` env variable, comma separated, or from
+    `PROTOCOL_PUBLIC_KEY` env variable.
+    """
+    keys_env = os.getenv("PROTOCOL_PUBLIC_KEYS") or os.getenv("PROTOCOL_PUBLIC_KEY", "")
+    return [key for key in keys_env.split(',') if key]
+
+
+class SignatureCollector(SolanaConnector):
+    """
+    Collects signature history of all protocols concurrently. Every protocol is paged independently from its
+    persisted cursor, while the rate limit of RPC calls is shared.
+    """
+
+    def __init__(self, protocols: List[str] | None = None):
         super().__init__()
-        self.protocol = os.getenv("PROTOCOL_PUBLIC_KEY", "")
-        self._oldest_signature: Signature | None = None  # The oldest signature from the oldest completed block
-        self._signatures_completed: bool = False
-        self._oldest_completed_slot: int = -1
-        self._collected_signatures: List[RpcConfirmedTransactionStatusWithSignature] = []
+        self.protocols = protocols if protocols is not None else get_protocol_public_keys()
+        self.async_solana_client = AsyncClient(self.authenticated_rpc_url)
 
-    @property
-    def _collection_completed(self) -> bool:
+    def run(self):
         """
-        Flag to mark completion of collection.
+        Collect signatures of all protocols, see `async_run`.
         """
-        return self._signatures_completed
+        asyncio.run(self.async_run())
 
-    @log_performance_time(LOGGER)
-    def _get_assignment(self) -> None:
+    async def async_run(self):
         """
-        Obtain assignment for data collection.
+        Collect signatures of all protocols concurrently until the first transaction of each protocol is reached.
         """
-        # if oldest obtained signature is defined, proceed to collection
-        if self._oldest_signature:
-            return
-        # otherwise, get retrieve oldest signature from database.
-        with db.get_db_session() as session:
-            LOGGER.info("Getting the oldest stored signature for protocol = {}.".format(self.protocol))
-            # Get the last signature collector recorded by `SignatureCollector` for given protocol
-            oldest_signature = session.query(db.TransactionStatusWithSignature.signature) \
-                .filter(db.TransactionStatusWithSignature.source == self.protocol) \
-                .filter(db.TransactionStatusWithSignature.collection_stream == db.CollectionStreamTypes.SIGNATURE) \
-                .order_by(db.TransactionStatusWithSignature.id.desc()) \
-                .first()
-            # If no signatures collected yet, get signature from watershed block
-            if not oldest_signature:
-                LOGGER.warning(
-                    "No signatures found for protocol = {}.".format(self.protocol)
-                )
-                self._get_watershed_block_signature()
-                return
-
-            oldest_signature = oldest_signature.signature
-            LOGGER.info("The oldest stored signature = {} for protocol = {}.".format(oldest_signature, self.protocol))
-            self._oldest_signature = Signature.from_string(str(oldest_signature))
+        await asyncio.gather(*(self._collect_protocol_signatures(protocol) for protocol in self.protocols))
+        LOGGER.info(f"Collection completed for {self.__class__.__name__}.")
 
-    @log_performance_time(LOGGER)
-    def _get_data(self) -> None:
+    async def _collect_protocol_signatures(self, protocol: str) -> None:
         """
-        Collect signatures with metadata through Solana API.
+        Page signatures of the protocol from the newest to the oldest, storing every page with the cursor.
         """
-        try:
-            self._fetch_signatures()
-        # catch any possible API's hallucinations, try once again
-        except Exception as e:  # pylint: disable=broad-exception-caught
-            tb_str = traceback.format_exc()
-            # Log the error message along with the traceback
-            LOGGER.error(f"While fetching signatures for protocol = `{self.protocol}`"
-                         f" before the signature = `{self._oldest_signature}`"
-                         f" error occurred: {e}\nTraceback:\n{tb_str}")
-            self._fetch_signatures()
+        oldest_signature, is_completed = await asyncio.to_thread(self._get_cursor, protocol)
+        while not is_completed:
+            signatures = await self._async_fetch_signatures(protocol, oldest_signature)
+            is_completed = len(signatures) < TX_BATCH_SIZE
+            signatures = self._select_signatures_from_completed_slots(protocol, signatures, is_completed)
+            if signatures:
+                oldest_signature = signatures[-1].signature
+            await asyncio.to_thread(self._write_signatures, protocol, signatures, oldest_signature, is_completed)
+            LOGGER.info(f"Stored {len(signatures)} signatures for `{protocol}`, the oldest = `{oldest_signature}`.")
+        LOGGER.info(f"All signatures for protocol = `{protocol}` are collected.")
 
-        LOGGER.info(f"Collected {len(self._collected_signatures)} signatures for `{self.protocol}")
-
-    @log_performance_time(LOGGER)
-    def _write_data(self) -> None:
+    def _get_cursor(self, protocol: str) -> Tuple[Signature, bool]:
         """
-        Write signatures and tx meta data to database.
+        Get the oldest collected signature for the protocol and whether the collection is completed. Without a stored
+        cursor, start with the oldest signature stored by the signature collection stream, or with a signature from
+        the watershed block.
         """
         with db.get_db_session() as session:
-            if not self._collected_signatures:
-                return
-            for signature in self._collected_signatures:
-                # store only transactions from slot with complete transaction history fetched.
-                if signature.slot < self._oldest_completed_slot:
-                    break
-
-                tx_status_record = db.TransactionStatusWithSignature(
-                    signature=str(signature.signature),
-                    source=self.protocol,
-                    slot=signature.slot,
-                    block_time=signature.block_time,
-                    collection_stream=db.CollectionStreamTypes.SIGNATURE
-                )
-                session.add(tx_status_record)
-                session.flush()  # Flush here to get the ID
-                # store errors and/or memos to db if any
-                if signature.err:
-                    error = signature.err.to_json() if not isinstance(signature.err, TransactionErrorFieldless) else ""
-                    tx_error_record = db.TransactionStatusError(
-                        error_body=error,
-                        tx_signatures_id=tx_status_record.id,
-                    )
-                    session.add(tx_error_record)
-                if signature.memo:
-                    tx_memo_record = db.TransactionStatusMemo(
-                        memo_body=signature.memo,
-                        tx_signatures_id=tx_status_record.id,
-                    )
-                    session.add(tx_memo_record)
-
-                self._oldest_signature = signature.signature
-            session.commit()
-        LOGGER.info("Signatures successfully stored to database.")
+            cursor = session.query(db.SignatureCursors).filter_by(public_key=protocol).first()
+            if cursor:
+                LOGGER.info(f"Cursor for protocol = `{protocol}`: {cursor}.")
+                return Signature.from_string(cursor.oldest_signature), cursor.is_completed
+
+            LOGGER.info("Getting the oldest stored signature for protocol = {}.".format(protocol))
+            # Get the last signature collector recorded by `SignatureCollector` for given protocol
+            oldest_signature = session.query(db.TransactionStatusWithSignature.signature) \
+                .filter(db.TransactionStatusWithSignature.source == protocol) \
+                .filter(db.TransactionStatusWithSignature.collection_stream == db.CollectionStreamTypes.SIGNATURE) \
+                .order_by(db.TransactionStatusWithSignature.id.desc()) \
+                .first()
+        # If no signatures collected yet, get signature from watershed block
+        if not oldest_signature:
+            LOGGER.warning("No signatures found for protocol = {}.".format(protocol))
+            return self._get_watershed_block_signature(protocol), False
+
+        LOGGER.info("The oldest stored signature = {} for protocol = {}.".format(oldest_signature.signature, protocol))
+        return Signature.from_string(str(oldest_signature.signature)), False
 
-    def _fetch_signatures(self) -> None:
+    @measure_time('signature_fetch')
+    async def _async_fetch_signatures(
+            self,
+            protocol: str,
+            before: Signature,
+    ) -> List[RpcConfirmedTransactionStatusWithSignature]:
         """
-        Fetch transaction signatures.
-        Fetch only signatures that occurs before `self._oldest_signature` for the given protocol.
+        Fetch a page of transaction signatures that occur before `before` for the given protocol.
         """
-        self._rate_limit_calls()
-
+        await self._async_rate_limit_calls()
         try:
-            response = self.solana_client.get_signatures_for_address(
-                solana.rpc.api.Pubkey.from_string(self.protocol),
+            response = await self.async_solana_client.get_signatures_for_address(
+                Pubkey.from_string(protocol),
                 limit=TX_BATCH_SIZE,
-                before=self._oldest_signature,
+                before=before,
             )
-            signatures = response.value
         except SolanaRpcException as e:
-            LOGGER.error(f"SolanaRpcException: {e}")
-            time.sleep(0.5)
-            self._fetch_signatures()
-            return
-
-        if len(signatures) < TX_BATCH_SIZE:
-            self._signatures_completed = True
+            LOGGER.error(f"SolanaRpcException while fetching signatures for `{protocol}` before `{before}`: {e}")
+            await self.rate_limiter.async_back_off(0.5)
+            return await self._async_fetch_signatures(protocol, before)
+        return response.value
 
+    @staticmethod
+    def _select_signatures_from_completed_slots(
+            protocol: str,
+            signatures: List[RpcConfirmedTransactionStatusWithSignature],
+            is_completed: bool,
+    ) -> List[RpcConfirmedTransactionStatusWithSignature]:
+        """
+        Select signatures from slots whose signatures were all fetched. The oldest slot of a page can continue on the
+        next page, unless the page is the last one.
+        """
+        if is_completed or not signatures:
+            return signatures
         # Get the oldest block for which it is certain that we fetched all signatures.
-        unique_slots = sorted(list({i.slot for i in signatures}))
+        unique_slots = sorted({i.slot for i in signatures})
         if len(unique_slots) < 2:  # TODO: take care of blocks hat contain more than 1000 transactions for one protocol  # pylint: disable=W0511
             LOGGER.warning(
                 "Last batch for protocol = {} contains only signatures from a single slot = {}.".format(
-                    self.protocol,
+                    protocol,
                     unique_slots[0],
                 )
             )
-            self._oldest_completed_slot = unique_slots[0]
-        else:
-            second_oldest_slot = unique_slots[1]
-            self._oldest_completed_slot = second_oldest_slot
+            return signatures
+        # Signatures are ordered from the newest to the oldest.
+        oldest_completed_slot = unique_slots[1]
+        return [signature for signature in signatures if signature.slot >= oldest_completed_slot]
 
-        self._collected_signatures = signatures
+    @staticmethod
+    @measure_time('signature_write')
+    def _write_signatures(
+            protocol: str,
+            signatures: List[RpcConfirmedTransactionStatusWithSignature],
+            oldest_signature: Signature,
+            is_completed: bool,
+    ) -> None:
+        """
+        Write signatures with their errors and memos to database and update the cursor of the protocol, all in one
+        transaction. Signatures are inserted with one statement returning their IDs, which are then used to insert
+        errors and memos.
+        """
+        with db.get_db_session() as session:
+            if signatures:
+                ids = session.execute(
+                    sqlalchemy.insert(db.TransactionStatusWithSignature).returning(
+                        db.TransactionStatusWithSignature.id,
+                        sort_by_parameter_order=True,
+                    ),
+                    [
+                        {
+                            'signature': str(signature.signature),
+                            'source': protocol,
+                            'slot': signature.slot,
+                            'block_time': signature.block_time,
+                            'collection_stream': db.CollectionStreamTypes.SIGNATURE,
+                        }
+                        for signature in signatures
+                    ],
+                ).scalars().all()
+                # store errors and/or memos to db if any
+                errors = [
+                    {
+                        'error_body': (
+                            signature.err.to_json() if not isinstance(signature.err, TransactionErrorFieldless) else ""
+                        ),
+                        'tx_signatures_id': tx_signatures_id,
+                    }
+                    for tx_signatures_id, signature in zip(ids, signatures)
+                    if signature.err
+                ]
+                if errors:
+                    session.execute(sqlalchemy.insert(db.TransactionStatusError), errors)
+                memos = [
+                    {'memo_body': signature.memo, 'tx_signatures_id': tx_signatures_id}
+                    for tx_signatures_id, signature in zip(ids, signatures)
+                    if signature.memo
+                ]
+                if memos:
+                    session.execute(sqlalchemy.insert(db.TransactionStatusMemo), memos)
+
+            insert_stmt = sqlalchemy.dialects.postgresql.insert(db.SignatureCursors).values(
+                public_key=protocol,
+                oldest_signature=str(oldest_signature),
+                is_completed=is_completed,
+            )
+            session.execute(
+                insert_stmt.on_conflict_do_update(
+                    index_elements=[db.SignatureCursors.public_key],
+                    set_={
+                        'oldest_signature': insert_stmt.excluded.oldest_signature,
+                        'is_completed': insert_stmt.excluded.is_completed,
+                    },
+                )
+            )
+            session.commit()
+        REGISTRY.inc(ROWS_WRITTEN, len(signatures), table=db.TransactionStatusWithSignature.__tablename__)
 
-    def _get_watershed_block_signature(self) -> None:
+    def _get_watershed_block_signature(self, protocol: str) -> Signature:
         """
         Get signature from watershed block.
         """
         with db.get_db_session() as session:
             # Query the database for protocols with the given public keys
             watershed_block_record = session.query(db.Protocols.watershed_block).\
-                filter(db.Protocols.public_key == self.protocol).first()
-            if watershed_block_record:
-                watershed_block_number = watershed_block_record[0]
-            else:
-                LOGGER.warning(f"Protocol = `{self.protocol}` is not in the `protocols` table. "
-                               f"Failing to collect watershed block number.")
-                time.sleep(10)
-                self._get_watershed_block_signature()
-                return
+                filter(db.Protocols.public_key == protocol).first()
+        if not watershed_block_record:
+            LOGGER.warning(f"Protocol = `{protocol}` is not in the `protocols` table. "
+                           f"Failing to collect watershed block number.")
+            time.sleep(10)
+            return self._get_watershed_block_signature(protocol)
+        watershed_block_number = watershed_block_record[0]
 
         watershed_block, _ = self._fetch_block(watershed_block_number)
         watershed_block_transactions = watershed_block.transactions
-        self._oldest_signature = watershed_block_transactions[0].transaction.signatures[0]  # type: ignore
+        signature = watershed_block_transactions[0].transaction.signatures[0]  # type: ignore
         LOGGER.info("Signature = {} collected from watershed block = `{}` for protocol = {}.".format(
-            self._oldest_signature, watershed_block_number, self.protocol)
+            signature, watershed_block_number, protocol)
         )
+        return signature
@@ -2,7 +2,6 @@
 Generic class for data collection from Solana chain
 """
 from abc import ABC, abstractmethod
-from collections import deque
 from dataclasses import dataclass
 from typing import List, Tuple
 import logging
@@ -14,31 +13,10 @@ from solana.exceptions import SolanaRpcException
 from solders.signature import Signature
 from solders.transaction_status import EncodedTransactionWithStatusMeta, UiConfirmedBlock
 
-LOGGER = logging.getLogger(__name__)
-
-
-def log_performance_time(logger = LOGGER):
-    """
-    Decorator for logging performance time of subjected function.
-    """
-    def decorator(func):
-        def wrapper(*args, **kwargs):
-            start_time = time.perf_counter()
-            log_message = f"START: function '{func.__name__}'."
-            # Log the start of the function
-            logger.info(log_message)
-
-            # Call the actual function
-            result = func(*args, **kwargs)
-
-            # Calculate elapsed time and log the end of the function
-            elapsed_time = time.perf_counter() - start_time
-            logger.info(f"DONE: function '{func.__name__}' in {elapsed_time:.2f} seconds")
-
-            return result
+from src.collection.shared.rate_limiter import RateLimiter
+from src.metrics import log_performance_time  # pylint: disable=unused-import
 
-        return wrapper
-    return decorator
+LOGGER = logging.getLogger(__name__)
 
 
 @dataclass
@@ -67,23 +45,18 @@ class SolanaTransaction:
         return self.tx_body.transaction.signatures[0]
 
 
-class GenericSolanaConnector(ABC):
+class SolanaConnector:
     """
-    Abstract class with methods, that every Solana connector should implement.
+    Base class of Solana connectors, holding the RPC client and the rate limiter shared with other collectors.
     """
 
     def __init__(self):
         self._get_rpc_url()
         self.solana_client: solana.rpc.api.Client = solana.rpc.api.Client(self.authenticated_rpc_url)
 
-        self.assignment: List[int] = list()
-
-        # attribute for storing transactions before assigning to db.
-        self.relevant_transactions: List[SolanaTransaction] = list()
-
-        # rate limiter
+        # rate limiter, shared with other collectors
         self._set_rate_limit()
-        self._call_timestamps: deque[float] = deque(maxlen=self.rate_limit)
+        self.rate_limiter = RateLimiter(self.rate_limit)
 
         LOGGER.info(f"{self.__class__.__name__} is all set to collect.")
 
@@ -101,21 +74,6 @@ class GenericSolanaConnector(ABC):
             return
         self.rate_limit = int(rate_limit)
 
-    def run(self):
-        """
-        Main method to process all necessary operations to collect and write data.
-        """
-        k = 0
-        start_time = time.time()
-        while not self._collection_completed:
-            if k % 10000 == 0:
-                LOGGER.info(f"Iterations completed: {k}, in {time.time() - start_time:.1f} seconds.")
-            self._get_assignment()
-            self._get_data()
-            self._write_data()
-            k += 1
-        LOGGER.info(f"Collection completed for {self.__class__.__name__}.")
-
     def _fetch_block(self, block_number: int) -> Tuple[UiConfirmedBlock, int]:
         """
         Use solana client to fetch block with provided number.
@@ -130,28 +88,52 @@ class GenericSolanaConnector(ABC):
             )
         except SolanaRpcException as e:
             LOGGER.error(f"SolanaRpcException: {e}")
-            time.sleep(1)
+            self.rate_limiter.back_off(1)
             return self._fetch_block(block_number)
 
         return block.value, block_number
 
-    def _rate_limit_calls(self) -> None:
+    def _rate_limit_calls(self, calls: int = 1) -> None:
+        """
+        Wait until `calls` API calls can be made without exceeding the rate limit shared by all collectors.
+        """
+        self.rate_limiter.acquire(calls)
+
+    async def _async_rate_limit_calls(self, calls: int = 1) -> None:
         """
-        This method implements a rate-limiting mechanism to control the frequency of API calls.
-        It ensures that the number of API calls does not exceed a predefined limit per second.
-        If the limit is reached, it will pause the execution momentarily before allowing further API calls.
+        Wait asynchronously until `calls` API calls can be made without exceeding the rate limit shared by all
+        collectors.
         """
-        now = time.time()
+        await self.rate_limiter.async_acquire(calls)
+
+
+class GenericSolanaConnector(SolanaConnector, ABC):
+    """
+    Abstract class with methods, that every Solana connector should implement.
+    """
+
+    def __init__(self):
+        self.assignment: List[int] = list()
+
+        # attribute for storing transactions before assigning to db.
+        self.relevant_transactions: List[SolanaTransaction] = list()
 
-        # Calculate the time to wait until making the next call
-        time_to_wait = 1 - (now - self._call_timestamps[0])
-        # If we've reached the rate limit and the time to wait is above 0.
-        if len(self._call_timestamps) == self.rate_limit and time_to_wait > 0:
-            # Wait for the required time
-            time.sleep(time_to_wait)
+        super().__init__()
 
-        # Record the timestamp of the current call, discarding the oldest one.
-        self._call_timestamps.append(time.time())
+    def run(self):
+        """
+        Main method to process all necessary operations to collect and write data.
+        """
+        k = 0
+        start_time = time.time()
+        while not self._collection_completed:
+            if k % 10000 == 0:
+                LOGGER.info(f"Iterations completed: {k}, in {time.time() - start_time:.1f} seconds.")
+            self._get_assignment()
+            self._get_data()
+            self._write_data()
+            k += 1
+        LOGGER.info(f"Collection completed for {self.__class__.__name__}.")
 
     @property
     def _collection_completed(self) -> bool:
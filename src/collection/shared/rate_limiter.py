@@ -0,0 +1,141 @@
+"""
+RPC rate limiter shared by all collector processes.
+
+The limiter is a token bucket implemented as a generic cell rate algorithm: the bucket is described by the time at
+which it becomes empty, `next_call_at`, stored in `rpc_rate_limits` table. Every call reserves `1 / rate_limit`
+seconds by moving `next_call_at` forward with one atomic upsert, and waits while the bucket holds more than
+`BURST_TIME` seconds of reserved calls. Thus all collectors using the same bucket make at most `rate_limit` calls per
+second in total, with bursts of up to `rate_limit` calls.
+
+The bucket is selected by `RATE_LIMIT_KEY` env variable, collectors sharing an RPC quota should use the same key. If
+the database is unavailable, the limiter falls back to an in-process bucket for `FALLBACK_INTERVAL` seconds.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import sqlalchemy
+import sqlalchemy.dialects.postgresql
+from sqlalchemy.exc import SQLAlchemyError
+
+import db
+from src.metrics import REGISTRY, RPC_CALLS, RPC_RETRIES
+
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_KEY = 'rpc'
+# Calls reserved for up to `BURST_TIME` seconds ahead are made immediately, i.e. bursts of up to `rate_limit` calls.
+BURST_TIME = 1
+# Time in seconds to use the in-process bucket for after the shared one fails.
+FALLBACK_INTERVAL = 60
+
+
+class RateLimiter:
+    """
+    Token bucket limiting calls of all processes using the same key to `rate_limit` calls per second.
+    """
+
+    def __init__(self, rate_limit: int, key: str | None = None):
+        self.rate_limit = max(rate_limit, 1)
+        self.key = key if key else os.getenv("RATE_LIMIT_KEY", DEFAULT_KEY)
+        self._interval = 1 / self.rate_limit
+        # In-process bucket, used while the shared one is unavailable.
+        self._next_call_at = 0.0
+        self._fallback_until = 0.0
+        self._lock = threading.Lock()
+        self._engine: sqlalchemy.Engine | None = None
+
+    def acquire(self, calls: int = 1) -> None:
+        """
+        Reserve `calls` calls and wait until they can be made.
+        """
+        REGISTRY.inc(RPC_CALLS, calls, key=self.key)
+        time.sleep(self._reserve(calls))
+
+    async def async_acquire(self, calls: int = 1) -> None:
+        """
+        Reserve `calls` calls and wait asynchronously until they can be made.
+        """
+        REGISTRY.inc(RPC_CALLS, calls, key=self.key)
+        await asyncio.sleep(await asyncio.to_thread(self._reserve, calls))
+
+    def back_off(self, seconds: float) -> None:
+        """
+        Postpone calls of all processes by at least `seconds`, e.g., after the RPC rejected or failed a call. The caller
+        waits by acquiring the next call.
+        """
+        REGISTRY.inc(RPC_RETRIES, key=self.key)
+        with self._lock:
+            self._next_call_at = max(self._next_call_at, time.time() + BURST_TIME + seconds)
+            if self._is_shared():
+                try:
+                    with self._get_engine().begin() as connection:
+                        connection.execute(
+                            sqlalchemy.update(db.RpcRateLimits).where(
+                                db.RpcRateLimits.name == self.key,
+                            ).values(
+                                next_call_at=sqlalchemy.func.greatest(
+                                    db.RpcRateLimits.next_call_at, self._db_now() + BURST_TIME + seconds
+                                ),
+                            )
+                        )
+                except SQLAlchemyError as e:
+                    self._start_fallback(e)
+
+    async def async_back_off(self, seconds: float) -> None:
+        await asyncio.to_thread(self.back_off, seconds)
+
+    def _reserve(self, calls: int) -> float:
+        """
+        Move the bucket forward by `calls` calls.
+
+        Returns:
+        - float: Time to wait in seconds before making the calls.
+        """
+        reserved_time = calls * self._interval
+        with self._lock:
+            if self._is_shared():
+                try:
+                    return max(0.0, self._reserve_shared(reserved_time))
+                except SQLAlchemyError as e:
+                    self._start_fallback(e)
+            now = time.time()
+            self._next_call_at = max(self._next_call_at, now) + reserved_time
+            return max(0.0, self._next_call_at - BURST_TIME - now)
+
+    def _reserve_shared(self, reserved_time: float) -> float:
+        now = self._db_now()
+        insert_stmt = sqlalchemy.dialects.postgresql.insert(db.RpcRateLimits).values(
+            name=self.key,
+            next_call_at=now + reserved_time,
+        )
+        with self._get_engine().begin() as connection:
+            return connection.execute(
+                insert_stmt.on_conflict_do_update(
+                    index_elements=[db.RpcRateLimits.name],
+                    set_={'next_call_at': sqlalchemy.func.greatest(db.RpcRateLimits.next_call_at, now) + reserved_time},
+                ).returning(db.RpcRateLimits.next_call_at - BURST_TIME - now)
+            ).scalar_one()
+
+    @staticmethod
+    def _db_now() -> sqlalchemy.ColumnElement[float]:
+        # Database time is used so that clocks of the collectors do not need to be in sync.
+        return sqlalchemy.func.extract('epoch', sqlalchemy.func.now())
+
+    def _get_engine(self) -> sqlalchemy.Engine:
+        if self._engine is None:
+            self._engine = sqlalchemy.create_engine(db.CONN_STRING, pool_size=1, max_overflow=0, pool_pre_ping=True)
+        return self._engine
+
+    def _is_shared(self) -> bool:
+        return time.time() >= self._fallback_until
+
+    def _start_fallback(self, error: SQLAlchemyError) -> None:
+        LOGGER.error(
+            f"Shared rate limit `{self.key}` is unavailable, limiting calls of this process only for "
+            f"{FALLBACK_INTERVAL} seconds: {error}"
+        )
+        self._fallback_until = time.time() + FALLBACK_INTERVAL
@@ -0,0 +1,183 @@
+"""
+Recording and replaying of Solana JSON-RPC traffic, used to benchmark collectors offline.
+
+The collectors talk to the RPC through `Client` and `AsyncClient` over HTTP only, so the recording is done by a local
+JSON-RPC server placed between them and the RPC: point `RPC_URL` of the collectors to the server.
+- In the `record` mode, the server forwards requests to the upstream RPC and stores every response, keyed by the method
+  and parameters of the request, to a JSON lines file.
+- In the `replay` mode, the server answers requests from the recording after a configurable latency, without any
+  upstream RPC. Requests which were not recorded get a JSON-RPC error, which the collectors handle as a missing block or
+  transaction.
+Batch requests are recorded and replayed element by element, so a recording made with single requests serves batched
+requests too.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+import json
+import logging
+import os
+import threading
+import time
+
+import httpx
+
+
+LOGGER = logging.getLogger(__name__)
+
+RECORDING_MODES = ('record', 'replay')
+# JSON-RPC error code returned for requests that are not in the recording.
+NOT_RECORDED_ERROR_CODE = -32001
+
+
+def _get_key(request: dict[str, Any]) -> str:
+    """
+    Identify request by its method and parameters, regardless of its ID.
+    """
+    return json.dumps([request.get('method'), request.get('params')], sort_keys=True, separators=(',', ':'))
+
+
+class RpcRecording:
+    """
+    Responses of JSON-RPC requests stored in a JSON lines file. Each line holds the method and parameters of a request
+    with the result or the error of its response.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # Serialized `"result": ...` or `"error": ...` member of the response by request key.
+        self._responses: dict[str, str] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    record = json.loads(line)
+                    self._responses[_get_key(record)] = self._serialize_member(record)
+        LOGGER.info(f"Loaded {len(self._responses)} recorded responses from `{path}`.")
+
+    def __len__(self) -> int:
+        return len(self._responses)
+
+    @staticmethod
+    def _serialize_member(response: dict[str, Any]) -> str:
+        if 'error' in response:
+            return '"error":' + json.dumps(response['error'])
+        return '"result":' + json.dumps(response.get('result'))
+
+    def add(self, request: dict[str, Any], response: dict[str, Any]) -> None:
+        """
+        Store the response of the request, replacing the previous one.
+        """
+        record = {'method': request.get('method'), 'params': request.get('params')}
+        if 'error' in response:
+            record['error'] = response['error']
+        else:
+            record['result'] = response.get('result')
+        with self._lock:
+            self._responses[_get_key(request)] = self._serialize_member(record)
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(record) + '\n')
+
+    def get_response(self, request: dict[str, Any]) -> str:
+        """
+        Get the serialized response to the request with its ID, or an error if the request was not recorded.
+        """
+        member = self._responses.get(_get_key(request))
+        if member is None:
+            LOGGER.warning(f"Request `{_get_key(request)}` is not recorded.")
+            member = '"error":' + json.dumps(
+                {'code': NOT_RECORDED_ERROR_CODE, 'message': 'Request is not recorded.'}
+            )
+        return '{"jsonrpc":"2.0",' + member + ',"id":' + json.dumps(request.get('id')) + '}'
+
+
+class RpcRecordingServer(ThreadingHTTPServer):
+    """
+    JSON-RPC server recording responses of the upstream RPC or replaying them.
+
+    Parameters:
+    - port: Local port to listen on.
+    - recording: Recording to store responses to or to replay them from.
+    - upstream_url: URL of the RPC to record, None to replay.
+    - latency: Time in seconds to wait before answering a replayed request.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port: int, recording: RpcRecording, upstream_url: str | None = None, latency: float = 0.0):
+        super().__init__(('127.0.0.1', port), RpcRecordingHandler)
+        self.recording = recording
+        self.upstream_url = upstream_url
+        self.latency = latency
+        self.upstream_client = httpx.Client(timeout=60) if upstream_url else None
+
+
+class RpcRecordingHandler(BaseHTTPRequestHandler):
+    server: RpcRecordingServer
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        payload = json.loads(body)
+        requests = payload if isinstance(payload, list) else [payload]
+
+        if self.server.upstream_url:
+            response_body = self._record(body, requests)
+        else:
+            time.sleep(self.server.latency)
+            responses = [self.server.recording.get_response(request) for request in requests]
+            response_body = (
+                '[' + ','.join(responses) + ']' if isinstance(payload, list) else responses[0]
+            ).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response_body)))
+        self.end_headers()
+        self.wfile.write(response_body)
+
+    def _record(self, body: bytes, requests: list[dict[str, Any]]) -> bytes:
+        """
+        Forward the request to the upstream RPC and record the responses matched to the requests by ID.
+        """
+        assert self.server.upstream_client and self.server.upstream_url
+        upstream_response = self.server.upstream_client.post(
+            self.server.upstream_url,
+            content=body,
+            headers={'Content-Type': 'application/json'},
+        )
+        if upstream_response.status_code == 200:
+            payload = upstream_response.json()
+            responses = {response.get('id'): response for response in (
+                payload if isinstance(payload, list) else [payload]
+            )}
+            for request in requests:
+                response = responses.get(request.get('id'))
+                # Rate limiting and other transient errors are not recorded.
+                if response is not None and 'error' not in response:
+                    self.server.recording.add(request, response)
+        else:
+            LOGGER.error(f"Upstream RPC responded with status {upstream_response.status_code}.")
+        return upstream_response.content
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        LOGGER.debug(format, *args)
+
+
+def serve(mode: str, path: str, port: int, upstream_url: str | None = None, latency: float = 0.0) -> None:
+    """
+    Run the server in the `record` or `replay` mode until interrupted.
+    """
+    if mode not in RECORDING_MODES:
+        raise ValueError(f"Mode must be one of {RECORDING_MODES}, got `{mode}`.")
+    if mode == 'record' and not upstream_url:
+        raise ValueError("Upstream RPC url is required to record.")
+    server = RpcRecordingServer(
+        port=port,
+        recording=RpcRecording(path),
+        upstream_url=upstream_url if mode == 'record' else None,
+        latency=latency,
+    )
+    LOGGER.info(f"Serving JSON-RPC on http://127.0.0.1:{port} in the `{mode}` mode.")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -2,6 +2,7 @@
 Class for collection of transaction data from Solana chain
 """
 from abc import abstractmethod
+from collections import Counter
 from typing import List, Tuple
 import asyncio
 import logging
@@ -9,21 +10,41 @@ import os
 import time
 import traceback
 
+import httpx
 from solana.exceptions import SolanaRpcException
 from solana.rpc.async_api import AsyncClient
 from solana.rpc.commitment import Commitment
 from solana.rpc.core import RPCException
 from solders.errors import SerdeJSONError
-from solders.transaction_status import EncodedTransactionWithStatusMeta, UiConfirmedBlock
+from solders.rpc.config import RpcBlockConfig, RpcTransactionConfig
+from solders.rpc.requests import Body, GetBlock, GetTransaction
+from solders.rpc.responses import GetBlockResp, GetTransactionResp, batch_from_json
+from solders.signature import Signature
+from solders.transaction_status import (
+    EncodedTransactionWithStatusMeta,
+    TransactionDetails,
+    UiAccountsList,
+    UiConfirmedBlock,
+    UiTransactionEncoding,
+)
 from sqlalchemy.exc import IntegrityError, OperationalError
 
 from src.collection.shared.generic_collector import GenericSolanaConnector, SolanaTransaction, log_performance_time
+from src.metrics import REGISTRY, ROWS_WRITTEN
 from src.protocols.addresses import ALL_ADDRESSES
 import db
 
 
 LOG = logging.getLogger(__name__)
 
+# Modes of fetching blocks, set by `BLOCK_FETCH_MODE` env variable:
+# - full: blocks are fetched with full `jsonParsed` transactions.
+# - accounts: blocks are fetched with account keys of transactions only, full `jsonParsed` transactions are then
+#   fetched only for relevant signatures with batched `getTransaction` requests.
+BLOCK_FETCH_MODES = ('full', 'accounts')
+# Number of transactions fetched with one batch request in the `accounts` mode.
+TRANSACTIONS_BATCH_SIZE = 20
+
 
 class TXFromBlockCollector(GenericSolanaConnector):
     """
@@ -34,27 +55,16 @@ class TXFromBlockCollector(GenericSolanaConnector):
     def __init__(self):
         super().__init__()
         self.async_solana_client = AsyncClient(self.authenticated_rpc_url)
+        self._set_block_fetch_mode()
+        # Size of RPC responses received in the current iteration by request type, in bytes.
+        self.bytes_transferred: Counter[str] = Counter()
 
-    async def _async_rate_limit_calls(self) -> None:
-        """
-        This method implements a rate-limiting mechanism to control the frequency of API calls asynchronously.
-        It ensures that the number of API calls does not exceed a predefined limit per second.
-        If the limit is reached, it will pause the execution momentarily before allowing further API calls.
-        """
-        # Check if the number of calls made in the last second exceeds the maximum limit.
-        while len(self._call_timestamps) >= self.rate_limit:
-            # Calculate the time passed since the first call in the timestamp list.
-            time_passed = time.time() - self._call_timestamps[0]
-
-            if time_passed > 1:
-                # More than a second has passed since the first call, remove it from the list.
-                self._call_timestamps.popleft()
-            else:
-                # Wait for the remainder of the second before allowing more calls, asynchronously.
-                await asyncio.sleep(1 - time_passed)
-
-        # Record the timestamp of the current call.
-        self._call_timestamps.append(time.time())
+    def _set_block_fetch_mode(self) -> None:
+        block_fetch_mode = os.getenv("BLOCK_FETCH_MODE", "full")
+        if block_fetch_mode not in BLOCK_FETCH_MODES:
+            LOG.error(f"Unknown block fetch mode `{block_fetch_mode}`, set to `full`.")
+            block_fetch_mode = 'full'
+        self.block_fetch_mode = block_fetch_mode
 
     def run(self):
         """
@@ -68,12 +78,7 @@ class TXFromBlockCollector(GenericSolanaConnector):
         """
         while not self._collection_completed:
             self._get_assignment()
-            start_time = time.perf_counter()
-            # Log the start of the function
-            LOG.info("START: function `_get_data`.")
             await self._async_get_data()
-            elapsed_time = time.perf_counter() - start_time
-            LOG.info(f"DONE: function `_get_data` in {elapsed_time:.2f} seconds")
             self._write_data()
         LOG.info(f"Collection completed for {self.__class__.__name__}.")
 
@@ -90,36 +95,63 @@ class TXFromBlockCollector(GenericSolanaConnector):
         """
         raise NotImplementedError("Implement me!")
 
+    @log_performance_time(LOG, stage='block_fetch')
     async def _async_get_data(self):
         """
         Concurrently collect transactions from blocks.
         Collected transactions are stored in `rel_transactions` attribute.
         """
         self.relevant_transactions.clear()
+        self.bytes_transferred.clear()
         # Use asyncio.gather to fetch blocks concurrently
         blocks = await asyncio.gather(
             *(self._async_fetch_block(block_number) for block_number in self.assignment)
         )
-        for block, block_number in blocks:
-            if not block:
-                continue
-            self._select_relevant_tx_from_block(block, block_number)
+        if self.block_fetch_mode == 'accounts':
+            await self._async_fetch_relevant_transactions(blocks)
+        else:
+            for block, block_number in blocks:
+                if not block:
+                    continue
+                self._select_relevant_tx_from_block(block, block_number)
+        LOG.info(f"Received {self.bytes_transferred.total():,} bytes in `{self.block_fetch_mode}` mode: "
+                 f"{dict(self.bytes_transferred)}")
+
+    async def _async_make_request(self, body: Body | Tuple[Body, ...], request_type: str) -> str:
+        """
+        Sends a request, or a batch of requests, and counts the size of the raw response to `bytes_transferred`.
+        """
+        provider = self.async_solana_client._provider  # pylint: disable=protected-access
+        if isinstance(body, tuple):
+            raw = await provider.make_batch_request_unparsed(body)
+        else:
+            raw = await provider.make_request_unparsed(body)
+        self.bytes_transferred[request_type] += len(raw)
+        return raw
 
     async def _async_fetch_block(self, block_number: int) -> Tuple[UiConfirmedBlock | None, int]:
         """
-        Use solana client to fetch block with provided number.
+        Use solana client to fetch block with provided number. In the `accounts` mode, transactions of the block
+        contain signatures and account keys only.
         """
         await self._async_rate_limit_calls()
         # Fetch block data.
+        config = RpcBlockConfig(
+            encoding=UiTransactionEncoding.JsonParsed,
+            transaction_details=(
+                TransactionDetails.Accounts if self.block_fetch_mode == 'accounts' else TransactionDetails.Full
+            ),
+            rewards=False,
+            max_supported_transaction_version=0,
+        )
         try:
-            block = await self.async_solana_client.get_block(
-                slot=block_number,
-                encoding='jsonParsed',
-                max_supported_transaction_version=0,
-            )
-        except SolanaRpcException as e:
+            raw = await self._async_make_request(GetBlock(slot=block_number, config=config), 'blocks')
+            block = GetBlockResp.from_json(raw)
+            if not isinstance(block, GetBlockResp):
+                raise RPCException(block)
+        except (SolanaRpcException, httpx.HTTPError) as e:
             LOG.error(f"SolanaRpcException while fetching {block_number}: {e}")
-            await asyncio.sleep(0.5)
+            await self.rate_limiter.async_back_off(0.5)
             return await self._async_fetch_block(block_number)
         except RPCException as e:
             LOG.error(f"RpcException while fetching {block_number}: {e}")
@@ -133,6 +165,73 @@ class TXFromBlockCollector(GenericSolanaConnector):
 
         return block.value, block_number
 
+    async def _async_fetch_relevant_transactions(
+            self,
+            blocks: List[Tuple[UiConfirmedBlock | None, int]]
+    ) -> None:
+        """
+        Select relevant transactions from blocks fetched in the `accounts` mode and concurrently fetch their full
+        data in batches.
+        """
+        relevant_signatures = [
+            (Signature.from_string(str(tx.transaction.signatures[0])), block_number, block.block_time or -1)
+            for block, block_number in blocks
+            if block and block.transactions
+            for tx in block.transactions
+            if self._is_transaction_relevant(tx)
+        ]
+        batches = await asyncio.gather(*(
+            self._async_fetch_transactions(relevant_signatures[i:i + TRANSACTIONS_BATCH_SIZE])
+            for i in range(0, len(relevant_signatures), TRANSACTIONS_BATCH_SIZE)
+        ))
+        for transactions in batches:
+            self.relevant_transactions.extend(transactions)
+
+    async def _async_fetch_transactions(
+            self,
+            signatures: List[Tuple[Signature, int, int]]
+    ) -> List[SolanaTransaction]:
+        """
+        Fetch `jsonParsed` transactions with one batch request.
+
+        Parameters:
+        - signatures: Signatures of the transactions with numbers and times of their blocks.
+
+        Returns:
+        - list: Fetched transactions as `SolanaTransaction` objects.
+        """
+        # Each transaction of the batch counts as a call.
+        await self._async_rate_limit_calls(len(signatures))
+        config = RpcTransactionConfig(encoding=UiTransactionEncoding.JsonParsed, max_supported_transaction_version=0)
+        try:
+            raw = await self._async_make_request(
+                tuple(GetTransaction(signature, config, id=i) for i, (signature, _, _) in enumerate(signatures)),
+                'transactions',
+            )
+            responses = batch_from_json(raw, [GetTransactionResp] * len(signatures))
+        except (SolanaRpcException, httpx.HTTPError) as e:
+            LOG.error(f"SolanaRpcException while fetching {len(signatures)} transactions: {e}")
+            await self.rate_limiter.async_back_off(0.5)
+            return await self._async_fetch_transactions(signatures)
+        except SerdeJSONError as e:
+            tb_str = traceback.format_exc()
+            # Log the error message along with the traceback
+            LOG.error(f"An error occurred: {e}\nTraceback:\n{tb_str}")
+            await asyncio.sleep(0.3)
+            return await self._async_fetch_transactions(signatures)
+
+        transactions = []
+        for (signature, block_number, block_time), response in zip(signatures, responses):
+            if not isinstance(response, GetTransactionResp) or not response.value:
+                LOG.error(f"Transaction `{signature}` from block {block_number} was not fetched: {response}")
+                continue
+            transactions.append(SolanaTransaction(
+                block_number=block_number,
+                block_time=block_time,
+                tx_body=response.value.transaction
+            ))
+        return transactions
+
     def _select_relevant_tx_from_block(self, block: UiConfirmedBlock, block_number: int) -> None:
         """
         Select only relevant transactions based on public keys involved.
@@ -220,11 +319,12 @@ class TXFromBlockCollector(GenericSolanaConnector):
         """
         Fetches number of the last finalized block.
         """
+        self._rate_limit_calls()
         try:
             return self.solana_client.get_slot(commitment=Commitment('finalized')).value
         except SolanaRpcException as e:
             LOG.error(f"SolanaRpcException while fetching the last finalized block on chain: {e}")
-            time.sleep(0.5)
+            self.rate_limiter.back_off(0.5)
             return self._get_latest_finalized_block_on_chain()
 
     @log_performance_time(LOG)
@@ -232,13 +332,19 @@ class TXFromBlockCollector(GenericSolanaConnector):
         """
         Write raw tx data to database.
         """
-        # if relevant transactions were not found in current iteration, do nothing.
-        if not self.relevant_transactions:
-            self._report_collection()
-            return
+        # if relevant transactions were not found in current iteration, only report the collection.
+        if self.relevant_transactions:
+            self._store_transactions(self.relevant_transactions)
+        self._report_collection()
+
+    def _store_transactions(self, transactions: List[SolanaTransaction]) -> None:
+        """
+        Store raw data of the transactions, once per each relevant protocol.
+        """
         try:
             with db.get_db_session() as session:
-                for transaction in self.relevant_transactions:
+                rows_written = 0
+                for transaction in transactions:
                     sources = transaction.sources(self.protocol_public_keys if self.protocol_public_keys else [])
                     signature = transaction.first_signature
                     # Same transaction has to be recorded once per each relevant protocol
@@ -263,16 +369,16 @@ class TXFromBlockCollector(GenericSolanaConnector):
                                 collection_stream=self.collection_stream
                             )
                             session.add(new_record)
+                        rows_written += max(len(records), 1)
 
                 # Commit the changes.
                 session.commit()
+                REGISTRY.inc(ROWS_WRITTEN, rows_written, table=db.TransactionStatusWithSignature.__tablename__)
         except OperationalError as e:
             LOG.error("OperationalError occured: %s. Waiting 120 to retry."
                       "\n Exception occurred: %s", str(e), traceback.format_exc())
             time.sleep(120)
-            self._write_data()
-            return
-        self._report_collection()
+            self._store_transactions(transactions)
 
     @abstractmethod
     def _report_collection(self):
@@ -293,7 +399,12 @@ class TXFromBlockCollector(GenericSolanaConnector):
         are present in the transaction's account keys. It is used to filter transactions
         based on the involvement of specific protocols identified by their public keys.
         """
-        for i in transaction.transaction.message.account_keys:  # type: ignore
+        # Blocks fetched in the `accounts` mode contain only the list of account keys instead of the transaction.
+        if isinstance(transaction.transaction, UiAccountsList):
+            account_keys = transaction.transaction.account_keys
+        else:
+            account_keys = transaction.transaction.message.account_keys  # type: ignore
+        for i in account_keys:
             if str(i.pubkey) in self.protocol_public_keys:  # type: ignore
                 return True
         return False
@@ -6,15 +6,19 @@ on Solana chain for lending protocols.
     Takes `t_0` from db, assign `t_0` if first run.
     PPKs (protocol public key) are collected from environmental variable.
     Takes `t_0` and all PPKs as input
-    1) Concurrently fetch blocks from `t_0` to `t_0`+`BATCH_SIZE` or to last finalized slot obtained with `get_slot`
-     method of RPC API.
+    1) Concurrently fetch blocks from `t_0` to `t_0`+batch size or to last finalized slot obtained with `get_slot`
+     method of RPC API. The batch size grows with the lag behind the last finalized slot, from `BATCH_SIZE` up to
+     `MAX_BATCH_SIZE`.
     2) Filter all transactions in fetched blocks by PPKs of all protocols (i.e. Solend, Mango etc)
      to select relevant transactions.
     3) For each relevant transaction:
         create new record in `transactions` table.
     4) replace `t_0` with last fetched block and repeat 1-3.
+    Steps 1-3 run as a pipeline connected by bounded queues: the next batch is assigned and fetched while
+    the transactions of the previous one are written to the database.
     If being restarted - start from the latest block saved. The last current block number is collected from db.
 """
+import asyncio
 import logging
 import time
 import traceback
@@ -22,12 +26,27 @@ import traceback
 from sqlalchemy.exc import OperationalError
 
 import db
+from src.collection.shared.generic_collector import SolanaTransaction
 from src.collection.tx_data.collector import TXFromBlockCollector
+from src.metrics import REGISTRY, SLOT_LAG
 
 
 LOGGER = logging.getLogger(__name__)
 
 BATCH_SIZE = 30
+MAX_BATCH_SIZE = 120
+# Share of the lag behind the last finalized slot assigned at once.
+LAG_SHARE = 0.25
+# Number of batches waiting to be fetched or written.
+QUEUE_SIZE = 2
+# Approximate slot time in seconds, used to wait for new blocks once the collector catches up with the chain.
+SLOT_TIME = 0.4
+SKIPPED_BLOCKS = {
+    253152004,  # Unknown bug with block 253152004
+    255312004,  # Unknown bug with block 255312004
+    253584001,  # Unknown bug with block 253584001
+    255744008,  # Unknown bug with block 255744008
+}
 
 
 class CurrentTXCollector(TXFromBlockCollector):
@@ -39,7 +58,75 @@ class CurrentTXCollector(TXFromBlockCollector):
         """
         return db.CollectionStreamTypes.CURRENT
 
-    def _get_assigned_blocks(self) -> None:
+    async def async_run(self):
+        """
+        Collects transactions in a pipeline of three concurrent stages connected by bounded queues: assignment of
+        blocks, fetching of blocks with selection of relevant transactions and writing to the database.
+        """
+        self._get_protocol_public_keys()
+        fetch_queue: asyncio.Queue[tuple[list[int], int]] = asyncio.Queue(maxsize=QUEUE_SIZE)
+        write_queue: asyncio.Queue[tuple[list[SolanaTransaction], list[int], int]] = asyncio.Queue(
+            maxsize=QUEUE_SIZE
+        )
+        await asyncio.gather(
+            self._assign_blocks(fetch_queue),
+            self._fetch_blocks(fetch_queue, write_queue),
+            self._write_blocks(write_queue),
+        )
+
+    async def _assign_blocks(self, fetch_queue: asyncio.Queue[tuple[list[int], int]]) -> None:
+        """
+        Assigns consecutive batches of blocks, starting with the last collected block. The batch size is a share of
+        the lag behind the last finalized slot, bounded by `BATCH_SIZE` and `MAX_BATCH_SIZE`.
+        """
+        next_block = await asyncio.to_thread(self._get_last_collected_block)
+        while True:
+            last_block_on_chain = await asyncio.to_thread(self._get_latest_finalized_block_on_chain)
+            lag = last_block_on_chain - next_block
+            REGISTRY.set(SLOT_LAG, lag, collector=self.__class__.__name__)
+            batch_size = min(MAX_BATCH_SIZE, max(BATCH_SIZE, int(lag * LAG_SHARE)))
+            end_block = min(next_block + batch_size, last_block_on_chain)
+            if end_block <= next_block:
+                await asyncio.sleep(SLOT_TIME)
+                continue
+            LOGGER.info(f"Lag behind the chain: {lag} blocks, assigning {end_block - next_block} blocks.")
+            assignment = [block for block in range(next_block, end_block) if block not in SKIPPED_BLOCKS]
+            await fetch_queue.put((assignment, end_block - 1))
+            next_block = end_block
+
+    async def _fetch_blocks(
+            self,
+            fetch_queue: asyncio.Queue[tuple[list[int], int]],
+            write_queue: asyncio.Queue[tuple[list[SolanaTransaction], list[int], int]],
+    ) -> None:
+        """
+        Fetches assigned blocks and passes their relevant transactions to the writing stage.
+        """
+        while True:
+            self.assignment, last_block = await fetch_queue.get()
+            start_time = time.perf_counter()
+            await self._async_get_data()
+            LOGGER.info(f"Fetched {len(self.assignment)} blocks in {time.perf_counter() - start_time:.2f} seconds.")
+            await write_queue.put((list(self.relevant_transactions), self.assignment, last_block))
+
+    async def _write_blocks(
+            self,
+            write_queue: asyncio.Queue[tuple[list[SolanaTransaction], list[int], int]],
+    ) -> None:
+        """
+        Writes relevant transactions of fetched blocks to the database and reports the last collected block, batch
+        by batch in the order of assignment.
+        """
+        while True:
+            transactions, assignment, last_block = await write_queue.get()
+            start_time = time.perf_counter()
+            if transactions:
+                await asyncio.to_thread(self._store_transactions, transactions)
+            await asyncio.to_thread(self._report_last_block_collected, last_block)
+            LOGGER.info(f"Stored {len(transactions)} transactions in {time.perf_counter() - start_time:.2f} seconds, "
+                        f"assignment completed: {assignment}")
+
+    def _get_last_collected_block(self) -> int:
         """
         Retrieves the earliest last collected block number among protocols.
         """
@@ -48,13 +135,12 @@ class CurrentTXCollector(TXFromBlockCollector):
                 # Query the database for protocols with the given public keys
                 protocols = session.query(db.Protocols).filter(db.Protocols.public_key.in_(
                     self.protocol_public_keys if self.protocol_public_keys else []
-                ))
+                )).all()
         except OperationalError as e:
             LOGGER.error("OperationalError occured: %s. Waiting 120 to retry."
                          "\n Exception occurred: %s", str(e), traceback.format_exc())
             time.sleep(120)
-            self._get_assigned_blocks()
-            return
+            return self._get_last_collected_block()
 
         last_collected_block = None  # Initialize last_collected_block
 
@@ -66,26 +152,34 @@ class CurrentTXCollector(TXFromBlockCollector):
             # Update last_collected_block if it's None or if a smaller block number is found
             if last_collected_block is None or block < last_collected_block:
                 last_collected_block = block
-        last_block_on_chain = self._get_latest_finalized_block_on_chain()
+        return last_collected_block  # type: ignore
 
-        self.assignment = list(  # pylint: disable=attribute-defined-outside-init
-            range(last_collected_block, min(last_collected_block + BATCH_SIZE, last_block_on_chain))  # type: ignore
-        )
+    def _get_assigned_blocks(self) -> None:
+        """
+        Assigns up to `BATCH_SIZE` blocks starting with the earliest last collected block among protocols.
+        """
+        last_collected_block = self._get_last_collected_block()
+        last_block_on_chain = self._get_latest_finalized_block_on_chain()
 
-        if 253152004 in self.assignment:
-            self.assignment.remove(253152004)  # Unknown bug with block 253152004
-        if 255312004 in self.assignment:
-            self.assignment.remove(255312004)  # Unknown bug with block 255312004
-        if 253584001 in self.assignment:
-            self.assignment.remove(253584001)  # Unknown bug with block 253584001
-        if 255744008 in self.assignment:
-            self.assignment.remove(255744008)  # Unknown bug with block 255744008
+        self.assignment = [  # pylint: disable=attribute-defined-outside-init
+            block
+            for block in range(last_collected_block, min(last_collected_block + BATCH_SIZE, last_block_on_chain))
+            if block not in SKIPPED_BLOCKS
+        ]
 
     def _report_collection(self):
         """
         Updates `last_collected_block` for each protocol.
         :return:
         """
+        if self.assignment:
+            self._report_last_block_collected(max(self.assignment))
+        LOGGER.info(f"Assignment completed: {self.assignment}")
+
+    def _report_last_block_collected(self, block_number: int) -> None:
+        """
+        Updates `last_collected_block` for each protocol to the provided block number.
+        """
         try:
             with db.get_db_session() as session:
                 protocols = session.query(db.Protocols).filter(db.Protocols.public_key.in_(
@@ -93,15 +187,11 @@ class CurrentTXCollector(TXFromBlockCollector):
                 ))
 
                 for protocol in protocols:
-                    if self.assignment:
-                        protocol.last_block_collected = max(self.assignment)
+                    protocol.last_block_collected = block_number
 
                 session.commit()
         except OperationalError as e:
             LOGGER.error("OperationalError occured: %s. Waiting 120 to retry."
                          "\n Exception occurred: %s", str(e), traceback.format_exc())
             time.sleep(120)
-            self._report_collection()
-            return
-
-        LOGGER.info(f"Assignment completed: {self.assignment}")
+            self._report_last_block_collected(block_number)
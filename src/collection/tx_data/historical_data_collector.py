@@ -5,22 +5,29 @@ Dependent on `transactions` db table as its source of blocks to fetch. All PPKs
 
 Fetch all transactions from this block, filter by PPKs of all protocols (i.e., Solend, Mango, etc).
 
-1. Obtains several (`BATCH_SIZE`) oldest slot numbers where there are relevant transactions
- that do not have transaction data stored in database.
-2. Concurrently fetch blocks from these slots.
+1. Claims a lease on `BATCH_SIZE` oldest slots of `block_assignments` table which are not leased by another collector.
+ If there are none, the table is first refilled with slots where there are relevant transactions that do not have
+ transaction data stored in database.
+2. Concurrently fetch blocks from these slots, while renewing the lease.
 3. Filter all transactions in fetched blocks by PPKs of all lending protocols to select relevant transactions.
 4. For each relevant transaction:
     - create new record in transactions table if not yet exists.
     - assign transaction data to existing records.
-5. Repeat 1-4 indefinitely.
+5. Delete the collected slots from `block_assignments` table.
+6. Repeat 1-5 indefinitely.
 
-If being restarted - nothing changes.
+Any number of collectors can run simultaneously, each of them gets different slots. Slots of a collector which
+stopped are claimed by the others once its lease expires. If being restarted - nothing changes.
 """
+import asyncio
 import logging
 import os
+import socket
 import time
 import traceback
 
+import sqlalchemy
+import sqlalchemy.dialects.postgresql
 from sqlalchemy.exc import OperationalError
 
 import db
@@ -28,10 +35,16 @@ from src.collection.tx_data.collector import TXFromBlockCollector
 
 LOGGER = logging.getLogger(__name__)
 BATCH_SIZE = 100
-# Defines offset of `HistoricalTXCollector._get_assigned_blocks method.
-# In case when several historical data collector are run simultaneously, different offsets will ensure
-# that these collectors don't get same block numbers in assignment.
-OFFSET = os.getenv("OFFSET", "0")
+# Identifier of the collector in `block_assignments` table.
+WORKER_ID = os.getenv("WORKER_ID", f"{socket.gethostname()}-{os.getpid()}")
+# Duration of the lease on assigned slots in seconds. The lease is renewed every `LEASE_RENEWAL_INTERVAL` seconds
+# while the blocks are being fetched.
+LEASE_DURATION = 600
+LEASE_RENEWAL_INTERVAL = 60
+# Key of the advisory lock which allows only one collector to refill `block_assignments` table at once.
+REFILL_LOCK_KEY = 3_840_001
+# Time to wait in seconds when there are no slots to collect.
+IDLE_INTERVAL = 10
 
 
 class HistoricalTXCollector(TXFromBlockCollector):
@@ -43,26 +56,13 @@ class HistoricalTXCollector(TXFromBlockCollector):
 
     def _get_assigned_blocks(self) -> None:
         """
-        Get `BATCH_SIZE` of unique block numbers we need to fetch and get transaction data from.
-        :return:
+        Claim a lease on `BATCH_SIZE` oldest unleased slots of `block_assignments` table. The table is refilled when
+        there are no slots to claim.
         """
-        # TODO: make it more flexible. we want to be able to get assignments indirectly  # pylint: disable=W0511
-        #  from db so several collectors can serve at once / or change status of tx while fetching tx_raw
-        # Fetch first n blocks that contain transactions without tx_raw.
         try:
-            with db.get_db_session() as session:
-                distinct_slots = session.query(
-                    db.TransactionStatusWithSignature.slot
-                ).filter(
-                    db.TransactionStatusWithSignature.transaction_data.is_(None)
-                ).distinct().offset(int(OFFSET)).limit(BATCH_SIZE*3).subquery()
-
-                # Outer query to order the distinct slots and limit the results
-                slots = session.query(
-                    distinct_slots.c.slot
-                ).order_by(
-                    distinct_slots.c.slot
-                ).limit(BATCH_SIZE).all()
+            slots = self._claim_blocks()
+            if not slots and self._refill_block_assignments():
+                slots = self._claim_blocks()
         except OperationalError as e:
             LOGGER.error("OperationalError occured: %s. Waiting 120 to retry."
                          "\n Exception occurred: %s", str(e), traceback.format_exc())
@@ -70,11 +70,115 @@ class HistoricalTXCollector(TXFromBlockCollector):
             self._get_assigned_blocks()
             return
 
-        self.assignment = [i.slot for i in slots]  # pylint: disable=attribute-defined-outside-init
+        if not slots:
+            LOGGER.info(f"No slots to collect, waiting {IDLE_INTERVAL} seconds.")
+            time.sleep(IDLE_INTERVAL)
+        self.assignment = slots  # pylint: disable=attribute-defined-outside-init
+
+    @staticmethod
+    def _claim_blocks() -> list[int]:
+        """
+        Lease `BATCH_SIZE` oldest slots with a missing or expired lease. Slots being claimed by other collectors at the
+        same moment are locked and therefore skipped.
+        """
+        now = int(time.time())
+        with db.get_db_session() as session:
+            claimable_slots = sqlalchemy.select(
+                db.BlockAssignments.slot
+            ).where(
+                db.BlockAssignments.lease_expires_at.is_(None) | (db.BlockAssignments.lease_expires_at < now)
+            ).order_by(
+                db.BlockAssignments.slot
+            ).limit(BATCH_SIZE).with_for_update(skip_locked=True).scalar_subquery()
+
+            slots = session.execute(
+                sqlalchemy.update(db.BlockAssignments).where(
+                    db.BlockAssignments.slot.in_(claimable_slots)
+                ).values(
+                    worker=WORKER_ID,
+                    lease_expires_at=now + LEASE_DURATION,
+                ).returning(db.BlockAssignments.slot)
+            ).scalars().all()
+            session.commit()
+        return sorted(slots)
+
+    @staticmethod
+    def _refill_block_assignments() -> bool:
+        """
+        Add slots with transactions without transaction data to `block_assignments` table. Slots which are already
+        there keep their lease.
+
+        Returns:
+        - bool: Whether the table was refilled, False if another collector is refilling it at the moment.
+        """
+        with db.get_db_session() as session:
+            is_locked = session.execute(
+                sqlalchemy.select(sqlalchemy.func.pg_try_advisory_xact_lock(REFILL_LOCK_KEY))
+            ).scalar()
+            if not is_locked:
+                return False
+            pending_slots = sqlalchemy.select(
+                db.TransactionStatusWithSignature.slot
+            ).where(
+                db.TransactionStatusWithSignature.transaction_data.is_(None)
+            ).distinct()
+            result = session.execute(
+                sqlalchemy.dialects.postgresql.insert(db.BlockAssignments).from_select(
+                    ['slot'], pending_slots
+                ).on_conflict_do_nothing()
+            )
+            session.commit()
+        LOGGER.info(f"{result.rowcount} slots added to block assignments.")
+        return True
+
+    def _renew_lease(self, slots: list[int]) -> None:
+        """
+        Extend the lease on the slots held by this collector.
+        """
+        try:
+            with db.get_db_session() as session:
+                session.execute(
+                    sqlalchemy.update(db.BlockAssignments).where(
+                        db.BlockAssignments.slot.in_(slots),
+                        db.BlockAssignments.worker == WORKER_ID,
+                    ).values(lease_expires_at=int(time.time()) + LEASE_DURATION)
+                )
+                session.commit()
+        except OperationalError as e:
+            LOGGER.error("OperationalError occured while renewing lease: %s.", str(e))
+
+    async def _renew_lease_periodically(self, slots: list[int]) -> None:
+        while True:
+            await asyncio.sleep(LEASE_RENEWAL_INTERVAL)
+            await asyncio.to_thread(self._renew_lease, slots)
+
+    async def _async_get_data(self):
+        """
+        Concurrently collect transactions from blocks, while renewing the lease on them.
+        """
+        lease_renewal = asyncio.create_task(self._renew_lease_periodically(list(self.assignment)))
+        try:
+            await super()._async_get_data()
+        finally:
+            lease_renewal.cancel()
 
     def _report_collection(self) -> None:
         """
+        Delete the collected slots from `block_assignments` table.
         """
-        # TODO: here we can check if last collected block does not  # pylint: disable=W0511
-        #  exceed watershed number for historical data, if so stop collection
+        try:
+            with db.get_db_session() as session:
+                session.execute(
+                    sqlalchemy.delete(db.BlockAssignments).where(
+                        db.BlockAssignments.slot.in_(self.assignment),
+                        db.BlockAssignments.worker == WORKER_ID,
+                    )
+                )
+                session.commit()
+        except OperationalError as e:
+            LOGGER.error("OperationalError occured: %s. Waiting 120 to retry."
+                         "\n Exception occurred: %s", str(e), traceback.format_exc())
+            time.sleep(120)
+            self._report_collection()
+            return
         LOGGER.info(f"Data for {len(self.relevant_transactions)} have been stored to the database.")
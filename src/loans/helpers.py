@@ -1,7 +1,9 @@
 import os
 import time
+from typing import Iterator
 
 import pandas
+import psycopg2.sql
 import solana.rpc.api
 from solana.exceptions import SolanaRpcException
 
@@ -28,27 +30,125 @@ def get_decimals(pubkey):
     return response.value.data.parsed['info']['decimals']
 
 
-def get_events(
+# Dtypes of columns common to all parsed transactions tables, other columns are read as strings. Names of instructions
+# and events repeat a lot, so they're kept as categoricals. Nullable columns, such as `block`, use nullable dtypes.
+EVENT_DTYPES: dict[str, str] = {
+    'id': 'int64',
+    'transaction_id': 'string',
+    'instruction_name': 'category',
+    'event_name': 'category',
+    'block': 'Int64',
+    'amount': 'Int64',
+    'token': 'string',
+}
+# Columns always fetched, these are needed to order and group events.
+EVENT_INDEX_COLUMNS = ['id', 'block', 'transaction_id', 'instruction_name', 'event_name']
+# Number of events fetched from the server-side cursor at once.
+EVENTS_CHUNK_SIZE = 100_000
+
+
+def _get_event_columns(columns: list[str]) -> list[str]:
+    return list(dict.fromkeys([*EVENT_INDEX_COLUMNS, *columns]))
+
+
+def _to_events_frame(rows: list[tuple], columns: list[str], dtypes: dict[str, str]) -> pandas.DataFrame:
+    events = pandas.DataFrame.from_records(rows, columns=columns)
+    return events.astype({column: dtypes.get(column, 'string') for column in columns}).set_index('id')
+
+
+def iter_events(
     table: str,
     event_names: tuple[str, ...],
+    columns: list[str],
+    dtypes: dict[str, str] | None = None,
     event_column: str = 'event_name',
     start_block_number: int = 0,
-) -> pandas.DataFrame:
-    connection = src.database.establish_connection()
-    events = pandas.read_sql(
-        sql=f"""
+    chunk_size: int = EVENTS_CHUNK_SIZE,
+) -> Iterator[pandas.DataFrame]:
+    """
+    Streams events ordered by block and transaction in chunks through a server-side cursor. Chunks are split only
+    between blocks, so that no transaction is split across chunks.
+
+    Parameters:
+    - table: Schema qualified table of the events, e.g. `lenders.kamino_parsed_transactions_v4`.
+    - event_names: Names of events to fetch.
+    - columns: Columns to fetch, `EVENT_INDEX_COLUMNS` are always fetched.
+    - dtypes: Dtypes of the columns, override `EVENT_DTYPES`. Columns without a dtype are read as strings.
+    - event_column: Column holding the names of events.
+    - start_block_number: First block to fetch events for.
+    - chunk_size: Approximate number of events per chunk.
+
+    Returns:
+    - Iterator[pandas.DataFrame]: Chunks of events indexed by `id`.
+    """
+    dtypes = {**EVENT_DTYPES, **(dtypes or {})}
+    columns = _get_event_columns(columns)
+    query = psycopg2.sql.SQL(
+        """
             SELECT
-                *
+                {columns}
             FROM
                 {table}
             WHERE
-                {event_column} IN {event_names}
+                {event_column} = ANY(%s)
             AND
-                block >= {start_block_number}
+                block >= %s
             ORDER BY
                 block, transaction_id ASC;
-        """,
-        con=connection,
+        """
+    ).format(
+        columns=psycopg2.sql.SQL(', ').join(psycopg2.sql.Identifier(column) for column in columns),
+        table=psycopg2.sql.Identifier(*table.split('.')),
+        event_column=psycopg2.sql.Identifier(event_column),
+    )
+
+    connection = src.database.establish_connection()
+    try:
+        # Named cursors are server-side, rows are transferred in batches of `itersize` while iterating.
+        with connection.cursor(name=f"events_{table.replace('.', '_')}") as cursor:
+            cursor.itersize = chunk_size
+            cursor.execute(query, (list(event_names), start_block_number))
+            block_ix = columns.index('block')
+            rows: list[tuple] = []
+            while batch := cursor.fetchmany(chunk_size):
+                rows.extend(batch)
+                # Hold back events of the last block, more of them can be in the next batch.
+                last_block = rows[-1][block_ix]
+                split_ix = len(rows)
+                while split_ix > 0 and rows[split_ix - 1][block_ix] == last_block:
+                    split_ix -= 1
+                if split_ix == 0:
+                    continue
+                yield _to_events_frame(rows[:split_ix], columns, dtypes)
+                rows = rows[split_ix:]
+            if rows:
+                yield _to_events_frame(rows, columns, dtypes)
+    finally:
+        connection.close()
+
+
+def get_events(
+    table: str,
+    event_names: tuple[str, ...],
+    event_column: str = 'event_name',
+    start_block_number: int = 0,
+    columns: list[str] | None = None,
+) -> pandas.DataFrame:
+    """
+    Fetches all events at once, see `iter_events`. Columns common to all parsed transactions tables are fetched by
+    default.
+    """
+    if columns is None:
+        columns = list(EVENT_DTYPES)
+    chunks = list(
+        iter_events(
+            table=table,
+            event_names=event_names,
+            columns=columns,
+            event_column=event_column,
+            start_block_number=start_block_number,
+        )
     )
-    connection.close()
-    return events.set_index("id")
\ No newline at end of file
+    if not chunks:
+        return _to_events_frame([], _get_event_columns(columns), EVENT_DTYPES)
+    return pandas.concat(chunks)
@@ -48,12 +48,17 @@ SF = 2 ** 60
 LOGGER = logging.getLogger(__name__)
 
 
+# Columns of events read by the event handlers.
+EVENT_COLUMNS: list[str] = ['amount', 'token', 'obligation', 'source', 'destination']
+
+
 def get_events(start_block_number: int = 0) -> pandas.DataFrame:
     return src.loans.helpers.get_events(
         table='lenders.kamino_parsed_transactions_v4',
         event_names=tuple(EVENTS_METHODS_MAPPING),
         event_column='instruction_name',
         start_block_number=start_block_number,
+        columns=EVENT_COLUMNS,
     )
 
 
@@ -389,9 +394,10 @@ class KaminoState(src.loans.solend.SolendState):
             return KaminoState.fetch_accounts(pool_pubkey, client, filters)
 
     def get_unprocessed_events(self) -> None:
-        self.unprocessed_events = src.loans.helpers.get_events(
+        self.unprocessed_events = src.loans.helpers.iter_events(
             table='lenders.kamino_parsed_transactions_v4',
             event_names=tuple(EVENTS_METHODS_MAPPING),
+            columns=EVENT_COLUMNS,
             event_column='instruction_name',
             start_block_number=self.last_slot + 1,
         )
@@ -413,7 +419,7 @@ class KaminoState(src.loans.solend.SolendState):
         assert len(mint_event) == 1
         user = mint_event["obligation"].iloc[0]
         token = mint_event["token"].iloc[0]
-        amount = decimal.Decimal(str(mint_event["amount"].iloc[0]))
+        amount = int(mint_event["amount"].iloc[0])
         assert amount >= 0
         self.loan_entities[user].collateral.increase_value(token=token, value=amount)
         if user in self.verbose_users:
@@ -436,7 +442,7 @@ class KaminoState(src.loans.solend.SolendState):
         assert len(burn_event) == 1
         user = burn_event["obligation"].iloc[0]
         token = burn_event["token"].iloc[0]
-        amount = decimal.Decimal(str(burn_event["amount"].iloc[0]))
+        amount = int(burn_event["amount"].iloc[0])
         assert amount >= 0
         self.loan_entities[user].collateral.increase_value(token=token, value=amount)
         if user in self.verbose_users:
@@ -454,7 +460,7 @@ class KaminoState(src.loans.solend.SolendState):
         assert len(transfer_event) == 1
         user = transfer_event["obligation"].iloc[0]
         token = transfer_event["source"].iloc[0]
-        amount = decimal.Decimal(str(transfer_event["amount"].iloc[0]))
+        amount = int(transfer_event["amount"].iloc[0])
         assert amount >= 0
         self.loan_entities[user].debt.increase_value(token=token, value=amount)
         if user in self.verbose_users:
@@ -474,7 +480,7 @@ class KaminoState(src.loans.solend.SolendState):
         assert len(fee_transfer_event) == 1
         user = fee_transfer_event["obligation"].iloc[0]
         token = fee_transfer_event["source"].iloc[0]
-        amount = decimal.Decimal(str(fee_transfer_event["amount"].iloc[0]))
+        amount = int(fee_transfer_event["amount"].iloc[0])
         assert amount >= 0
         self.loan_entities[user].debt.increase_value(token=token, value=amount)
         if user in self.verbose_users:
@@ -492,7 +498,7 @@ class KaminoState(src.loans.solend.SolendState):
         assert len(transfer_event) == 1
         user = transfer_event["obligation"].iloc[0]
         token = transfer_event["destination"].iloc[0]
-        amount = decimal.Decimal(str(transfer_event["amount"].iloc[0]))
+        amount = int(transfer_event["amount"].iloc[0])
         assert amount >= 0
         self.loan_entities[user].debt.increase_value(token=token, value=-amount)
         if user in self.verbose_users:
@@ -510,7 +516,7 @@ class KaminoState(src.loans.solend.SolendState):
         assert len(collateral_burn_event) == 1
         user = collateral_burn_event["obligation"].iloc[0]
         token = collateral_burn_event["token"].iloc[0]
-        amount = decimal.Decimal(str(collateral_burn_event["amount"].iloc[0]))
+        amount = int(collateral_burn_event["amount"].iloc[0])
         assert amount >= 0
         self.loan_entities[user].collateral.increase_value(token=token, value=-amount)
         if user in self.verbose_users:
@@ -527,7 +533,7 @@ class KaminoState(src.loans.solend.SolendState):
         assert len(debt_transfer_event) == 1
         user = debt_transfer_event["obligation"].iloc[0]
         token = debt_transfer_event["destination"].iloc[0]
-        amount = decimal.Decimal(str(debt_transfer_event["amount"].iloc[0]))
+        amount = int(debt_transfer_event["amount"].iloc[0])
         assert amount >= 0
         self.loan_entities[user].debt.increase_value(token=token, value=-amount)
         if user in self.verbose_users:
@@ -581,11 +587,10 @@ def compute_liquidable_debt_for_price_target(
     loan_states['liquidable'] = loan_states['health_factor'] > 1
     loan_states['liquidation_ratio'] = loan_states['health_factor'] - 1
 
-    def calculate_debt_to_be_liquidated(row):
-        calculated_value = row['liquidation_ratio'] * row[f'debt_usd_{debt_token}'] * row['liquidable']
-        return min(calculated_value, row[f'debt_usd_{debt_token}'])
-
-    loan_states['debt_to_be_liquidated'] = loan_states.apply(calculate_debt_to_be_liquidated, axis=1)
+    # The debt is liquidated up to the whole debt in the debt token.
+    debt_usd = loan_states[f'debt_usd_{debt_token}']
+    calculated_value = loan_states['liquidation_ratio'] * debt_usd * loan_states['liquidable']
+    loan_states['debt_to_be_liquidated'] = calculated_value.where(~(debt_usd < calculated_value), debt_usd)
     liquidatable_value = loan_states['debt_to_be_liquidated'].sum()
     return liquidatable_value
 
@@ -42,6 +42,7 @@ import src.protocols
 import src.protocols.dexes.amms.utils
 import src.loans.mango
 import src.mango_token_params_map
+from src.metrics import REGISTRY, ROWS_WRITTEN, log_performance_time
 
 
 
@@ -58,6 +59,11 @@ MANGO = "mango"
 KAMINO = "kamino"
 SOLEND = "solend"
 
+# Time in seconds to wait for new loan states before checking them anyway.
+LOAN_STATES_POLL_INTERVAL = 900
+# Relative tolerance of liquidation prices used to select loans which can be liquidable at a price level.
+LIQUIDATION_PRICE_TOLERANCE = 1e-6
+
 Protocol = Literal["marginfi", "mango", "kamino", "solend"]
 AnyLoanState = list[
     MangoLoanStates,
@@ -99,6 +105,88 @@ class TokenParameters:
     factor: float
 
 
+def compute_liquidation_prices(
+    collateral_usd: numpy.ndarray,
+    collateral_token_usd: numpy.ndarray,
+    debt_usd: numpy.ndarray,
+    collateral_token_debt_usd: numpy.ndarray,
+    collateral_token_price: float,
+) -> numpy.ndarray:
+    """
+    Computes the collateral token price at which each loan becomes liquidable, i.e. its risk-adjusted debt exceeds its
+    risk-adjusted collateral. Only holdings of the collateral token change with its price, linearly, so the liquidation
+    price is the root of a linear equation.
+
+    Args:
+    - collateral_usd (numpy.ndarray): Risk-adjusted collateral of the loans in USD.
+    - collateral_token_usd (numpy.ndarray): Part of `collateral_usd` held in the collateral token.
+    - debt_usd (numpy.ndarray): Risk-adjusted debt of the loans in USD.
+    - collateral_token_debt_usd (numpy.ndarray): Part of `debt_usd` borrowed in the collateral token.
+    - collateral_token_price (float): Current price of the collateral token.
+
+    Returns:
+    - numpy.ndarray: Liquidation prices, zero or negative for loans which are not liquidable at any positive price and
+    NaN for loans whose health does not improve as the price rises.
+    """
+    slope = collateral_token_usd - collateral_token_debt_usd
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        price_ratio = ((debt_usd - collateral_token_debt_usd) - (collateral_usd - collateral_token_usd)) / slope
+    return numpy.where(slope > 0, price_ratio * collateral_token_price, numpy.nan)
+
+
+def compute_liquidable_debts(
+    loan_states: pandas.DataFrame,
+    liquidation_prices: numpy.ndarray,
+    collateral_token_price: float,
+    compute_liquidable_debt_at_price: Callable[[pandas.DataFrame, float], decimal.Decimal | float],
+) -> pandas.DataFrame:
+    """
+    Computes amounts of debt liquidated at the price levels of `get_token_range`, i.e. the differences of the
+    liquidable debt between consecutive price levels. The liquidable debt at each price level is computed by the
+    protocol's `compute_liquidable_debt_at_price` for the loans which can be liquidable at the level only. These are
+    found with a binary search in the loans sorted by their liquidation price, loans without a liquidation price are
+    evaluated at every level.
+
+    Args:
+    - loan_states (pandas.DataFrame): Loan states as expected by `compute_liquidable_debt_at_price`.
+    - liquidation_prices (numpy.ndarray): Liquidation prices of the loans computed by `compute_liquidation_prices`.
+    - collateral_token_price (float): Current price of the collateral token.
+    - compute_liquidable_debt_at_price (Callable): Computes the debt to be liquidated of the given loan states at the
+    given collateral token price.
+
+    Returns:
+    - pandas.DataFrame: Price levels with the amounts of debt liquidated at them.
+    """
+    liquidable_debts = pandas.DataFrame(
+        {
+            "collateral_token_price": get_token_range(collateral_token_price),
+        }
+    )
+    prices = liquidable_debts['collateral_token_price'].to_numpy(dtype=float)
+    has_liquidation_price = ~numpy.isnan(liquidation_prices)
+    sorted_positions = numpy.flatnonzero(has_liquidation_price)[
+        numpy.argsort(liquidation_prices[has_liquidation_price], kind='stable')
+    ]
+    other_positions = numpy.flatnonzero(~has_liquidation_price)
+    # The closed-form liquidation prices may differ from the protocol's computation by rounding errors, so loans
+    # slightly below the price level are evaluated as well.
+    starts = numpy.searchsorted(
+        liquidation_prices[sorted_positions],
+        prices * (1 - LIQUIDATION_PRICE_TOLERANCE),
+        side='left',
+    )
+
+    liquidable_debt = []
+    for price, start in zip(prices, starts):
+        positions = numpy.concatenate([sorted_positions[start:], other_positions])
+        if not len(positions):
+            liquidable_debt.append(0.0)
+            continue
+        liquidable_debt.append(compute_liquidable_debt_at_price(loan_states.iloc[positions].copy(), price))
+    liquidable_debts['amount'] = pandas.Series(liquidable_debt, dtype=float).diff().abs()
+    return liquidable_debts
+
+
 async def get_bank(
     client: solana.rpc.async_api.AsyncClient,
     token: str,
@@ -302,13 +390,6 @@ async def process_marginfi_loan_states(
 
         collateral_token_price = token_prices[collateral_token]
 
-        # Compute liqidable debt.
-        liquidable_debts = pandas.DataFrame(
-            {
-                "collateral_token_price": src.visualizations.main_chart.get_token_range(collateral_token_price),
-            }
-        )
-
         collateral_token_columns = [
             f'collateral_{x}'
             for x in underlying_to_bank_mapping[collateral_token]
@@ -322,17 +403,38 @@ async def process_marginfi_loan_states(
             & loan_states[debt_token_columns].sum(axis = 1).astype(bool)
         ]
 
-        liquidable_debt = liquidable_debts['collateral_token_price'].apply(
-            lambda x: src.loans.marginfi.compute_liquidable_debt_at_price(
-                loan_states = relevant_loan_states.copy(),
+        # Holdings of the collateral token, both deposited and borrowed, change with its price.
+        collateral_token_debt_columns = [
+            f'risk_adjusted_debt_usd_{x}'
+            for x in collateral_banks
+            if f'risk_adjusted_debt_usd_{x}' in relevant_loan_states.columns
+        ]
+        liquidation_prices = compute_liquidation_prices(
+            collateral_usd = relevant_loan_states['risk_adjusted_collateral_usd'].to_numpy(dtype = float),
+            collateral_token_usd = relevant_loan_states[
+                [f'risk_adjusted_collateral_usd_{x}' for x in collateral_banks]
+            ].sum(axis = 1).to_numpy(dtype = float),
+            debt_usd = relevant_loan_states['risk_adjusted_debt_usd'].to_numpy(dtype = float),
+            collateral_token_debt_usd = relevant_loan_states[collateral_token_debt_columns].sum(axis = 1).to_numpy(
+                dtype = float,
+            ),
+            collateral_token_price = collateral_token_price,
+        )
+
+        # Compute liqidable debt.
+        liquidable_debts = compute_liquidable_debts(
+            loan_states = relevant_loan_states,
+            liquidation_prices = liquidation_prices,
+            collateral_token_price = collateral_token_price,
+            compute_liquidable_debt_at_price = lambda loans, price: src.loans.marginfi.compute_liquidable_debt_at_price(
+                loan_states = loans,
                 token_prices = token_prices,
-                underlying_to_bank_mapping=underlying_to_bank_mapping,
+                underlying_to_bank_mapping = underlying_to_bank_mapping,
                 underlying_collateral = collateral_token,
-                target_underlying_collateral_price = x,
+                target_underlying_collateral_price = price,
                 underlying_debt = debt_token,
-            )
+            ),
         )
-        liquidable_debts['amount'] = liquidable_debt.diff().abs()
         liquidable_debts['protocol'] = PROTOCOL
         liquidable_debts['slot'] = loan_states['slot'].max()
         liquidable_debts['collateral_token'] = collateral_token
@@ -416,6 +518,8 @@ def process_mango_loan_states(loan_states: pandas.DataFrame) -> pandas.DataFrame
         )
         debt_tokens_with_prices.append(debt_token)
 
+    collateral_usd_columns = [f'collateral_usd_{x}' for x in collateral_tokens_with_price]
+    debt_usd_columns = [f'debt_usd_{x}' for x in debt_tokens_with_prices]
     for collateral_token, debt_token in itertools.product(collateral_tokens_with_price, debt_tokens_with_prices):
         if collateral_token == debt_token:
             continue
@@ -428,22 +532,28 @@ def process_mango_loan_states(loan_states: pandas.DataFrame) -> pandas.DataFrame
             )
         )
         collateral_token_price = token_prices[collateral_token]
-        
-        data = pandas.DataFrame(
-            {
-                "collateral_token_price": src.visualizations.main_chart.get_token_range(collateral_token_price),
-            }
+
+        # Only the deposits of the collateral token change with its price.
+        liquidation_prices = compute_liquidation_prices(
+            collateral_usd = loan_states[collateral_usd_columns].sum(axis = 1).to_numpy(dtype = float),
+            collateral_token_usd = loan_states[f'collateral_usd_{collateral_token}'].to_numpy(dtype = float),
+            debt_usd = loan_states[debt_usd_columns].sum(axis = 1).to_numpy(dtype = float),
+            collateral_token_debt_usd = numpy.zeros(len(loan_states)),
+            collateral_token_price = collateral_token_price,
         )
-        liquidable_debt = data['collateral_token_price'].apply(
-            lambda x: src.loans.mango.compute_liquidable_debt_at_price(
-                loan_states = loan_states.copy(),
+
+        data = compute_liquidable_debts(
+            loan_states = loan_states,
+            liquidation_prices = liquidation_prices,
+            collateral_token_price = collateral_token_price,
+            compute_liquidable_debt_at_price = lambda loans, price: src.loans.mango.compute_liquidable_debt_at_price(
+                loan_states = loans,
                 token_prices = token_prices,
                 collateral_token = collateral_token,
-                target_collateral_token_price = x,
+                target_collateral_token_price = price,
                 debt_token = debt_token,
-            )
+            ),
         )
-        data['amount'] = liquidable_debt.diff().abs()
         data['protocol'] = protocol
         data['slot'] = loan_states['slot'].max()
         data['collateral_token'] = collateral_token
@@ -474,23 +584,39 @@ def process_kamino_loan_states(loan_states: list[KaminoLoanStates]) -> pandas.Da
             loan_states = df_new.loc[users].copy()
             collateral_token_price = state.get_price_for(collateral_token)
 
-            liquidable_debt_data = pandas.DataFrame(
-                {
-                    "collateral_token_price": get_token_range(collateral_token_price)
-                }
+            liquidation_prices = compute_liquidation_prices(
+                collateral_usd=loan_states[
+                    [x for x in loan_states.columns if 'collateral_usd_risk_adjusted_' in x]
+                ].sum(axis=1).to_numpy(dtype=float),
+                collateral_token_usd=loan_states[
+                    [f'collateral_usd_risk_adjusted_{x}' for x in ctokens]
+                ].sum(axis=1).to_numpy(dtype=float),
+                debt_usd=loan_states[
+                    [x for x in loan_states.columns if 'debt_usd_risk_adjusted_' in x]
+                ].sum(axis=1).to_numpy(dtype=float),
+                collateral_token_debt_usd=(
+                    loan_states[f'debt_usd_risk_adjusted_{collateral_token}'].to_numpy(dtype=float)
+                    if f'debt_usd_risk_adjusted_{collateral_token}' in loan_states.columns
+                    else numpy.zeros(len(loan_states))
+                ),
+                collateral_token_price=collateral_token_price,
             )
 
-            liquidable_debt = liquidable_debt_data['collateral_token_price'].apply(
-                lambda x: src.loans.kamino.compute_liquidable_debt_for_price_target(
-                    loan_states=loan_states.copy(),
-                    target_price=x,
-                    debt_token=debt_token,
-                    collateral_mints=ctokens,
-                    original_price=collateral_token_price,
-                    collateral_underlying_token=collateral_token
-                )
+            liquidable_debt_data = compute_liquidable_debts(
+                loan_states=loan_states,
+                liquidation_prices=liquidation_prices,
+                collateral_token_price=collateral_token_price,
+                compute_liquidable_debt_at_price=(
+                    lambda loans, price: src.loans.kamino.compute_liquidable_debt_for_price_target(
+                        loan_states=loans,
+                        target_price=price,
+                        debt_token=debt_token,
+                        collateral_mints=ctokens,
+                        original_price=collateral_token_price,
+                        collateral_underlying_token=collateral_token,
+                    )
+                ),
             )
-            liquidable_debt_data['amount'] = liquidable_debt.diff().abs()
             liquidable_debt_data['protocol'] = 'kamino'
             liquidable_debt_data['slot'] = loan_states['slot'].max()
             liquidable_debt_data['collateral_token'] = collateral_token
@@ -527,23 +653,39 @@ def process_solend_loan_states(loan_states: pandas.DataFrame) -> None:
             loan_states = df_new.loc[users].copy()
             collateral_token_price = state.get_price_for(collateral_token)
 
-            liquidable_debt_data = pandas.DataFrame(
-                {
-                    "collateral_token_price": get_token_range(collateral_token_price)
-                }
+            liquidation_prices = compute_liquidation_prices(
+                collateral_usd=loan_states[
+                    [x for x in loan_states.columns if 'collateral_usd_risk_adjusted_' in x]
+                ].sum(axis=1).to_numpy(dtype=float),
+                collateral_token_usd=loan_states[
+                    [f'collateral_usd_risk_adjusted_{x}' for x in ctokens]
+                ].sum(axis=1).to_numpy(dtype=float),
+                debt_usd=loan_states[
+                    [x for x in loan_states.columns if 'debt_usd_risk_adjusted_' in x]
+                ].sum(axis=1).to_numpy(dtype=float),
+                collateral_token_debt_usd=(
+                    loan_states[f'debt_usd_risk_adjusted_{collateral_token}'].to_numpy(dtype=float)
+                    if f'debt_usd_risk_adjusted_{collateral_token}' in loan_states.columns
+                    else numpy.zeros(len(loan_states))
+                ),
+                collateral_token_price=collateral_token_price,
             )
 
-            liquidable_debt = liquidable_debt_data['collateral_token_price'].apply(
-                lambda x: compute_liquidable_debt_for_price_target(
-                    loan_states=loan_states.copy(),
-                    target_price=x,
-                    debt_token=debt_token,
-                    collateral_mints=ctokens,
-                    original_price=collateral_token_price,
-                    collateral_underlying_token=collateral_token
-                )
+            liquidable_debt_data = compute_liquidable_debts(
+                loan_states=loan_states,
+                liquidation_prices=liquidation_prices,
+                collateral_token_price=collateral_token_price,
+                compute_liquidable_debt_at_price=(
+                    lambda loans, price: compute_liquidable_debt_for_price_target(
+                        loan_states=loans,
+                        target_price=price,
+                        debt_token=debt_token,
+                        collateral_mints=ctokens,
+                        original_price=collateral_token_price,
+                        collateral_underlying_token=collateral_token,
+                    )
+                ),
             )
-            liquidable_debt_data['amount'] = liquidable_debt.diff().abs()
             liquidable_debt_data['protocol'] = 'solend'
             liquidable_debt_data['slot'] = loan_states['slot'].max()
             liquidable_debt_data['collateral_token'] = collateral_token
@@ -705,6 +847,7 @@ def store_liquidable_debts(df: pandas.DataFrame, protocol: Protocol, session: Se
         )
         session.add(liquidable_debts)
     session.commit()
+    REGISTRY.inc(ROWS_WRITTEN, len(df), table=model.__tablename__)
 
 
 def fetch_marginfi_health_ratios(session: Session) -> pandas.DataFrame:
@@ -800,6 +943,7 @@ def fetch_liquidable_debts(protocol: Protocol, session: Session) -> pandas.DataF
     )
 
 
+@log_performance_time(LOGGER, stage='liquidable_debts')
 def process_loan_states_to_liquidable_debts(
     protocol: Protocol,
     process_function: Callable[
@@ -808,33 +952,36 @@ def process_loan_states_to_liquidable_debts(
     ],
     session: Session,
 ):
-    current_liquidable_debts = fetch_liquidable_debts(protocol, session)
-    current_liquidable_debts_slot = 0
-    if len(current_liquidable_debts) > 0:
-        current_liquidable_debts_slot = int(current_liquidable_debts["slot"].max())
+    # Compare the slots first, so that the loan states are fetched only if they are newer than the liquidable debts.
+    current_liquidable_debts_slot = session.query(func.max(protocol_to_model(protocol).slot)).scalar() or 0
+    _, loan_states_model = src.loans.loan_state.protocol_to_model(protocol)
+    current_loan_states_slot = session.query(func.max(loan_states_model.slot)).scalar() or 0
+    if current_liquidable_debts_slot and current_liquidable_debts_slot >= current_loan_states_slot:
+        LOGGER.info(
+            f"Liquidable debts are up to date with {protocol} loan states at slot = {current_loan_states_slot}."
+        )
+        return
 
     current_loan_states = src.loans.loan_state.fetch_loan_states(protocol, session)
-    current_loan_states_slot = 0
-    if len(current_liquidable_debts) > 0:
-        current_loan_states_slot = int(current_loan_states["slot"].max())
-
-    if not current_liquidable_debts_slot or current_liquidable_debts_slot < current_loan_states_slot:
-        if protocol == MARGINFI:
-            current_health_ratios = fetch_marginfi_health_ratios(session)
-            asyncio.run(process_function(current_loan_states, current_health_ratios))
-        else:
-            process_function(current_loan_states)
+    if protocol == MARGINFI:
+        current_health_ratios = fetch_marginfi_health_ratios(session)
+        asyncio.run(process_function(current_loan_states, current_health_ratios))
+    else:
+        process_function(current_loan_states)
 
 
 def process_loan_states_continuously(protocol: Protocol):
+    """
+    Processes loan states to liquidable debts whenever new loan states of the protocol are stored, and at least every
+    `LOAN_STATES_POLL_INTERVAL` seconds.
+    """
     logging.info("Starting loan states to liquidable debts processing.")
     session = get_db_session()
 
     process_func = protocol_to_process_func(protocol)
 
-    while True:
-        start_time = time.time()
+    for _ in src.loans.loan_state.wait_for_loan_states(protocol, timeout=LOAN_STATES_POLL_INTERVAL):
         process_loan_states_to_liquidable_debts(protocol, process_func, session)
+        # Do not keep the transaction open while waiting for new loan states.
+        session.commit()
         logging.info("Updated liquidable debts.")
-        processing_time = time.time() - start_time
-        time.sleep(max(0, 900 - processing_time))
@@ -1,9 +1,15 @@
-from typing import Callable, Literal, Type, TypeVar
+from typing import Callable, Iterator, Literal, Type, TypeVar
+import hashlib
+import json
 import logging
+import select
 import time
+import traceback
 
 import pandas
+import psycopg2
 import sqlalchemy
+import sqlalchemy.dialects.postgresql
 import sqlalchemy.orm.session
 
 from db import (
@@ -15,7 +21,9 @@ from db import (
     MarginfiParsedTransactionsV2,
     KaminoParsedTransactionsV2,
     SolendParsedTransactions,
+    LoanStateHashes,
     get_db_session,
+    CONN_STRING,
     MangoLoanStatesEA, SolendLoanStatesEA, KaminoLoanStatesEA, MarginfiLoanStatesEA, SCHEMA_LENDERS
 )
 import src.loans.kamino
@@ -32,6 +40,11 @@ MANGO = "mango"
 KAMINO = "kamino"
 SOLEND = "solend"
 
+# Number of loan states inserted at once.
+LOAN_STATES_BATCH_SIZE = 10_000
+# Postgres channel notified with the protocol whenever new loan states are stored for easy access.
+LOAN_STATES_CHANNEL = "loan_states"
+
 Protocol = Literal["marginfi", "mango", "kamino", "solend"]
 AnyEvents = list[
     MangoParsedEvents
@@ -112,22 +125,35 @@ def protocol_to_model(protocol: Protocol) -> AnyProtocolModel:
     raise ValueError(f"invalid protocol {protocol}")
 
 
-def widen_loan_states(loan_states: pandas.DataFrame) -> pandas.DataFrame:
-    if loan_states.empty:
-        return pandas.DataFrame(
-            columns=['protocol', 'slot', 'user', 'collateral_keys', 'collateral_values', 'debt_keys', 'debt_values'],
-        )
-    loan_states = loan_states.copy()
-    for column in ['collateral', 'debt']:
-        loan_states[f'{column}_keys'] = loan_states[column].apply(lambda x: tuple(sorted(x.keys())))
-        loan_states[f'{column}_values'] = loan_states[column].apply(lambda x: tuple(sorted(x.values())))
-    loan_states.drop(columns = ['collateral', 'debt'], inplace = True)
-    return loan_states
+def get_loan_state_hash(collateral: dict, debt: dict) -> str:
+    """
+    Computes a content hash of the loan state, independent of the order of tokens.
+    """
+    content = json.dumps({"collateral": collateral, "debt": debt}, sort_keys=True, default=str)
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+def fetch_loan_state_hashes(protocol: Protocol, session: sqlalchemy.orm.session.Session) -> dict[str, str]:
+    """
+    Fetches content hashes of the latest stored loan states of all users of the protocol.
+    """
+    query = sqlalchemy.select(LoanStateHashes.user, LoanStateHashes.content_hash).where(
+        LoanStateHashes.protocol == protocol
+    )
+    return dict(session.execute(query).tuples().all())
 
 
-def store_loan_states(df: pandas.DataFrame, protocol: Protocol, session: sqlalchemy.orm.session.Session):
+def store_loan_states(
+    df: pandas.DataFrame,
+    protocol: Protocol,
+    session: sqlalchemy.orm.session.Session,
+    record_deletions: bool = True,
+):
     """
-    Stores data from a pandas DataFrame to the loan_states table.
+    Stores new and changed loan states from a pandas DataFrame to the loan_states table. Loan states are compared
+    with the latest stored ones by their content hash, unchanged loan states are skipped. Users whose loan states
+    are stored but missing in the DataFrame are recorded as deleted, i.e. with empty collateral and debt and
+    `is_disabled` set.
 
     Args:
     - df (pandas.DataFrame): A DataFrame with the following columns:
@@ -138,20 +164,70 @@ def store_loan_states(df: pandas.DataFrame, protocol: Protocol, session: sqlalch
         - debt (json/dict): JSON or dictionary representing debt.
 
     - session (sqlalchemy.orm.session.Session): A SQLAlchemy session object.
+    - record_deletions (bool): Whether the DataFrame contains all loan states of the protocol, so that missing users
+        are recorded as deleted.
     """
+    if df.empty:
+        LOGGER.warning(f"No {protocol} loan states to store.")
+        if not record_deletions:
+            return
+        df = pandas.DataFrame(columns=["slot", "protocol", "user", "collateral", "debt"])
 
     model, _ = protocol_to_model(protocol)
+    stored_hashes = fetch_loan_state_hashes(protocol, session)
+
+    changed_loan_states = []
+    changed_hashes = []
+    for slot, user, collateral, debt in df[["slot", "user", "collateral", "debt"]].itertuples(index=False):
+        content_hash = get_loan_state_hash(collateral, debt)
+        if stored_hashes.get(user) == content_hash:
+            continue
+        changed_loan_states.append(
+            {"slot": int(slot), "protocol": protocol, "user": user, "collateral": collateral, "debt": debt}
+        )
+        changed_hashes.append({"protocol": protocol, "user": user, "slot": int(slot), "content_hash": content_hash})
+
+    deleted_users = []
+    if record_deletions:
+        deleted_users = list(stored_hashes.keys() - set(df["user"]))
+        if df.empty:
+            # All loans of the protocol disappeared, record them as deleted at the latest stored slot.
+            slot = session.execute(
+                sqlalchemy.select(sqlalchemy.func.max(LoanStateHashes.slot)).where(
+                    LoanStateHashes.protocol == protocol
+                )
+            ).scalar() or 0
+        else:
+            slot = int(df["slot"].max())
+        changed_loan_states.extend(
+            {"slot": slot, "protocol": protocol, "user": user, "collateral": {}, "debt": {}, "is_disabled": True}
+            for user in deleted_users
+        )
 
-    for _, row in df.iterrows():
-        loan_state = model(
-            slot=row["slot"],
-            protocol=row["protocol"],
-            user=row["user"],
-            collateral=row["collateral"],
-            debt=row["debt"],
+    for ix in range(0, len(changed_loan_states), LOAN_STATES_BATCH_SIZE):
+        session.bulk_insert_mappings(model, changed_loan_states[ix:ix + LOAN_STATES_BATCH_SIZE])
+    for ix in range(0, len(changed_hashes), LOAN_STATES_BATCH_SIZE):
+        insert_stmt = sqlalchemy.dialects.postgresql.insert(LoanStateHashes).values(
+            changed_hashes[ix:ix + LOAN_STATES_BATCH_SIZE]
+        )
+        session.execute(
+            insert_stmt.on_conflict_do_update(
+                index_elements=[LoanStateHashes.protocol, LoanStateHashes.user],
+                set_={"slot": insert_stmt.excluded.slot, "content_hash": insert_stmt.excluded.content_hash},
+            )
+        )
+    for ix in range(0, len(deleted_users), LOAN_STATES_BATCH_SIZE):
+        session.execute(
+            sqlalchemy.delete(LoanStateHashes).where(
+                LoanStateHashes.protocol == protocol,
+                LoanStateHashes.user.in_(deleted_users[ix:ix + LOAN_STATES_BATCH_SIZE]),
+            )
         )
-        session.add(loan_state)
     session.commit()
+    LOGGER.info(
+        f"Stored {len(changed_hashes)} new or changed and {len(deleted_users)} deleted {protocol} loan states, "
+        f"{len(df) - len(changed_hashes)} loan states are unchanged."
+    )
 
 
 def store_loan_states_for_easy_access(df: pandas.DataFrame, protocol: Protocol) -> str:
@@ -173,6 +249,7 @@ def store_loan_states_for_easy_access(df: pandas.DataFrame, protocol: Protocol)
             # Insert new data from DataFrame
             session.bulk_insert_mappings(model, df.to_dict(orient='records'))
             LOGGER.info(f"New data inserted into the table {SCHEMA_LENDERS}.{table_name}")
+            notify_loan_states_stored(protocol, session)
 
             # Commit the transaction
             session.commit()
@@ -186,6 +263,54 @@ def store_loan_states_for_easy_access(df: pandas.DataFrame, protocol: Protocol)
     return table_name
 
 
+def notify_loan_states_stored(protocol: Protocol, session: sqlalchemy.orm.session.Session) -> None:
+    """
+    Notifies listeners of `LOAN_STATES_CHANNEL` that new loan states of the protocol are stored. The notification is
+    delivered when the session is committed, i.e. only once the loan states are visible.
+    """
+    session.execute(sqlalchemy.select(sqlalchemy.func.pg_notify(LOAN_STATES_CHANNEL, protocol)))
+
+
+def wait_for_loan_states(protocol: Protocol, timeout: float) -> Iterator[None]:
+    """
+    Yields once immediately and then whenever new loan states of the protocol are stored, as notified on
+    `LOAN_STATES_CHANNEL`. Notifications received while the caller is processing are merged into one. The generator
+    also yields after `timeout` seconds without a notification and after reconnecting, so that loan states stored
+    while no notification could be received are not missed.
+
+    Args:
+    - protocol (str): Protocol to wait for.
+    - timeout (float): Maximum time in seconds between two yields.
+    """
+    yield
+    engine = sqlalchemy.create_engine(CONN_STRING)
+    while True:
+        try:
+            connection = engine.raw_connection()
+            try:
+                listener = connection.driver_connection
+                listener.autocommit = True
+                with listener.cursor() as cursor:
+                    cursor.execute(f"LISTEN {LOAN_STATES_CHANNEL};")
+                while True:
+                    if select.select([listener], [], [], timeout) == ([], [], []):
+                        LOGGER.info(f"No new {protocol} loan states in {timeout} seconds.")
+                        yield
+                        continue
+                    listener.poll()
+                    notified = any(notify.payload == protocol for notify in listener.notifies)
+                    listener.notifies.clear()
+                    if notified:
+                        yield
+            finally:
+                connection.close()
+        except (sqlalchemy.exc.OperationalError, psycopg2.OperationalError) as e:
+            LOGGER.error("OperationalError occured: %s. Waiting 120 to retry."
+                         "\n Exception occurred: %s", str(e), traceback.format_exc())
+            time.sleep(120)
+            yield
+
+
 def fetch_loan_states(protocol: Protocol, session: sqlalchemy.orm.session.Session) -> pandas.DataFrame:
     """
     Fetches loan states with the max slot from the DB and returns them as a DataFrame
@@ -283,7 +408,7 @@ def process_events_to_loan_states(
         # initial_loan_states=current_loan_states,
     )
     state.get_unprocessed_events()
-    logging.info('The number of unprocessed events = {} for protocol = {}.'.format(len(state.unprocessed_events), protocol))
+    logging.info('Processing unprocessed events for protocol = {}.'.format(protocol))
     state.process_unprocessed_events()
     logging.info('The number of loan entities = {} for protocol = {}.'.format(len(state.loan_entities), protocol))
     new_loan_states = pandas.DataFrame(
@@ -291,29 +416,16 @@ def process_events_to_loan_states(
             'protocol': [state.protocol for _ in state.loan_entities.keys()],
             'slot': [state.last_slot for _ in state.loan_entities.keys()],
             'user': list(state.loan_entities),
-            'collateral': [
-                {token: float(amount) for token, amount in loan.collateral.items()}
-                for loan in state.loan_entities.values()
-            ],
-            'debt': [{token: float(amount) for token, amount in loan.debt.items()} for loan in state.loan_entities.values()],
+            'collateral': [loan.collateral.to_floats() for loan in state.loan_entities.values()],
+            'debt': [loan.debt.to_floats() for loan in state.loan_entities.values()],
         }
     )
     easy_access_table_name = store_loan_states_for_easy_access(new_loan_states, protocol)
     logging.info(f"New loan states are available in {easy_access_table_name}")
 
     if state.last_slot > min_slot:
-        new_loan_states_wide = widen_loan_states(new_loan_states)
-        current_loan_states_wide = widen_loan_states(current_loan_states)
-        columns = ['protocol', 'user', 'collateral_keys', 'collateral_values', 'debt_keys', 'debt_values']
-        changed_loan_states_users = pandas.concat(
-            [
-                new_loan_states_wide[columns],
-                current_loan_states_wide[columns],
-            ],
-        ).drop_duplicates(keep=False)['user'].unique()
-        changed_loan_states = new_loan_states[new_loan_states['user'].isin(changed_loan_states_users)]
         with get_db_session() as session:
-            store_loan_states(changed_loan_states, protocol, session)
+            store_loan_states(new_loan_states, protocol, session)
 
 
 def process_events_continuously(protocol: Protocol):
@@ -5,7 +5,6 @@ import itertools
 import time
 from decimal import Decimal
 
-import requests
 import pandas as pd
 import sqlalchemy
 from solders.pubkey import Pubkey
@@ -60,16 +59,16 @@ OPEN_ORDERS_LAYOUT = cStruct(
 # =============================================================================================
 
 
+# Maximum number of accounts fetched with one `getMultipleAccounts` request.
+OPEN_ORDERS_BATCH_SIZE = 100
+
+
 def get_group_token_index_to_index_map():
-    r = requests.get('https://api.mngo.cloud/data/v4/group-metadata')
-    if r.status_code != 200:
-        time.sleep(100)
-        logging.error('Cant fecht group token index to index map')
-        return get_group_token_index_to_index_map()
-    
+    group_metadata = src.mango_token_params_map.get_group_metadata()
+
     m = {}
 
-    for group in r.json()['groups']:
+    for group in group_metadata['groups']:
         indexes = {}
         for token in group['tokens']:
             info = {
@@ -86,7 +85,8 @@ class MangoLoanEntity(src.loans.state.LoanEntity):
     """ A class that describes the Mango loan entity. """
 
     def __init__(self) -> None:
-        super().__init__()
+        # Positions are stored as fixed-point numbers with 48 fractional bits.
+        super().__init__(scale_bits=48)
 
 class MangoState(src.loans.state.State):
     """
@@ -109,13 +109,7 @@ class MangoState(src.loans.state.State):
         self.group_token_index_map = get_group_token_index_to_index_map()
 
     def get_groups(self) -> list[Pubkey]:
-        response = requests.get('https://api.mngo.cloud/data/v4/group-metadata')
-        if response.status_code != 200:
-            print('MANGO: Unable to fetch groups')
-            time.sleep(20)
-            return self.get_groups()
-
-        info = [i for i in response.json()['groups'] if i['name'] == 'MAINNET.0']
+        info = [i for i in src.mango_token_params_map.get_group_metadata()['groups'] if i['name'] == 'MAINNET.0']
         return [ Pubkey.from_string(i['publicKey']) for i in info]
 
 
@@ -159,8 +153,42 @@ class MangoState(src.loans.state.State):
         raise NotImplementedError('IMPLEMENT ME')
         pass
 
+    def fetch_open_orders(self, open_orders: list[Pubkey]) -> dict[Pubkey, bytes]:
+        """
+        Fetches data of Serum open orders accounts with `getMultipleAccounts` requests of up to
+        `OPEN_ORDERS_BATCH_SIZE` accounts. Accounts which could not be fetched are missing in the result.
+        """
+        open_orders = list(dict.fromkeys(open_orders))
+        fetched_open_orders = {}
+        for ix in range(0, len(open_orders), OPEN_ORDERS_BATCH_SIZE):
+            batch = open_orders[ix:ix + OPEN_ORDERS_BATCH_SIZE]
+            accounts = None
+            for i in range(3):
+                try:
+                    accounts = self.client.get_multiple_accounts(batch).value
+                    break
+                except SolanaRpcException:
+                    time.sleep(i * 20)
+
+            if accounts is None:
+                logging.error(f'Unable to fetch {len(batch)} serum orders starting with {batch[0]}')
+                continue
+
+            for pubkey, account in zip(batch, accounts):
+                if account is not None:
+                    fetched_open_orders[pubkey] = account.data
+        logging.info(f'Fetched {len(fetched_open_orders)} of {len(open_orders)} serum orders')
+        return fetched_open_orders
+
     def process_unprocessed_events(self):
-        
+        # Fetch all Serum open orders accounts at once.
+        fetched_open_orders = self.fetch_open_orders([
+            order.open_orders
+            for _, account in self.accounts
+            for order in account.serum3
+            if order.market_index != 65535
+        ])
+
         for account_pubkey, account in self.accounts:
             mango_group = str(account.group)
             mango_account = str(account_pubkey)
@@ -184,15 +212,14 @@ class MangoState(src.loans.state.State):
                     continue
 
                 mint_address = mint['mint']
-                position_index = Decimal(token.indexed_position.val) / 2**48
-                index = Decimal(token.previous_index.val) / 2**48
-                position = position_index * index
+                # Both the indexed position and the index have 48 fractional bits, so does the raw position.
+                position = (token.indexed_position.val * token.previous_index.val) >> 48
 
                 if position > 0:
-                    self.loan_entities[mango_account].collateral.set_value(token=mint_address, value=position)
+                    self.loan_entities[mango_account].collateral.set_raw(token=mint_address, raw=position)
 
                 elif position < 0:
-                    self.loan_entities[mango_account].debt.set_value(token=mint_address, value=abs(position))
+                    self.loan_entities[mango_account].debt.set_raw(token=mint_address, raw=-position)
 
                 else:
                     continue
@@ -219,22 +246,13 @@ class MangoState(src.loans.state.State):
                     logging.info(f'Unable to find quote token index map for index {order.quote_token_index}')
                     continue
                 
-                fetched_order = None
-
-                for i in range(3):
-                    try:
-                        # Fetch Serum order account info
-                        fetched_order = self.client.get_account_info(order.open_orders)
-                        break
-                    except SolanaRpcException: 
-                        time.sleep(i * 20)
-
+                fetched_order = fetched_open_orders.get(order.open_orders)
                 if fetched_order is None:
                     logging.error(f'Unable to fetch serum order {order.open_orders} for account: {mango_account}')
                     continue
 
                 # Parse Serum order
-                parsed_order = OPEN_ORDERS_LAYOUT.parse(fetched_order.value.data)
+                parsed_order = OPEN_ORDERS_LAYOUT.parse(fetched_order)
                 if parsed_order is None:
                     logging.error(f'Unable to parse serum order {order.open_orders} for account: {mango_account}')
                     continue
@@ -259,8 +277,8 @@ class MangoState(src.loans.state.State):
                 'protocol': [self.protocol for _ in self.loan_entities.keys()],
                 'slot': [self.last_slot for _ in self.loan_entities.keys()],
                 'user': [user for user in self.loan_entities],
-                'collateral': [{token: float(amount) for token, amount in loan.collateral.items()} for loan in self.loan_entities.values()],
-                'debt': [{token: float(amount) for token, amount in loan.debt.items()} for loan in self.loan_entities.values()],
+                'collateral': [loan.collateral.to_floats() for loan in self.loan_entities.values()],
+                'debt': [loan.debt.to_floats() for loan in self.loan_entities.values()],
             }
         )
         health_ratio_df = get_mango_health_ratio_df(loan_state_df)
@@ -309,31 +327,34 @@ class MangoState(src.loans.state.State):
                 raise
 
 
-def liq_debt(x: pd.Series, collateral_collumn: str, debt_collumn: str) -> float:
-    if x['health'] > 0:
-        return 0
-    coll_debt_diff = x[collateral_collumn] - x[debt_collumn]
-
-    if coll_debt_diff < 0:
-        # Means debt was higher than collateral, so the maximum that
-        # can be liquidated is all of collateral
-        return x[collateral_collumn]
-
-    # In this case the collateral is higher than debt we need to liquidate
-    # the amount that would bring the overall health above 0 
-
+def liq_debt(loan_states: pd.DataFrame, collateral_collumn: str, debt_collumn: str) -> pd.Series:
+    """ Computes debt to be liquidated of every loan. """
     # assets / borrows - 1 = health ie -> 100 / 150 - 1 = -0.33
     # we need to bring borrows to 100 -> multiply borrows by health
-    # so we get abs(150 * -0.33) -> 50 and that's amount that need to be 
+    # so we get abs(150 * -0.33) -> 50 and that's amount that need to be
     # liquidated to bring borrows back to 100 (so health will be >=0)
-    liquidation_needed_for_good_health = abs(x['debt_usd'] * x['health'])
-
-    # if liquidation needed is higher then debt then return debt as that the 
-    # max that can be liquidated in current loan, else just liquidation needed
-    if liquidation_needed_for_good_health > x[debt_collumn]:
-        return x[debt_collumn]
-    
-    return liquidation_needed_for_good_health
+    liquidation_needed_for_good_health = (loan_states['debt_usd'] * loan_states['health']).abs()
+    return pd.Series(
+        np.where(
+            loan_states['health'] > 0,
+            0,
+            np.where(
+                # Means debt was higher than collateral, so the maximum that
+                # can be liquidated is all of collateral
+                loan_states[collateral_collumn] - loan_states[debt_collumn] < 0,
+                loan_states[collateral_collumn],
+                # if liquidation needed is higher then debt then return debt as that the
+                # max that can be liquidated in current loan, else just liquidation needed
+                np.where(
+                    liquidation_needed_for_good_health > loan_states[debt_collumn],
+                    loan_states[debt_collumn],
+                    liquidation_needed_for_good_health,
+                ),
+            ),
+        ),
+        index = loan_states.index,
+        dtype = float,
+    )
 
 
 def compute_liquidable_debt_at_price(
@@ -363,7 +384,7 @@ def compute_liquidable_debt_at_price(
     loan_states['health'] = (loan_states['collateral_usd'] / loan_states['debt_usd']) - 1
     loan_states.loc[loan_states['health'] > 1, 'health'] = 1
 
-    loan_states['to_be_liquidated'] = loan_states.apply(lambda x: liq_debt(x, collateral_collumn, debt_collumn), axis = 1)
+    loan_states['to_be_liquidated'] = liq_debt(loan_states, collateral_collumn, debt_collumn)
 
     return loan_states['to_be_liquidated'].sum()
 
@@ -29,11 +29,16 @@ EVENTS_METHODS_MAPPING: dict[str, str] = {
 }
 
 
+# Columns of events read by the event handlers.
+EVENT_COLUMNS: list[str] = ['amount', 'account', 'source', 'destination', 'liquidatee_marginfi_account']
+
+
 def get_events(start_block_number: int = 0) -> pandas.DataFrame:
     return src.loans.helpers.get_events(
         table='lenders.marginfi_parsed_transactions_v5',
         event_names=tuple(EVENTS_METHODS_MAPPING),
         start_block_number=start_block_number,
+        columns=EVENT_COLUMNS,
     )
 
 
@@ -50,7 +55,8 @@ class MarginFiLoanEntity(src.loans.state.LoanEntity):
     """ A class that describes the MarginFi loan entity. """
 
     def __init__(self) -> None:
-        super().__init__()
+        # Balances are stored as shares with 48 fractional bits.
+        super().__init__(scale_bits=48)
 
 
 class MarginFiState(src.loans.state.State):
@@ -121,12 +127,10 @@ class MarginFiState(src.loans.state.State):
                     continue
 
                 token = str(balance.bank_pk)
-                # The amounts provided are raw amounts.
-                collateral_amount = decimal.Decimal(str(balance.asset_shares.value / 2**48))
-                debt_amount = decimal.Decimal(str(balance.liability_shares.value / 2**48))
-
-                self.loan_entities[user].collateral.set_value(token=token, value=collateral_amount)
-                self.loan_entities[user].debt.set_value(token=token, value=debt_amount)
+                # The amounts provided are raw amounts in fixed-point shares with 48 fractional bits, the same as
+                # the portfolios use.
+                self.loan_entities[user].collateral.set_raw(token=token, raw=balance.asset_shares.value)
+                self.loan_entities[user].debt.set_raw(token=token, raw=balance.liability_shares.value)
 
         self.last_slot = int(time.time())
 
@@ -142,7 +146,7 @@ class MarginFiState(src.loans.state.State):
         for _, individual_transfer_event in transfer_event.iterrows():
             user = individual_transfer_event["account"]
             token = individual_transfer_event["destination"]
-            amount = decimal.Decimal(str(individual_transfer_event["amount"]))
+            amount = int(individual_transfer_event["amount"])
             assert amount >= 0
             self.loan_entities[user].collateral.increase_value(token=token, value=amount)
             if user in self.verbose_users:
@@ -160,7 +164,7 @@ class MarginFiState(src.loans.state.State):
         for _, individual_transfer_event in transfer_event.iterrows():
             user = individual_transfer_event["account"]
             token = individual_transfer_event["source"]
-            amount = decimal.Decimal(str(individual_transfer_event["amount"]))
+            amount = int(individual_transfer_event["amount"])
             assert amount >= 0
             self.loan_entities[user].collateral.increase_value(token=token, value=-amount)
             if user in self.verbose_users:
@@ -178,7 +182,7 @@ class MarginFiState(src.loans.state.State):
         for _, individual_transfer_event in transfer_event.iterrows():
             user = individual_transfer_event["account"]
             token = individual_transfer_event["source"]
-            amount = decimal.Decimal(str(individual_transfer_event["amount"]))
+            amount = int(individual_transfer_event["amount"])
             assert amount >= 0
             self.loan_entities[user].debt.increase_value(token=token, value=amount)
             if user in self.verbose_users:
@@ -196,7 +200,7 @@ class MarginFiState(src.loans.state.State):
         for _, individual_transfer_event in transfer_event.iterrows():
             user = individual_transfer_event["account"]
             token = individual_transfer_event["destination"]
-            amount = decimal.Decimal(str(individual_transfer_event["amount"]))
+            amount = int(individual_transfer_event["amount"])
             assert amount >= 0
             self.loan_entities[user].debt.increase_value(token=token, value=-amount)
             if user in self.verbose_users:
@@ -218,7 +222,7 @@ class MarginFiState(src.loans.state.State):
             user = individual_transfer_event["liquidatee_marginfi_account"]
             assert user in self.loan_entities
             debt_token = individual_transfer_event["source"]
-            debt_amount = decimal.Decimal(str(individual_transfer_event["amount"]))
+            debt_amount = int(individual_transfer_event["amount"])
             assert debt_amount >= 0
             self.loan_entities[user].debt.increase_value(token=debt_token, value=-debt_amount)
             if user in self.verbose_users:
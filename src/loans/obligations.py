@@ -0,0 +1,211 @@
+"""
+Decoding of Kamino and Solend obligation accounts into columnar buffers.
+
+Obligation accounts are fetched with `getProgramAccounts` and a data slice covering only the positions, which are
+decoded straight from the raw bytes with fixed `struct` layouts instead of anchorpy/borsh containers. Positions of
+each fetched chunk of accounts are appended to flat columns, so the raw accounts can be released as soon as they are
+decoded. The loan states DataFrame expected by `store_loan_states` and the `State` classes is built from the columns
+once at the end.
+"""
+import array
+import dataclasses
+import functools
+import struct
+from typing import Any, Iterable
+
+import base58
+import pandas
+from solana.rpc.types import DataSliceOpts
+
+
+# Kamino obligation layout (see `kamino_client.accounts.obligation.Obligation`), offsets include the 8 byte
+# discriminator. The slice starts at the deposits and ends with the elevation group.
+KAMINO_DEPOSITS_OFFSET = 96
+KAMINO_BORROWS_OFFSET = 1208
+KAMINO_ELEVATION_GROUP_OFFSET = 2285
+KAMINO_OBLIGATION_SLICE = DataSliceOpts(
+    offset=KAMINO_DEPOSITS_OFFSET,
+    length=KAMINO_ELEVATION_GROUP_OFFSET + 1 - KAMINO_DEPOSITS_OFFSET,
+)
+KAMINO_DEPOSITS_COUNT = 8
+KAMINO_BORROWS_COUNT = 5
+KAMINO_DEPOSIT_SIZE = 136
+KAMINO_BORROW_SIZE = 200
+# deposit_reserve, deposited_amount
+KAMINO_DEPOSIT = struct.Struct("<32sQ")
+# borrow_reserve, cumulative_borrow_rate_bsf.value[0], borrowed_amount_sf (low and high 64 bits)
+KAMINO_BORROW = struct.Struct("<32sQ48xQQ")
+
+# Solend obligation layout: version, last update, lending market, owner, four u128 values and 64 bytes of padding
+# precede the lengths of deposits and borrows followed by 1096 bytes of flat data with deposits and then borrows. The
+# slice starts at the lengths.
+SOLEND_LENGTHS_OFFSET = 202
+SOLEND_OBLIGATION_SLICE = DataSliceOpts(offset=SOLEND_LENGTHS_OFFSET, length=1300 - SOLEND_LENGTHS_OFFSET)
+# deposit reserve, deposited amount, market value, padding
+SOLEND_DEPOSIT = struct.Struct("<32sQ16x32x")
+# borrow reserve, cumulative borrow rate (wads), borrowed amount (wads), market value, padding
+SOLEND_BORROW = struct.Struct("<32s16s16s16x32x")
+
+# Number of accounts decoded at once.
+CHUNK_SIZE = 10_000
+
+
+@functools.lru_cache(maxsize=None)
+def encode_pubkey(pubkey: bytes) -> str:
+    """
+    Encodes a public key to base58. Reserves repeat in almost every obligation, caching the encoding keeps a single
+    string per reserve.
+    """
+    return base58.b58encode(pubkey).decode("utf-8")
+
+
+def decode_u128(data: bytes) -> int:
+    return int.from_bytes(data, byteorder="little")
+
+
+@dataclasses.dataclass
+class ObligationColumns:
+    """
+    Columnar buffers with decoded obligations. Positions refer to their obligation by index to `users`.
+    """
+    users: list[str] = dataclasses.field(default_factory=list)
+    elevation_groups: array.array = dataclasses.field(default_factory=lambda: array.array("B"))
+    collateral_user_ixs: array.array = dataclasses.field(default_factory=lambda: array.array("L"))
+    collateral_reserves: list[str] = dataclasses.field(default_factory=list)
+    collateral_amounts: array.array = dataclasses.field(default_factory=lambda: array.array("Q"))
+    debt_user_ixs: array.array = dataclasses.field(default_factory=lambda: array.array("L"))
+    debt_reserves: list[str] = dataclasses.field(default_factory=list)
+    debt_raw_amounts: array.array = dataclasses.field(default_factory=lambda: array.array("d"))
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    def get_reserves(self) -> set[str]:
+        return set(self.collateral_reserves) | set(self.debt_reserves)
+
+    def add_collateral(self, user_ix: int, reserve: bytes, amount: int):
+        self.collateral_user_ixs.append(user_ix)
+        self.collateral_reserves.append(encode_pubkey(reserve))
+        self.collateral_amounts.append(amount)
+
+    def add_debt(self, user_ix: int, reserve: bytes, raw_amount: float):
+        self.debt_user_ixs.append(user_ix)
+        self.debt_reserves.append(encode_pubkey(reserve))
+        self.debt_raw_amounts.append(raw_amount)
+
+    def to_loan_states(
+        self,
+        slot: int,
+        protocol: str,
+        reserve_to_supply_map: dict[str, Any],
+        with_elevation_group: bool = False,
+    ) -> pandas.DataFrame:
+        """
+        Builds loan states with collateral and debt dicts keyed by collateral and liquidity mints, as expected by
+        `store_loan_states` and the `State` classes.
+
+        Parameters:
+        - slot: Slot at which the obligations were fetched.
+        - protocol: Protocol of the obligations.
+        - reserve_to_supply_map: Dict mapping reserves to their `collateralMint` and `liquidityMint`.
+        - with_elevation_group: Whether to add the elevation group of the obligation to every collateral position.
+
+        Returns:
+        - pandas.DataFrame: Loan states with columns slot, protocol, user, collateral and debt.
+        """
+        collateral: list[dict[str, Any]] = [{} for _ in self.users]
+        for user_ix, reserve, amount in zip(
+            self.collateral_user_ixs, self.collateral_reserves, self.collateral_amounts,
+        ):
+            position = {'amount': amount, 'reserve': reserve}
+            if with_elevation_group:
+                position['elevation_group'] = self.elevation_groups[user_ix]
+            collateral[user_ix][reserve_to_supply_map[reserve]['collateralMint']] = position
+
+        debt: list[dict[str, Any]] = [{} for _ in self.users]
+        for user_ix, reserve, raw_amount in zip(self.debt_user_ixs, self.debt_reserves, self.debt_raw_amounts):
+            debt[user_ix][reserve_to_supply_map[reserve]['liquidityMint']] = {
+                'rawAmount': raw_amount,
+                'reserve': reserve,
+            }
+
+        return pandas.DataFrame(
+            {
+                'slot': slot,
+                'protocol': protocol,
+                'user': self.users,
+                'collateral': collateral,
+                'debt': debt,
+            },
+            columns=['slot', 'protocol', 'user', 'collateral', 'debt'],
+        )
+
+
+def decode_kamino_obligation(columns: ObligationColumns, user: str, data: bytes):
+    """
+    Decodes a Kamino obligation sliced by `KAMINO_OBLIGATION_SLICE` into the columns. Empty positions are skipped.
+    """
+    view = memoryview(data)
+    user_ix = len(columns.users)
+    columns.users.append(user)
+    columns.elevation_groups.append(view[KAMINO_ELEVATION_GROUP_OFFSET - KAMINO_DEPOSITS_OFFSET])
+
+    for ix in range(KAMINO_DEPOSITS_COUNT):
+        reserve, amount = KAMINO_DEPOSIT.unpack_from(view, ix * KAMINO_DEPOSIT_SIZE)
+        if amount:
+            columns.add_collateral(user_ix, reserve, amount)
+
+    borrows_offset = KAMINO_BORROWS_OFFSET - KAMINO_DEPOSITS_OFFSET
+    for ix in range(KAMINO_BORROWS_COUNT):
+        reserve, cumulative_borrow_rate, amount_low, amount_high = KAMINO_BORROW.unpack_from(
+            view, borrows_offset + ix * KAMINO_BORROW_SIZE,
+        )
+        borrowed_amount = amount_low | (amount_high << 64)
+        if borrowed_amount:
+            columns.add_debt(user_ix, reserve, borrowed_amount / cumulative_borrow_rate)
+
+
+def decode_solend_obligation(columns: ObligationColumns, user: str, data: bytes):
+    """
+    Decodes a Solend obligation sliced by `SOLEND_OBLIGATION_SLICE` into the columns.
+    """
+    view = memoryview(data)
+    user_ix = len(columns.users)
+    columns.users.append(user)
+    columns.elevation_groups.append(0)
+
+    deposits_len, borrows_len = view[0], view[1]
+    offset = 2
+    for _ in range(deposits_len):
+        reserve, amount = SOLEND_DEPOSIT.unpack_from(view, offset)
+        columns.add_collateral(user_ix, reserve, amount)
+        offset += SOLEND_DEPOSIT.size
+
+    for _ in range(borrows_len):
+        reserve, cumulative_borrow_rate, borrowed_amount = SOLEND_BORROW.unpack_from(view, offset)
+        columns.add_debt(user_ix, reserve, decode_u128(borrowed_amount) / decode_u128(cumulative_borrow_rate))
+        offset += SOLEND_BORROW.size
+
+
+def decode_obligations(
+    columns: ObligationColumns,
+    accounts: list[Any],
+    protocol: str,
+    chunk_size: int = CHUNK_SIZE,
+):
+    """
+    Decodes fetched obligation accounts into the columns chunk by chunk. Decoded accounts are removed from the list,
+    so that their raw data can be garbage collected while the rest is being decoded.
+
+    Parameters:
+    - columns: Columns to append the obligations to.
+    - accounts: Keyed accounts as returned by `getProgramAccounts` with the protocol's data slice.
+    - protocol: Either kamino or solend.
+    - chunk_size: Number of accounts decoded before they are released.
+    """
+    decode = decode_kamino_obligation if protocol == 'kamino' else decode_solend_obligation
+    while accounts:
+        chunk: Iterable[Any] = accounts[-chunk_size:]
+        del accounts[-chunk_size:]
+        for account in chunk:
+            decode(columns, str(account.pubkey), account.account.data)
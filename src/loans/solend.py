@@ -45,12 +45,17 @@ EVENTS_METHODS_MAPPING: dict[str, str] = {
 WAD = 10**18
 
 
+# Columns of events read by the event handlers.
+EVENT_COLUMNS: list[str] = ['amount', 'obligation', 'source', 'destination']
+
+
 def get_events(start_block_number: int = 0) -> pd.DataFrame:
     return src.loans.helpers.get_events(
         table='lenders.solend_parsed_transactions_v2',
         event_names=tuple(EVENTS_METHODS_MAPPING),
         start_block_number=start_block_number,
-        event_column='instruction_name'
+        event_column='instruction_name',
+        columns=EVENT_COLUMNS,
     )
 
 
@@ -466,9 +471,10 @@ class SolendState(src.loans.state.State):
         ].reserve_pubkey.values[0]
 
     def get_unprocessed_events(self) -> None:
-        self.unprocessed_events = src.loans.helpers.get_events(
+        self.unprocessed_events = src.loans.helpers.iter_events(
             table='lenders.solend_parsed_transactions_v2',
             event_names=tuple(EVENTS_METHODS_MAPPING),
+            columns=EVENT_COLUMNS,
             event_column='instruction_name',
             start_block_number=self.last_slot + 1,
         )
@@ -499,7 +505,7 @@ class SolendState(src.loans.state.State):
         for _, individual_transfer_event in transfer_event.iterrows():
             user = individual_transfer_event["obligation"]
             token = individual_transfer_event["destination"]
-            amount = decimal.Decimal(str(individual_transfer_event["amount"]))
+            amount = int(individual_transfer_event["amount"])
             assert amount >= 0
             self.loan_entities[user].collateral.increase_value(token=token, value=amount)
             if user in self.verbose_users:
@@ -520,7 +526,7 @@ class SolendState(src.loans.state.State):
         for _, individual_transfer_event in transfer_event.iterrows():
             user = individual_transfer_event["obligation"]
             token = individual_transfer_event["source"]
-            amount = decimal.Decimal(str(individual_transfer_event["amount"]))
+            amount = int(individual_transfer_event["amount"])
             assert amount >= 0
             self.loan_entities[user].collateral.increase_value(token=token, value=-amount)
             if user in self.verbose_users:
@@ -539,7 +545,7 @@ class SolendState(src.loans.state.State):
         for _, individual_transfer_event in transfer_event.iterrows():
             user = individual_transfer_event["obligation"]
             token = individual_transfer_event["source"]
-            amount = decimal.Decimal(str(individual_transfer_event["amount"]))
+            amount = int(individual_transfer_event["amount"])
             assert amount >= 0
             self.loan_entities[user].debt.increase_value(token=token, value=amount)
             if user in self.verbose_users:
@@ -560,7 +566,7 @@ class SolendState(src.loans.state.State):
         for _, individual_transfer_event in transfer_event.iterrows():
             user = individual_transfer_event["obligation"]
             token = individual_transfer_event["destination"]
-            amount = decimal.Decimal(str(individual_transfer_event["amount"]))
+            amount = int(individual_transfer_event["amount"])
             assert amount >= 0
             self.loan_entities[user].debt.increase_value(token=token, value=-amount)
             paid_interest = 0
@@ -592,7 +598,7 @@ class SolendState(src.loans.state.State):
             assert user in self.loan_entities  # TODO
             # TODO: The very first liquidation events do not change the collateral.
             collateral_token = individual_transfer_event["source"]
-            collateral_amount = decimal.Decimal(str(individual_transfer_event["amount"]))
+            collateral_amount = int(individual_transfer_event["amount"])
             assert collateral_amount >= 0
             self.loan_entities[user].collateral.increase_value(token=collateral_token, value=-collateral_amount)
 
@@ -604,7 +610,7 @@ class SolendState(src.loans.state.State):
             assert user in self.loan_entities  # TODO
             # TODO: The very first liquidation events do not change the collateral.
             debt_token = individual_transfer_event["destination"]
-            debt_amount = decimal.Decimal(str(individual_transfer_event["amount"]))
+            debt_amount = int(individual_transfer_event["amount"])
             paid_interest = 0
             assert debt_amount >= 0
             self.loan_entities[user].debt.increase_value(token=debt_token, value=-debt_amount)
@@ -669,11 +675,10 @@ def compute_liquidable_debt_for_price_target(
     loan_states['liquidable'] = loan_states['health_factor'] > 1
     loan_states['liquidation_ratio'] = loan_states['health_factor'] - 1
 
-    def calculate_debt_to_be_liquidated(row):
-        calculated_value = row['liquidation_ratio'] * row[f'debt_usd_{debt_token}'] * row['liquidable']
-        return min(calculated_value, row[f'debt_usd_{debt_token}'])
-
-    loan_states['debt_to_be_liquidated'] = loan_states.apply(calculate_debt_to_be_liquidated, axis=1)
+    # The debt is liquidated up to the whole debt in the debt token.
+    debt_usd = loan_states[f'debt_usd_{debt_token}']
+    calculated_value = loan_states['liquidation_ratio'] * debt_usd * loan_states['liquidable']
+    loan_states['debt_to_be_liquidated'] = calculated_value.where(~(debt_usd < calculated_value), debt_usd)
     liquidatable_value = loan_states['debt_to_be_liquidated'].sum()
     return liquidatable_value
 
@@ -1,14 +1,15 @@
 import abc
 import collections
-import decimal
+import itertools
 import logging
 from dataclasses import dataclass
 from functools import lru_cache
-from typing import List, Any, Dict
+from typing import List, Any, Dict, Iterator
 
 import pandas
 
 import src.loans.types
+from src.metrics import log_performance_time
 
 @dataclass
 class CollateralPosition:
@@ -156,9 +157,9 @@ class LoanEntity(abc.ABC):
     A class that describes and entity which can hold collateral, borrow debt and be liquidable.
     """
 
-    def __init__(self) -> None:
-        self.collateral: src.loans.types.Portfolio = src.loans.types.Portfolio()
-        self.debt: src.loans.types.Portfolio = src.loans.types.Portfolio()
+    def __init__(self, scale_bits: int = 0) -> None:
+        self.collateral: src.loans.types.Portfolio = src.loans.types.Portfolio(scale_bits=scale_bits)
+        self.debt: src.loans.types.Portfolio = src.loans.types.Portfolio(scale_bits=scale_bits)
 
     def is_zero_debt(self):
         return self.debt.is_zero()
@@ -184,7 +185,7 @@ class State(abc.ABC):
         self.loan_entities: collections.defaultdict = collections.defaultdict(self.loan_entity_class)
         self.last_slot: int = 0
         self.set_initial_loan_states(initial_loan_states=initial_loan_states)
-        self.unprocessed_events: pandas.DataFrame = pandas.DataFrame()
+        self.unprocessed_events: pandas.DataFrame | Iterator[pandas.DataFrame] = pandas.DataFrame()
 
     def set_initial_loan_states(self, initial_loan_states: pandas.DataFrame) -> None:
         if initial_loan_states.empty:
@@ -197,36 +198,56 @@ class State(abc.ABC):
             user = loan_state['user']
             for collateral_token, collateral_amount in loan_state['collateral'].items():
                 if collateral_amount:
-                    self.loan_entities[user].collateral[collateral_token] = decimal.Decimal(str(collateral_amount))
+                    self.loan_entities[user].collateral.set_value(token=collateral_token, value=collateral_amount)
             for debt_token, debt_amount in loan_state['debt'].items():
                 if debt_amount:
-                    self.loan_entities[user].debt[debt_token] = decimal.Decimal(str(debt_amount))
+                    self.loan_entities[user].debt.set_value(token=debt_token, value=debt_amount)
 
     @abc.abstractmethod
     def get_unprocessed_events(self) -> None:
         pass
 
+    @log_performance_time(logging.getLogger(__name__), stage='replay')
     def process_unprocessed_events(self) -> None:
-        min_unprocessed_slot = self.unprocessed_events['block'].min()
-        if min_unprocessed_slot < self.last_slot:
+        """
+        Processes unprocessed events, either a DataFrame or an iterator of ordered chunks of events, chunk by chunk.
+        """
+        chunks = self.unprocessed_events
+        if isinstance(chunks, pandas.DataFrame):
+            chunks = iter([chunks])
+
+        first_chunk = next(chunks, None)
+        if first_chunk is not None and not first_chunk.empty and first_chunk['block'].min() < self.last_slot:
             logging.warning(
                 'Minimum unprocessed slot  = {} is lower than last slot = {}. Refreshing unprocessed events.'.format(
-                    min_unprocessed_slot,
+                    first_chunk['block'].min(),
                     self.last_slot,
                 )
             )
             self.get_unprocessed_events()
+            chunks = self.unprocessed_events
+            if isinstance(chunks, pandas.DataFrame):
+                chunks = iter([chunks])
+            first_chunk = next(chunks, None)
+
+        if first_chunk is not None:
+            for events in itertools.chain([first_chunk], chunks):
+                if events.empty:
+                    continue
+                self.process_events(events=events)
+                logging.info('Processed {} events up to slot = {}.'.format(len(events), self.last_slot))
+        self.unprocessed_events = pandas.DataFrame()
 
-        if self.unprocessed_events.empty:
-            return
-
+    def process_events(self, events: pandas.DataFrame) -> None:
+        """
+        Processes ordered events one by one.
+        """
         # Iterate over ordered events to obtain the final state of each user.
-        for _, event in self.unprocessed_events.groupby(['transaction_id', 'instruction_name'], sort=False):
+        for _, event in events.groupby(['transaction_id', 'instruction_name'], sort=False, observed=True):
             try:
                 self.process_event(event=event)
-            except:
+            except Exception:
                 logging.error('Failed to process event data = {}.'.format(event), exc_info=True)
-        self.unprocessed_events = pandas.DataFrame()
 
     @abc.abstractmethod
     def process_event(self) -> None:
@@ -1,35 +1,103 @@
-import collections
 import decimal
+import numbers
+from typing import Iterator
 
 
-MAX_ROUNDING_ERRORS = collections.defaultdict(
-    lambda: decimal.Decimal("0"),
-)
+# Token amounts below which balances are rounded to zero, in the same units as the values of `Portfolio`. Balances
+# below zero are always rounded to zero.
+MAX_ROUNDING_ERRORS: dict[str, decimal.Decimal] = {}
 
 
-class Portfolio(collections.defaultdict):
-    """A class that describes holdings of tokens."""
+class Portfolio:
+    """
+    A class that describes holdings of tokens. Balances are stored as integers, either raw on-chain amounts or
+    fixed-point shares with `scale_bits` fractional bits (e.g. 48 for MarginFi and Mango), and are converted to
+    `decimal.Decimal` or float only when read.
+    """
+
+    __slots__ = ("raw_balances", "scale_bits")
 
     # TODO: Update the values.
-    MAX_ROUNDING_ERRORS: collections.defaultdict = MAX_ROUNDING_ERRORS
+    MAX_ROUNDING_ERRORS: dict[str, decimal.Decimal] = MAX_ROUNDING_ERRORS
 
-    def __init__(self, **kwargs) -> None:
+    def __init__(self, scale_bits: int = 0, **kwargs) -> None:
         assert all(isinstance(x, str) for x in kwargs.keys())
         assert all(isinstance(x, decimal.Decimal) for x in kwargs.values())
-        super().__init__(decimal.Decimal, **kwargs)
+        self.scale_bits: int = scale_bits
+        self.raw_balances: dict[str, int] = {}
+        for token, value in kwargs.items():
+            self.set_value(token=token, value=value)
+
+    def to_raw(self, value: numbers.Real | decimal.Decimal) -> int:
+        """
+        Converts a value to the raw integer representation.
+        """
+        if isinstance(value, numbers.Integral):
+            return int(value) << self.scale_bits
+        if isinstance(value, float):
+            return round(value * (1 << self.scale_bits))
+        return int((decimal.Decimal(value) * (1 << self.scale_bits)).to_integral_value())
+
+    def to_decimal(self, raw: int) -> decimal.Decimal:
+        if not self.scale_bits:
+            return decimal.Decimal(raw)
+        return decimal.Decimal(raw) / (1 << self.scale_bits)
+
+    def to_float(self, raw: int) -> float:
+        return raw / (1 << self.scale_bits)
 
     # TODO: Find a better solution to fix the discrepancies.
     def round_small_value_to_zero(self, token: str):
-        if self[token] < self.MAX_ROUNDING_ERRORS[token]:
-            self[token] = decimal.Decimal("0")
+        raw = self.raw_balances.get(token, 0)
+        if raw < 0 or (self.MAX_ROUNDING_ERRORS and raw < self.to_raw(self.MAX_ROUNDING_ERRORS.get(token, 0))):
+            self.raw_balances[token] = 0
+
+    def get_raw(self, token: str) -> int:
+        return self.raw_balances.get(token, 0)
 
-    def increase_value(self, token: str, value: decimal.Decimal):
-        self[token] += value
-        self.round_small_value_to_zero(token=token)
+    def set_raw(self, token: str, raw: int):
+        self.raw_balances[token] = raw
+        if raw < 0 or self.MAX_ROUNDING_ERRORS:
+            self.round_small_value_to_zero(token=token)
 
-    def set_value(self, token: str, value: decimal.Decimal):
-        self[token] = value
-        self.round_small_value_to_zero(token=token)
+    def increase_raw(self, token: str, raw: int):
+        self.set_raw(token=token, raw=self.raw_balances.get(token, 0) + raw)
+
+    def increase_value(self, token: str, value: numbers.Real | decimal.Decimal):
+        self.increase_raw(token=token, raw=self.to_raw(value))
+
+    def set_value(self, token: str, value: numbers.Real | decimal.Decimal):
+        self.set_raw(token=token, raw=self.to_raw(value))
 
     def is_zero(self):
-        return all([i == 0 for i in self.values()])
+        return not any(self.raw_balances.values())
+
+    def to_floats(self) -> dict[str, float]:
+        return {token: self.to_float(raw) for token, raw in self.raw_balances.items()}
+
+    def __getitem__(self, token: str) -> decimal.Decimal:
+        return self.to_decimal(self.raw_balances.get(token, 0))
+
+    def __setitem__(self, token: str, value: numbers.Real | decimal.Decimal):
+        self.raw_balances[token] = self.to_raw(value)
+
+    def __contains__(self, token: object) -> bool:
+        return token in self.raw_balances
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.raw_balances)
+
+    def __len__(self) -> int:
+        return len(self.raw_balances)
+
+    def keys(self):
+        return self.raw_balances.keys()
+
+    def values(self) -> Iterator[decimal.Decimal]:
+        return (self.to_decimal(raw) for raw in self.raw_balances.values())
+
+    def items(self) -> Iterator[tuple[str, decimal.Decimal]]:
+        return ((token, self.to_decimal(raw)) for token, raw in self.raw_balances.items())
+
+    def __repr__(self) -> str:
+        return f"Portfolio({dict(self.items())})"
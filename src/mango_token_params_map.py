@@ -1,4 +1,5 @@
 from decimal import Decimal
+from typing import Any
 import logging
 import time
 import asyncio
@@ -12,37 +13,68 @@ from src.utils import get_authenticated_rpc_url
 
 from solders.pubkey import Pubkey
 
-def get_banks_addresses() -> list[Pubkey]:
+GROUP_METADATA_URL = 'https://api.mngo.cloud/data/v4/group-metadata'
+# Time in seconds for which the group metadata and token parameters are reused.
+CACHE_TTL = 3600
+# Maximum time in seconds to wait between retries.
+MAX_RETRY_DELAY = 60
 
-    try:
-        r = requests.get('https://api.mngo.cloud/data/v4/group-metadata', timeout = 30)
+_group_metadata: tuple[float, dict[str, Any]] | None = None
+_token_params_map: tuple[float, dict[str, dict[str, Decimal]]] | None = None
 
-        if r.status_code !=200:
-            time.sleep(100)
-            logging.warning('Cant fetch banks addresses')
-            return get_banks_addresses()
 
-        main_group = [i for i in r.json()['groups'] if i['name'] == 'MAINNET.0'][0]
-        banks = [Pubkey.from_string(i['banks'][0]['publicKey']) for i in main_group['tokens']]
+def get_group_metadata() -> dict[str, Any]:
+    """
+    Fetches metadata of Mango groups, cached for `CACHE_TTL` seconds and shared by all callers. Failed requests are
+    retried with an exponential backoff; if the metadata can not be refreshed, the cached metadata is used.
+    """
+    global _group_metadata  # pylint: disable=global-statement
+    if _group_metadata is not None and time.time() - _group_metadata[0] < CACHE_TTL:
+        return _group_metadata[1]
 
-    except requests.exceptions.Timeout:
-        time.sleep(60)
-        return get_banks_addresses()
+    delay = 1
+    while True:
+        try:
+            r = requests.get(GROUP_METADATA_URL, timeout = 30)
+            if r.status_code == 200:
+                _group_metadata = (time.time(), r.json())
+                return _group_metadata[1]
+            logging.warning(f'Cant fetch Mango group metadata, status code = {r.status_code}.')
+        except requests.exceptions.RequestException as e:
+            logging.warning(f'Cant fetch Mango group metadata: {e}')
+        if _group_metadata is not None:
+            logging.warning('Using Mango group metadata fetched {:.0f} seconds ago.'.format(
+                time.time() - _group_metadata[0],
+            ))
+            return _group_metadata[1]
+        time.sleep(delay)
+        delay = min(delay * 2, MAX_RETRY_DELAY)
 
-    return banks
 
-def fetch_banks(client: AsyncClient, banks: list[Pubkey]) -> list[Bank]:
-    try: 
-        banks_fetched = asyncio.run(Bank.fetch_multiple(client, banks))
-    except SolanaRpcException: 
-        time.sleep(30)
-        return fetch_banks(client, banks)
+def get_banks_addresses() -> list[Pubkey]:
+    main_group = [i for i in get_group_metadata()['groups'] if i['name'] == 'MAINNET.0'][0]
+    return [Pubkey.from_string(i['banks'][0]['publicKey']) for i in main_group['tokens']]
 
-    return banks_fetched
+def fetch_banks(client: AsyncClient, banks: list[Pubkey]) -> list[Bank]:
+    delay = 1
+    while True:
+        try:
+            return asyncio.run(Bank.fetch_multiple(client, banks))
+        except SolanaRpcException:
+            logging.warning(f'Cant fetch Mango banks, retrying in {delay} seconds.')
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_RETRY_DELAY)
 
 def get_mango_token_params_map() -> dict[str, dict[str, Decimal]]:
+    """
+    Fetches parameters of Mango tokens by mint, cached for `CACHE_TTL` seconds.
+    """
+    global _token_params_map  # pylint: disable=global-statement
+    if _token_params_map is not None and time.time() - _token_params_map[0] < CACHE_TTL:
+        return _token_params_map[1]
+
     client = AsyncClient(get_authenticated_rpc_url())
-  
+
     banks = get_banks_addresses()
     banks_fetched = fetch_banks(client, banks)
 
@@ -56,4 +88,5 @@ def get_mango_token_params_map() -> dict[str, dict[str, Decimal]]:
             'maint_liab_weight': Decimal(bank.maint_liab_weight.val) / 2**48,
             'init_liab_weight': Decimal(bank.init_liab_weight.val) / 2**48,
         }
+    _token_params_map = (time.time(), token_params)
     return token_params
@@ -0,0 +1,226 @@
+"""
+Registry of performance metrics of the pipeline stages: signature collection, block fetch, parsing, replay of events
+and liquidable debt processing.
+
+The registry keeps latency histograms, counters (e.g., RPC calls, retries, rows written) and gauges (e.g., slot lag),
+each identified by its name and labels. When `METRICS_PORT` env variable is set, the metrics of the process are served
+in the Prometheus text format on `http://0.0.0.0:<METRICS_PORT>/metrics`, starting with the first metric recorded.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
+import bisect
+import functools
+import logging
+import math
+import os
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+# Upper bounds of latency histogram buckets in seconds.
+LATENCY_BUCKETS: tuple[float, ...] = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, math.inf)
+STAGE_DURATION = 'stage_duration_seconds'
+RPC_CALLS = 'rpc_calls_total'
+RPC_RETRIES = 'rpc_retries_total'
+ROWS_WRITTEN = 'rows_written_total'
+SLOT_LAG = 'slot_lag'
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    escaped = (
+        (name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    """
+    Thread-safe registry of counters, gauges and histograms of one process.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[Labels, float]] = {}
+        self._gauges: dict[str, dict[Labels, float]] = {}
+        # Per-bucket counts, sum and count of observations by name and labels.
+        self._histograms: dict[str, dict[Labels, tuple[list[int], float, int]]] = {}
+        self._server: ThreadingHTTPServer | None = None
+        self._server_checked = False
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        """
+        Increase the counter by `value`.
+        """
+        self._ensure_server()
+        key = tuple(sorted((label, str(label_value)) for label, label_value in labels.items()))
+        with self._lock:
+            counter = self._counters.setdefault(name, {})
+            counter[key] = counter.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        """
+        Set the gauge to `value`.
+        """
+        self._ensure_server()
+        key = tuple(sorted((label, str(label_value)) for label, label_value in labels.items()))
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """
+        Add an observation, e.g., a duration in seconds, to the histogram.
+        """
+        self._ensure_server()
+        key = tuple(sorted((label, str(label_value)) for label, label_value in labels.items()))
+        bucket_ix = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.setdefault(name, {})
+            bucket_counts, total, count = histogram.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            bucket_counts[bucket_ix] += 1
+            histogram[key] = (bucket_counts, total + value, count + 1)
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text format.
+        """
+        lines = []
+        with self._lock:
+            for metric_type, metrics in (('counter', self._counters), ('gauge', self._gauges)):
+                for name, values in sorted(metrics.items()):
+                    lines.append(f'# TYPE {name} {metric_type}')
+                    for labels, value in sorted(values.items()):
+                        lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+            for name, histogram in sorted(self._histograms.items()):
+                lines.append(f'# TYPE {name} histogram')
+                for labels, (bucket_counts, total, count) in sorted(histogram.items()):
+                    cumulative_count = 0
+                    for bound, bucket_count in zip(self.buckets, bucket_counts):
+                        cumulative_count += bucket_count
+                        bucket_labels = labels + (('le', _format_value(bound)),)
+                        lines.append(f'{name}_bucket{_format_labels(bucket_labels)} {cumulative_count}')
+                    lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(total)}')
+                    lines.append(f'{name}_count{_format_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def start_server(self, port: int) -> ThreadingHTTPServer:
+        """
+        Serve the metrics on the given port from a daemon thread.
+        """
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):  # pylint: disable=invalid-name
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                LOGGER.debug(format, *args)
+
+        self._server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        LOGGER.info(f"Metrics are served on port {port}.")
+        return self._server
+
+    def _ensure_server(self) -> None:
+        """
+        Start the server on `METRICS_PORT`, if set, once per process.
+        """
+        if self._server_checked:
+            return
+        with self._lock:
+            if self._server_checked:
+                return
+            self._server_checked = True
+        port = os.getenv("METRICS_PORT")
+        if not port:
+            return
+        try:
+            self.start_server(int(port))
+        except (ValueError, OSError) as e:
+            LOGGER.error(f"Metrics server could not be started on port `{port}`: {e}")
+
+
+REGISTRY = MetricsRegistry()
+
+
+def measure_time(stage: str):
+    """
+    Decorator recording durations of the subjected function, either a plain or a coroutine function, to the latency
+    histogram of the stage.
+    """
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start_time = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    REGISTRY.observe(STAGE_DURATION, time.perf_counter() - start_time, stage=stage)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                REGISTRY.observe(STAGE_DURATION, time.perf_counter() - start_time, stage=stage)
+        return wrapper
+    return decorator
+
+
+def log_performance_time(logger = LOGGER, stage: str | None = None):
+    """
+    Decorator for logging performance time of subjected function, either a plain or a coroutine function. The time is
+    also recorded to the latency histogram of the stage, the qualified name of the function by default.
+    """
+    def decorator(func):
+        stage_name = stage or func.__qualname__
+
+        def log_start():
+            logger.info(f"START: function '{func.__name__}'.")
+
+        def log_end(start_time: float):
+            # Calculate elapsed time and log the end of the function
+            elapsed_time = time.perf_counter() - start_time
+            REGISTRY.observe(STAGE_DURATION, elapsed_time, stage=stage_name)
+            logger.info(f"DONE: function '{func.__name__}' in {elapsed_time:.2f} seconds")
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start_time = time.perf_counter()
+                log_start()
+                result = await func(*args, **kwargs)
+                log_end(start_time)
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start_time = time.perf_counter()
+            log_start()
+            result = func(*args, **kwargs)
+            log_end(start_time)
+            return result
+        return wrapper
+    return decorator
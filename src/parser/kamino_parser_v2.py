@@ -15,6 +15,7 @@ from solders.transaction_status import EncodedTransactionWithStatusMeta, UiParti
     ParsedInstruction
 
 from db import KaminoObligationV2, KaminoParsedTransactionsV2, KaminoReserveV2
+from src.metrics import measure_time
 from src.parser.parser import TransactionDecoder, UnknownInstruction
 from src.protocols.addresses import KAMINO_ADDRESS
 from src.protocols.idl_paths import KAMINO_IDL_PATH
@@ -61,6 +62,7 @@ class KaminoTransactionParserV2(TransactionDecoder):
         self.error = None
         super().__init__(path_to_idl, program_id)
 
+    @measure_time('parse_kamino')
     def parse_transaction(self, transaction_with_meta: EncodedTransactionWithStatusMeta) -> None:
         """
         Decodes transaction instructions and correlates with log messages.
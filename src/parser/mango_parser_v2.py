@@ -1,20 +1,33 @@
 """
 Parser for transactions of mango v4
 """
+from base64 import b64decode
 from pathlib import Path
+import binascii
+import itertools
 import logging
 import os
-from typing import Iterable
+from typing import Callable, Iterable
 
 from anchorpy import EventParser
+from anchorpy.coder.coder import Coder
 from anchorpy.program.common import Event
+from anchorpy.program.event import _ExecutionContext
+from construct import Construct
 from solders.pubkey import Pubkey
 from solders.signature import Signature
 from solders.transaction_status import EncodedTransactionWithStatusMeta
 import construct.core
 
 from db import MangoParsedEvents
-from src.parser.parser import TransactionDecoder
+from src.metrics import measure_time
+from src.parser.parser import (
+    PROGRAM_DATA,
+    PROGRAM_DATA_START_INDEX,
+    PROGRAM_LOG,
+    PROGRAM_LOG_START_INDEX,
+    TransactionDecoder,
+)
 from src.protocols.addresses import MANGO_ADDRESS
 from src.protocols.idl_paths import MANGO_IDL_PATH
 
@@ -51,6 +64,114 @@ def namedtuple_to_dict(obj):
         return obj if not isinstance(obj, Pubkey) else str(obj)
 
 
+# Events which are saved, payloads of other events are skipped without being decoded.
+RELEVANT_EVENTS: frozenset[str] = frozenset([
+    'PerpBalanceLog',
+    'TokenBalanceLog',
+    'FlashLoanLog',
+    'FlashLoanLogV2',
+    'FlashLoanLogV3',
+    'WithdrawLog',
+    'DepositLog',
+    'FillLog',
+    'FillLogV2',
+    'FillLogV3',
+    'PerpUpdateFundingLog',
+    'PerpUpdateFundingLogV2',
+    'UpdateIndexLog',
+    'UpdateRateLog',
+    'UpdateRateLogV2',
+    'TokenLiqWithTokenLog',
+    'TokenLiqWithTokenLogV2',
+    'WithdrawLoanLog',
+    'PerpLiqBaseOrPositivePnlLog',
+    'PerpLiqBaseOrPositivePnlLogV2',
+    'PerpLiqBaseOrPositivePnlLogV3',
+    'PerpLiqBankruptcyLog',
+    'PerpLiqNegativePnlOrBankruptcyLog',
+    'PerpSettlePnlLog',
+    'PerpSettleFeesLog',
+    'FilledPerpOrderLog',
+    'PerpTakerTradeLog',
+    'PerpForceClosePositionLog',
+    'TokenForceCloseBorrowsWithTokenLog',
+    'TokenLiqBankruptcyLog',
+    'TokenForceCloseBorrowsWithTokenLogV2',
+    'TokenConditionalSwapCreateLog',
+    'TokenConditionalSwapCreateLogV2',
+    'TokenConditionalSwapCreateLogV3',
+    'TokenConditionalSwapTriggerLog',
+    'TokenConditionalSwapTriggerLogV2',
+    'TokenConditionalSwapTriggerLogV3',
+    'TokenConditionalSwapCancelLog',
+    'TokenConditionalSwapStartLog',
+    'DeactivateTokenPositionLog',
+    'DeactivatePerpPositionLog',
+    'TokenMetaDataLog',
+    'TokenMetaDataLogV2',
+    'PerpMarketMetaDataLog',
+    'TokenCollateralFeeLog',
+    'ForceWithdrawLog',
+    'AccountBuybackFeesWithMngoLog',
+    'Serum3OpenOrdersBalanceLog',
+    'Serum3OpenOrdersBalanceLogV2',
+])
+# These 2 events are not parsable with anchorpy library due to missing attributes, likely relevant only for old
+# events.
+UNPARSABLE_EVENTS: frozenset[str] = frozenset(['PerpUpdateFundingLog', 'PerpUpdateFundingLogV2'])
+# Number of base64 characters encoding the 8-byte event discriminator.
+DISCRIMINATOR_BASE64_LENGTH = 12
+
+
+class MangoEventParser(EventParser):
+    """
+    Event parser which decodes only wanted events. The 8-byte discriminator of each program log is decoded first and
+    looked up among the wanted events, the rest of the payload is decoded only for matching events with the cached
+    layout of the event.
+    """
+
+    def __init__(self, program_id: Pubkey, coder: Coder, event_names: Iterable[str]):
+        super().__init__(program_id, coder)
+        event_names = frozenset(event_names)
+        self.wanted_events: dict[bytes, tuple[str, Construct]] = {
+            discriminator: (name, coder.events.layouts[name])
+            for discriminator, name in coder.events.discriminators.items()
+            if name in event_names
+        }
+
+    def parse_logs(self, logs: list[str], callback: Callable[[Event], None]) -> None:
+        # Same as `EventParser.parse_logs` without copying the remaining logs for every log line.
+        if not logs:
+            return
+        execution = _ExecutionContext(logs[0])
+        for log in itertools.islice(logs, 1, None):
+            event, new_program, did_pop = self.handle_log(execution, log)
+            if event is not None:
+                callback(event)
+            if new_program is not None:
+                execution.push(new_program)
+            if did_pop:
+                execution.pop()
+
+    def handle_program_log(self, log: str) -> tuple[Event | None, str | None, bool]:
+        if log.startswith(PROGRAM_DATA):
+            payload = log[PROGRAM_DATA_START_INDEX:]
+        elif log.startswith(PROGRAM_LOG):
+            payload = log[PROGRAM_LOG_START_INDEX:]
+        else:
+            return (None, *self.handle_system_log(log))
+
+        try:
+            wanted_event = self.wanted_events.get(b64decode(payload[:DISCRIMINATOR_BASE64_LENGTH])[:8])
+            if wanted_event is None:
+                return None, None, False
+            data = b64decode(payload)
+        except binascii.Error:
+            return None, None, False
+        event_name, layout = wanted_event
+        return Event(name=event_name, data=layout.parse(data[8:])), None, False
+
+
 class MangoTransactionParserV2(TransactionDecoder):
 
     def __init__(
@@ -60,62 +181,17 @@ class MangoTransactionParserV2(TransactionDecoder):
     ):
         self.event_counter: int | None = None
         super().__init__(path_to_idl, program_id)
+        self.event_parser = MangoEventParser(
+            self.program.program_id,
+            self.program.coder,
+            RELEVANT_EVENTS - UNPARSABLE_EVENTS,
+        )
 
     def save_event(self, event: Event) -> None:
         """
         Save event.
         """
-        if event.name in [
-            'PerpBalanceLog',
-            'TokenBalanceLog',
-            'FlashLoanLog',
-            'FlashLoanLogV2',
-            'FlashLoanLogV3',
-            'WithdrawLog',
-            'DepositLog',
-            'FillLog',
-            'FillLogV2',
-            'FillLogV3',
-            'PerpUpdateFundingLog',
-            'PerpUpdateFundingLogV2',
-            'UpdateIndexLog',
-            'UpdateRateLog',
-            'UpdateRateLogV2',
-            'TokenLiqWithTokenLog',
-            'TokenLiqWithTokenLogV2',
-            'WithdrawLoanLog',
-            'PerpLiqBaseOrPositivePnlLog',
-            'PerpLiqBaseOrPositivePnlLogV2',
-            'PerpLiqBaseOrPositivePnlLogV3',
-            'PerpLiqBankruptcyLog',
-            'PerpLiqNegativePnlOrBankruptcyLog',
-            'PerpSettlePnlLog',
-            'PerpSettleFeesLog',
-            'FilledPerpOrderLog',
-            'PerpTakerTradeLog',
-            'PerpForceClosePositionLog',
-            'TokenForceCloseBorrowsWithTokenLog',
-            'TokenLiqBankruptcyLog',
-            'TokenForceCloseBorrowsWithTokenLogV2',
-            'TokenConditionalSwapCreateLog',
-            'TokenConditionalSwapCreateLogV2',
-            'TokenConditionalSwapCreateLogV3',
-            'TokenConditionalSwapTriggerLog',
-            'TokenConditionalSwapTriggerLogV2',
-            'TokenConditionalSwapTriggerLogV3',
-            'TokenConditionalSwapCancelLog',
-            'TokenConditionalSwapStartLog',
-            'DeactivateTokenPositionLog',
-            'DeactivatePerpPositionLog',
-            'TokenMetaDataLog',
-            'TokenMetaDataLogV2',
-            'PerpMarketMetaDataLog',
-            'TokenCollateralFeeLog',
-            'ForceWithdrawLog'
-            'AccountBuybackFeesWithMngoLog',
-            'Serum3OpenOrdersBalanceLog',
-            'Serum3OpenOrdersBalanceLogV2'
-        ]:
+        if event.name in RELEVANT_EVENTS:
             event_name = event.name
             event_data = namedtuple_to_dict(event.data)
             event = MangoParsedEvents(
@@ -125,6 +201,7 @@ class MangoTransactionParserV2(TransactionDecoder):
             )
             self._processor(event)
 
+    @measure_time('parse_mango')
     def parse_transaction(self, transaction_with_meta: EncodedTransactionWithStatusMeta) -> None:
         """
         Decodes events
@@ -135,14 +212,7 @@ class MangoTransactionParserV2(TransactionDecoder):
         self.transaction = transaction_with_meta
         if self.transaction.meta.err:
             return
-        logs = self.transaction.meta.log_messages
-        # This 2 discriminators are associated with 'PerpUpdateFundingLog' and 'PerpUpdateFundingLogV2'
-        # and this 2 events are not parsable with anchorpy library due to missing attributes.
-        # likely relevant only for old events
-        logs = [log for log in logs if not ('vx89Qqxin' in log or 'dZKDSrOa2' in log)]
-        parser = EventParser(self.program.program_id, self.program.coder)
-        parser.parse_logs(logs, lambda x: self.save_event(x))
-
+        self.event_parser.parse_logs(self.transaction.meta.log_messages, self.save_event)
 
 
 if __name__ == "__main__":
@@ -15,6 +15,7 @@ from solders.transaction_status import EncodedTransactionWithStatusMeta, UiParti
     ParsedInstruction
 
 from db import MarginfiLendingAccountsV2, MarginfiParsedTransactionsV2, MarginfiBankV2
+from src.metrics import measure_time
 from src.parser.parser import TransactionDecoder, UnknownInstruction
 from src.protocols.addresses import MARGINFI_ADDRESS
 from src.protocols.idl_paths import MARGINFI_IDL_PATH
@@ -84,6 +85,7 @@ class MarginfiTransactionParserV2(TransactionDecoder):
                     pass
         return parsed_instructions
 
+    @measure_time('parse_marginfi')
     def parse_transaction(self, transaction_with_meta: EncodedTransactionWithStatusMeta) -> None:
         """
         Decodes transaction instructions and correlates with log messages.
@@ -13,6 +13,7 @@ from solders.transaction_status import EncodedTransactionWithStatusMeta, UiParti
     ParsedInstruction
 
 from db import SolendParsedTransactions, SolendObligations, SolendReserves
+from src.metrics import measure_time
 from src.parser.solend_config import INSTRUCTION_ACCOUNT_MAP
 from src.parser.parser import UnknownInstruction
 from src.protocols.addresses import SOLEND_ADDRESS
@@ -51,119 +52,58 @@ class SolendInstructionData:
                 f"value_name={self.value_name})")
 
 
-def unpack_u64(input_bytes):
-    if len(input_bytes) < 8:
-        raise UnpackError("u64 cannot be unpacked: insufficient input length")
-
-    value = struct.unpack_from('<Q', input_bytes)[0]  # '<Q' specifies little-endian unsigned long long
-    rest = input_bytes[8:]
-
-    return value, rest
-
-
-def unpack_u8(input_bytes):
-    if not input_bytes:
-        raise UnpackError("u8 cannot be unpacked: no input")
-
-    value = struct.unpack_from('B', input_bytes)[0]  # 'B' specifies an unsigned char
-    rest = input_bytes[1:]
-
-    return value, rest
-
-
-def unpack_pubkey(input_bytes, pubkey_bytes: int = 8):
-    if len(input_bytes) < pubkey_bytes:
-        raise UnpackError("Pubkey cannot be unpacked: insufficient input length")
-
-    pubkey = input_bytes[:pubkey_bytes]  # Assuming `pubkey_bytes` is the length of a public key
-    rest = input_bytes[pubkey_bytes:]
-
-    return pubkey, rest
-
-
-def unpack_data(data: str):
+U64 = struct.Struct('<Q')
+# Only the first 8 bytes of the owner are kept, the market instructions are not relevant for parsing.
+PUBKEY = struct.Struct('<8s')
+
+# Instruction names and layouts of the data following the tag byte, indexed by tag. Instructions without data have no
+# layout, `None` marks instructions that are not unpacked at all.
+INSTRUCTION_LAYOUTS: tuple[tuple[str, struct.Struct | None] | None, ...] = (
+    ("InitLendingMarket", PUBKEY),
+    ("SetLendingMarketOwner", PUBKEY),
+    ("InitReserve", U64),
+    ("RefreshReserve", None),
+    ("DepositReserveLiquidity", U64),
+    ("RedeemReserveCollateral", U64),
+    ("InitObligation", None),
+    ("RefreshObligation", None),
+    ("DepositObligationCollateral", U64),
+    ("WithdrawObligationCollateral", U64),
+    ("BorrowObligationLiquidity", U64),
+    ("RepayObligationLiquidity", U64),
+    ("LiquidateObligation", U64),
+    ("FlashLoan", U64),
+    ("DepositReserveLiquidityAndObligationCollateral", U64),
+    ("WithdrawObligationCollateralAndRedeemReserveCollateral", U64),
+    None,  # UpdateReserveConfig
+    ("LiquidateObligationAndRedeemReserveCollateral", U64),
+    ("RedeemFees", None),
+    ("FlashBorrowReserveLiquidity", U64),
+    ("FlashRepayReserveLiquidity", U64),
+    ("ForgiveDebt", U64),
+)
+
+
+def unpack_data(data: str) -> SolendInstructionData | None:
     """
     Unpack instruction data
     """
     # get bytes
     input_bytes = base58.b58decode(data)
-    # split into tag (instruction type identifier) and content
-    tag, rest = input_bytes[0], input_bytes[1:]
-    # Return instruction with type
-    if tag == 0:
-        owner, rest = unpack_pubkey(rest)
-        return SolendInstructionData(instruction_id=tag, amount=owner, value_name="InitLendingMarket")
-    elif tag == 1:
-        new_owner, rest = unpack_pubkey(rest)
-        return SolendInstructionData(instruction_id=tag, amount=new_owner, value_name="SetLendingMarketOwner")
-    elif tag == 2:
-        liquidity_amount, rest = unpack_u64(rest)
-        return SolendInstructionData(instruction_id=tag, amount=liquidity_amount, value_name="InitReserve")
-    elif tag == 3:
-        return SolendInstructionData(instruction_id=tag, value_name="RefreshReserve")
-    elif tag == 4:
-        liquidity_amount, rest = unpack_u64(rest)
-        return SolendInstructionData(instruction_id=tag, amount=liquidity_amount, value_name="DepositReserveLiquidity")
-    elif tag == 5:
-        collateral_amount, rest = unpack_u64(rest)
-        return SolendInstructionData(instruction_id=tag, amount=collateral_amount, value_name="RedeemReserveCollateral")
-
-    elif tag == 6:
-        return SolendInstructionData(instruction_id=tag, value_name="InitObligation")
-    elif tag == 7:
-        return SolendInstructionData(instruction_id=tag, value_name="RefreshObligation")
-    elif tag == 8:
-        collateral_amount, rest = unpack_u64(rest)
-        return SolendInstructionData(instruction_id=tag,
-                                     amount=collateral_amount, value_name="DepositObligationCollateral")
-    elif tag == 9:
-        collateral_amount, rest = unpack_u64(rest)
-        return SolendInstructionData(instruction_id=tag,
-                                     amount=collateral_amount, value_name="WithdrawObligationCollateral")
-    elif tag == 10:
-        liquidity_amount, rest = unpack_u64(rest)
-        return SolendInstructionData(instruction_id=tag, amount=liquidity_amount, value_name="BorrowObligationLiquidity")
-    elif tag == 11:
-        liquidity_amount, rest = unpack_u64(rest)
-        return SolendInstructionData(instruction_id=tag, amount=liquidity_amount, value_name="RepayObligationLiquidity")
-    elif tag == 12:
-        liquidity_amount, rest = unpack_u64(rest)
-        return SolendInstructionData(instruction_id=tag, amount=liquidity_amount, value_name="LiquidateObligation")
-    elif tag == 13:
-        amount, rest = unpack_u64(rest)
-        return SolendInstructionData(instruction_id=tag, amount=amount, value_name="FlashLoan")
-    elif tag == 14:
-        liquidity_amount, rest = unpack_u64(rest)
-        return SolendInstructionData(instruction_id=tag,
-                                     amount=liquidity_amount,
-                                     value_name="DepositReserveLiquidityAndObligationCollateral")
-    elif tag == 15:
-        collateral_amount, rest = unpack_u64(rest)
-        return SolendInstructionData(
-            instruction_id=tag,
-            amount=collateral_amount,
-            value_name="WithdrawObligationCollateralAndRedeemReserveCollateral"
-        )
-    elif tag == 16:  # UpdateReserveConfig
-        return
-    elif tag == 17:
-        liquidity_amount, rest = unpack_u64(rest)
-        return SolendInstructionData(
-            instruction_id=tag, amount=liquidity_amount, value_name="LiquidateObligationAndRedeemReserveCollateral")
-    elif tag == 18:
-        return SolendInstructionData(instruction_id=tag, value_name="RedeemFees")
-    elif tag == 19:
-        liquidity_amount, rest = unpack_u64(rest)
-        return SolendInstructionData(
-            instruction_id=tag, amount=liquidity_amount, value_name="FlashBorrowReserveLiquidity")
-    elif tag == 20:
-        liquidity_amount, rest = unpack_u64(rest)
-        return SolendInstructionData(
-            instruction_id=tag, amount=liquidity_amount, value_name="FlashRepayReserveLiquidity")
-    elif tag == 21:
-        liquidity_amount, rest = unpack_u64(rest)
-        return SolendInstructionData(instruction_id=tag, amount=liquidity_amount, value_name="ForgiveDebt")
-    return
+    if not input_bytes:
+        raise UnpackError("Instruction cannot be unpacked: no input")
+    # the first byte is the tag (instruction type identifier), the content is unpacked in place after it
+    tag = input_bytes[0]
+    instruction = INSTRUCTION_LAYOUTS[tag] if tag < len(INSTRUCTION_LAYOUTS) else None
+    if instruction is None:
+        return None
+    value_name, layout = instruction
+    if layout is None:
+        return SolendInstructionData(instruction_id=tag, value_name=value_name)
+    if len(input_bytes) - 1 < layout.size:
+        raise UnpackError(f"{value_name} cannot be unpacked: insufficient input length")
+    amount, = layout.unpack_from(input_bytes, 1)
+    return SolendInstructionData(instruction_id=tag, amount=amount, value_name=value_name)
 
 
 class SolendTransactionParser:
@@ -219,7 +159,15 @@ class SolendTransactionParser:
         self.program_id = program_id
         self.transaction: EncodedTransactionWithStatusMeta | None = None
         self._processor: Callable = self.print_event_to_console
-
+        # Names and account names of relevant instructions indexed by tag, so that they are not looked up for every
+        # instruction.
+        self._relevant_instructions: dict[int, tuple[str, list[str] | None]] = {
+            tag: (name, INSTRUCTION_ACCOUNT_MAP.get(name))
+            for name, tag in self.instruction_types.items()
+            if name in self.relevant_instructions
+        }
+
+    @measure_time('parse_solend')
     def parse_transaction(self, transaction_with_meta: EncodedTransactionWithStatusMeta) -> None:
         """
         Decodes transaction instructions
@@ -272,14 +220,15 @@ class SolendTransactionParser:
         parsed_data = unpack_data(data)
         if not parsed_data:
             return
-        # Get instruction name
-        instruction_name = {v: k for k, v in self.instruction_types.items()}[parsed_data.instruction_id]
-
-        if instruction_name not in self.relevant_instructions:
+        # Get instruction name and names of its accounts
+        relevant_instruction = self._relevant_instructions.get(parsed_data.instruction_id)
+        if relevant_instruction is None:
             return
+        instruction_name, account_names = relevant_instruction
+        if account_names is None:
+            raise UnknownInstruction(instruction_name)
 
         # pair present account keys with its names
-        account_names = INSTRUCTION_ACCOUNT_MAP[instruction_name]
 
         instruction_accounts = dict()
         for pubkey, name in zip(instruction.accounts, account_names):
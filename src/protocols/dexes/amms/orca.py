@@ -3,21 +3,26 @@ import logging
 import json
 import asyncio
 from decimal import Decimal
+from typing import Awaitable, Callable, TypeVar
 
-from orca_whirlpool.constants import ORCA_WHIRLPOOL_PROGRAM_ID
+from orca_whirlpool.constants import ORCA_WHIRLPOOL_PROGRAM_ID, TICK_ARRAY_SIZE, MIN_TICK_INDEX, MAX_TICK_INDEX
 from orca_whirlpool.context import WhirlpoolContext
 from orca_whirlpool.accounts import AccountFinder, AccountFetcher, Whirlpool, TickArray
 from orca_whirlpool.utils import PriceMath
-from orca_whirlpool.utils import PoolUtil
+from orca_whirlpool.utils import PoolUtil, PDAUtil, TickUtil
 from orca_whirlpool.internal.utils.pool_util import LiquidityDistribution
 
 from solders.keypair import Keypair
 from solders.pubkey import Pubkey
+from solana.exceptions import SolanaRpcException
 from solana.rpc.async_api import AsyncClient
+from solana.rpc.core import RPCException
+from solana.rpc.types import DataSliceOpts
 
 # from db import AmmLiquidity, get_db_session
 import db
 from src.protocols.dexes.amms.amm import Amm
+from src.protocols.dexes.liquidity_history import store_liquidity
 from src.protocols.dexes.amms.utils import (
     get_mint_decimals,
     PriceLevel,
@@ -26,12 +31,41 @@ from src.protocols.dexes.amms.utils import (
 
 LOG = logging.getLogger(__name__)
 SHIFT_64 = Decimal(2) ** 64
+# Maximum number of accounts requested by one `getMultipleAccounts` call.
+ACCOUNTS_BATCH_SIZE = 100
+# Maximum number of `getMultipleAccounts` calls in flight.
+MAX_CONCURRENT_REQUESTS = 5
+# Number of attempts to fetch a batch of accounts before giving up.
+MAX_FETCH_ATTEMPTS = 3
+
+T = TypeVar("T")
 
 AUTHENTICATED_RPC_URL = os.environ.get("AUTHENTICATED_RPC_URL")
 if AUTHENTICATED_RPC_URL is None:
     raise ValueError("No AUTHENTICATED_RPC_URL env var")
 
 
+def get_tick_array_addresses(pool: Whirlpool) -> list[Pubkey]:
+    """
+    Derives addresses of all tick arrays the pool can have, covering the whole range of ticks. Only the tick arrays
+    holding initialized ticks exist on-chain.
+
+    Parameters:
+    - pool (Whirlpool): On-chain pool info.
+
+    Returns:
+    - addresses of the tick arrays, ordered by their start tick index
+    """
+    return [
+        PDAUtil.get_tick_array(ORCA_WHIRLPOOL_PROGRAM_ID, pool.pubkey, start_tick_index).pubkey
+        for start_tick_index in range(
+            TickUtil.get_start_tick_index(MIN_TICK_INDEX, pool.tick_spacing),
+            TickUtil.get_start_tick_index(MAX_TICK_INDEX, pool.tick_spacing) + 1,
+            TICK_ARRAY_SIZE * pool.tick_spacing,
+        )
+    ]
+
+
 class OrcaPool:
     """
     Class that represents single orca pool.
@@ -75,13 +109,47 @@ class OrcaPool:
             ORCA_WHIRLPOOL_PROGRAM_ID, address
         )
 
+        return cls.from_accounts(
+            pool, ticker_arrays, decimals_a, decimals_b, connection, ctx, finder, fetcher
+        )
+
+    @classmethod
+    def from_accounts(
+        cls,
+        pool: Whirlpool,
+        ticker_arrays: list[TickArray],
+        decimals_a: int,
+        decimals_b: int,
+        connection: AsyncClient,
+        ctx: WhirlpoolContext,
+        finder: AccountFinder,
+        fetcher: AccountFetcher,
+    ) -> "OrcaPool":
+        """
+        Creates OrcaPool instance from already fetched on-chain accounts of the pool.
+
+        Parameters:
+        - pool (Whirlpool): On-chain pool info.
+        - ticker_arrays (list[TickArray]): All initialized tick arrays of the pool.
+        - decimals_a (int): Base token decimals.
+        - decimals_b (int): Quote token decimals.
+        - connection (AsyncClient): Solana AsyncClient
+        - ctx (WhirlpoolContext): Orca WhirlPool context.
+        - finder (AccountFinder): Orca account finder.
+        - fetcher (AccountFetcher): Orca account fetcher.
+
+        Returns:
+        - OrcaPool instance
+        """
+        # pylint: disable=too-many-arguments
+
         # Calculate individual Liquidity Distributions
         liqdist = PoolUtil.get_liquidity_distribution(pool, ticker_arrays)
 
         # Construct and return OrcaPoool
-        return OrcaPool(
+        return cls(
             pool,
-            address,
+            pool.pubkey,
             connection,
             ctx,
             finder,
@@ -518,10 +586,17 @@ class OrcaAMM(Amm):
 
     def __init__(self):
         self.client = AsyncClient(AUTHENTICATED_RPC_URL)
+        self.ctx = WhirlpoolContext(ORCA_WHIRLPOOL_PROGRAM_ID, self.client, Keypair())
+        self.fetcher = AccountFetcher(self.client)
+        self.finder = AccountFinder(self.client)
 
     async def get_pools(self) -> None:
         """
         Loads stored list of pools and gets it's liquidity distribution.
+
+        All on-chain accounts are fetched with batched `getMultipleAccounts` calls shared by the pools. Tick arrays are
+        found by deriving addresses of all tick arrays each pool can have and checking which of them exist, requesting
+        no account data, after which only the existing tick arrays are downloaded.
         """
         LOG.info("Loading Orca pools")
 
@@ -529,33 +604,117 @@ class OrcaAMM(Amm):
             pools_list = json.load(f)
 
         # Get list of addresses
-        adresses = [i["address"] for i in pools_list]
+        addresses = [Pubkey.from_string(i["address"]) for i in pools_list]
 
-        # Create Coroutine tasks to be gathered
-        tasks = [
-            OrcaPool.from_address(Pubkey.from_string(pool), self.client)
-            for pool in adresses
-        ]
+        # Fetch on-chain pools info
+        fetched_pools, _ = await self._fetch_in_batches(
+            lambda batch: self.fetcher.list_whirlpools(batch, refresh=True), addresses
+        )
+        pools = [pool for pool in fetched_pools if pool is not None]
 
-        # Gather and return exceptions so that the whole process doesn't
-        # fail if there are some errors
-        awaited_tasks = await asyncio.gather(*tasks, return_exceptions=True)
+        # Fetch underlyings decimals
+        mints = list({mint for pool in pools for mint in (pool.token_mint_a, pool.token_mint_b)})
+        mints_info, _ = await self._fetch_in_batches(self.fetcher.list_token_mints, mints)
+        decimals = {mint: info.decimals for mint, info in zip(mints, mints_info) if info is not None}
+
+        # Find initialized tick arrays among all the possible ones and fetch them
+        tick_array_addresses = {pool.pubkey: get_tick_array_addresses(pool) for pool in pools}
+        candidates = [address for pool_addresses in tick_array_addresses.values() for address in pool_addresses]
+        exist, failed_candidates = await self._fetch_in_batches(self._check_accounts_exist, candidates)
+        existing = [address for address, exists in zip(candidates, exist) if exists]
+        fetched_tick_arrays, failed_tick_arrays = await self._fetch_in_batches(
+            lambda batch: self.fetcher.list_tick_arrays(batch, refresh=True), existing
+        )
+        tick_arrays = {address: array for address, array in zip(existing, fetched_tick_arrays) if array is not None}
+        unavailable = failed_candidates | failed_tick_arrays
+        LOG.info(
+            f"Found {len(tick_arrays)} Orca tick arrays among {len(candidates)} possible ones of {len(pools)} pools"
+        )
 
-        # Filter for successfully fetched pools
-        self.pools = [pool for pool in awaited_tasks if isinstance(pool, OrcaPool)]
+        self.pools = []
+        errors: list[Exception] = []
+        for pool in pools:
+            pool_addresses = tick_array_addresses[pool.pubkey]
+            if any(address in unavailable for address in pool_addresses):
+                errors.append(ValueError(f"Tick arrays of pool {pool.pubkey} were not fetched."))
+                continue
+            if pool.token_mint_a not in decimals or pool.token_mint_b not in decimals:
+                errors.append(ValueError(f"Decimals of tokens of pool {pool.pubkey} were not fetched."))
+                continue
+            try:
+                self.pools.append(OrcaPool.from_accounts(
+                    pool,
+                    [tick_arrays[address] for address in pool_addresses if address in tick_arrays],
+                    decimals[pool.token_mint_a],
+                    decimals[pool.token_mint_b],
+                    self.client,
+                    self.ctx,
+                    self.finder,
+                    self.fetcher,
+                ))
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                # Don't fail the whole process because of a single pool
+                errors.append(e)
 
-        if len(tasks) != len(self.pools):
+        if len(addresses) != len(self.pools):
             # This means there were some failures
-            errors = [pool for pool in awaited_tasks if not isinstance(pool, OrcaPool)]
-
-            # Log amount of errors
-            if errors:
-                LOG.error(
-                    f"Was unable to fetch {len(errors)} Orca pools, example: {errors[0]}"
-                )
+            LOG.error(
+                f"Was unable to fetch {len(addresses) - len(self.pools)} Orca pools, "
+                f"example: {errors[0] if errors else 'pool account not found'}"
+            )
 
         LOG.info(f"Fetched {len(self.pools)} Orca pools")
 
+    @staticmethod
+    async def _fetch_in_batches(
+        fetch_batch: Callable[[list[Pubkey]], Awaitable[list[T]]],
+        addresses: list[Pubkey],
+    ) -> tuple[list[T | None], set[Pubkey]]:
+        """
+        Fetches data of the accounts in batches of `ACCOUNTS_BATCH_SIZE` with at most `MAX_CONCURRENT_REQUESTS` requests
+        in flight. Failed requests, due to the transport or to an error returned by the RPC node, are retried up to
+        `MAX_FETCH_ATTEMPTS` times with an exponential backoff.
+
+        Parameters:
+        - fetch_batch: Coroutine function fetching data of a batch of accounts, one item per account.
+        - addresses: Addresses of the accounts.
+
+        Returns:
+        - data of the accounts, None for the ones that could not be fetched
+        - addresses of the accounts that could not be fetched
+        """
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+        async def fetch(batch: list[Pubkey]) -> list[T] | None:
+            for attempt in range(MAX_FETCH_ATTEMPTS):
+                try:
+                    async with semaphore:
+                        return await fetch_batch(batch)
+                except (SolanaRpcException, RPCException) as e:
+                    LOG.warning(f"Failed to fetch {len(batch)} Orca accounts, attempt {attempt + 1}: {e}")
+                    await asyncio.sleep(2**attempt)
+            return None
+
+        batches = [addresses[i:i + ACCOUNTS_BATCH_SIZE] for i in range(0, len(addresses), ACCOUNTS_BATCH_SIZE)]
+        results = await asyncio.gather(*(fetch(batch) for batch in batches))
+
+        data: list[T | None] = []
+        failed: set[Pubkey] = set()
+        for batch, result in zip(batches, results):
+            if result is None:
+                data.extend([None] * len(batch))
+                failed.update(batch)
+            else:
+                data.extend(result)
+        return data, failed
+
+    async def _check_accounts_exist(self, addresses: list[Pubkey]) -> list[bool]:
+        """
+        Checks which of the accounts exist, requesting no account data.
+        """
+        response = await self.client.get_multiple_accounts(addresses, data_slice=DataSliceOpts(offset=0, length=0))
+        return [account is not None for account in response.value]
+
     def store_pool(self, pool: OrcaPool) -> None:
         """
         Save pool data to database.
@@ -573,7 +732,7 @@ class OrcaAMM(Amm):
                 asks = [(float(i.price), float(i.amount)) for i in pool.asks],
             )
             # Add to session and commit
-            session.add(liquidity_entry)
+            store_liquidity([liquidity_entry], session)
             session.commit()
 
     # timestamp = Column(BigInteger, nullable=False)
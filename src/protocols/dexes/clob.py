@@ -2,6 +2,7 @@
 Module containes classes containing functionality for fetching CLOB Liqudity 
 and pushing it to the database.
 """
+import asyncio
 import logging
 import abc
 
@@ -21,6 +22,7 @@ from gfx_perp_sdk.types import MarketProductGroup
 from gfx_perp_sdk.agnostic import Slab
 from gfx_perp_sdk.utils import processOrderbook
 
+from src.protocols.dexes.liquidity_history import store_liquidity
 from src.protocols.dexes.pairs import get_relevant_tickers
 import db
 
@@ -43,15 +45,70 @@ class CLOB(abc.ABC):
                 list of two sized tuples (price, size) representing single price level
         """
 
-    @abc.abstractmethod
-    async def update_orderbooks(self, timestamp: int) -> None:
+    identifier: str
+    # Maps tickers to identifiers of markets passed to `get_onchain_orderbook`.
+    markets: dict[str, str]
+
+    async def get_orderbooks(
+        self, semaphore: asyncio.Semaphore
+    ) -> dict[str, dict[str, list[tuple[float, float]]]]:
+        """
+        Retrieves onchain orderbook data for all provided markets concurrently.
+
+        Parameters:
+        - semaphore: Semaphore bounding the number of orderbooks fetched at once, can be shared
+                    with other CLOBs.
+
+        Returns:
+        - dict: Dictionary mapping tickers to orderbooks as returned by `get_onchain_orderbook`.
+        """
+
+        async def get_orderbook(market_address: str) -> dict[str, list[tuple[float, float]]]:
+            async with semaphore:
+                return await self.get_onchain_orderbook(market_address)
+
+        order_books = await asyncio.gather(
+            *(get_orderbook(market_address) for market_address in self.markets.values())
+        )
+        return dict(zip(self.markets, order_books))
+
+    def get_records(
+        self, order_books: dict[str, dict[str, list[tuple[float, float]]]], timestamp: int
+    ) -> list[db.CLOBLiqudity]:
+        """
+        Converts orderbooks returned by `get_orderbooks` to database records.
+
+        Parameters:
+        - order_books: Dictionary mapping tickers to orderbooks.
+        - timestamp: Timestamp to use when storing data. Used to make some aggregations easier
+                    accross all the different markets, since we don't need high precision.
+        """
+        return [
+            db.CLOBLiqudity(
+                dex=self.identifier,
+                pair=ticker,
+                market_address=self.markets[ticker],
+                bids=orderbook["bids"],
+                asks=orderbook["asks"],
+                timestamp=timestamp,
+            )
+            for ticker, orderbook in order_books.items()
+        ]
+
+    async def update_orderbooks(self, timestamp: int, max_concurrent_requests: int = 10) -> None:
         """
         Fetches orderbook data for all provided markets and pushes it to the database.
 
         Parameters:
         - timestamp: Timestamp to use when storing data. Used to make some aggregations easier
                     accross all the different markets, since we don't need high precision.
+        - max_concurrent_requests: Maximum number of orderbooks fetched at once.
         """
+        order_books = await self.get_orderbooks(asyncio.Semaphore(max_concurrent_requests))
+
+        with db.get_db_session() as session:
+            store_liquidity(self.get_records(order_books, timestamp), session)
+            session.commit()
 
 
 class Phoenix(CLOB):
@@ -66,6 +123,7 @@ class Phoenix(CLOB):
 
         self.identifier = "PHOENIX"
         self.tickers = get_relevant_tickers(self.identifier)
+        self.markets = self.tickers
         self.client = PhoenixClient(commitment=commitment, endpoint=endpoint)
 
     async def get_onchain_orderbook(
@@ -86,31 +144,13 @@ class Phoenix(CLOB):
             LOGGER.error(f"Unknown Phoenix market address: {market_address}")
             return {"bids": [], "asks": []}
 
-    async def update_orderbooks(self, timestamp: int) -> None:
-        order_books = {
-            ticker: await self.get_onchain_orderbook(address)
-            for ticker, address in self.tickers.items()
-        }
-        with db.get_db_session() as session:
-
-            for ticker, orderbook in order_books.items():
-                ob_liq_record = db.CLOBLiqudity(
-                    dex=self.identifier,
-                    pair=ticker,
-                    market_address=self.tickers[ticker],
-                    bids=orderbook["bids"],
-                    asks=orderbook["asks"],
-                    timestamp=timestamp,
-                )
-                session.add(ob_liq_record)
-            session.commit()
-
 
 class OpenBook(CLOB):
     def __init__(
         self,
         commitment: Commitment = Commitment("finalized"),
         endpoint: str | None = None,
+        client: SolanaClient | None = None,
     ):
 
         if endpoint is None:
@@ -118,13 +158,22 @@ class OpenBook(CLOB):
 
         self.identifier = "OPENBOOK"
         self.tickers = get_relevant_tickers(self.identifier)
-        self.client = SolanaClient(
-            endpoint=endpoint,  # Good enough for this use
-            commitment=commitment,
-        )
+        self.markets = self.tickers
+        if client is None:
+            client = SolanaClient(
+                endpoint=endpoint,  # Good enough for this use
+                commitment=commitment,
+            )
+        self.client = client
 
     async def get_onchain_orderbook(
         self, market_address: str
+    ) -> dict[str, list[tuple[float, float]]]:
+        # The client is blocking, run it in a thread so that markets can be fetched concurrently.
+        return await asyncio.to_thread(self._get_onchain_orderbook, market_address)
+
+    def _get_onchain_orderbook(
+        self, market_address: str
     ) -> dict[str, list[tuple[float, float]]]:
         market_pubkey = PublicKey(market_address)
 
@@ -146,39 +195,24 @@ class OpenBook(CLOB):
             LOGGER.error(f"Unknown OpenBook market address: {market_address}")
             return {"bids": [], "asks": []}
 
-    async def update_orderbooks(self, timestamp: int) -> None:
-        order_books = {
-            ticker: await self.get_onchain_orderbook(address)
-            for ticker, address in self.tickers.items()
-        }
-
-        with db.get_db_session() as session:
-
-            for ticker, orderbook in order_books.items():
-                ob_liq_record = db.CLOBLiqudity(
-                    dex=self.identifier,
-                    pair=ticker,
-                    market_address=self.tickers[ticker],
-                    bids=orderbook["bids"],
-                    asks=orderbook["asks"],
-                    timestamp=timestamp,
-                )
-                session.add(ob_liq_record)
-            session.commit()
-
 
 class GooseFx(CLOB):
     def __init__(
         self,
         commitment: Commitment = Commitment("finalized"),
         endpoint: str | None = None,
+        client: SolanaClient | None = None,
     ):
         if endpoint is None:
             endpoint = "https://api.mainnet-beta.solana.com"
 
         self.identifier = "GOOSEFX"
         self.tickers = ["SOL-PERP"]
-        self.client = SolanaClient(endpoint=endpoint, commitment=commitment)
+        # GooseFX markets are identified by their tickers.
+        self.markets = {ticker: ticker for ticker in self.tickers}
+        if client is None:
+            client = SolanaClient(endpoint=endpoint, commitment=commitment)
+        self.client = client
         self.commitment = commitment
 
         # Set up Perp class
@@ -203,6 +237,12 @@ class GooseFx(CLOB):
 
     async def get_onchain_orderbook(
         self, market_address: str
+    ) -> dict[str, list[tuple[float, float]]]:
+        # The client is blocking, run it in a thread so that markets can be fetched concurrently.
+        return await asyncio.to_thread(self._get_onchain_orderbook, market_address)
+
+    def _get_onchain_orderbook(
+        self, market_address: str
     ) -> dict[str, list[tuple[float, float]]]:
         try:
             product = Product(self.perp)
@@ -242,21 +282,3 @@ class GooseFx(CLOB):
         except AttributeError:
             LOGGER.error(f"Error while collecting GooseFx {market_address} orderbook")
             return {"bids": [], "asks": []}
-
-    async def update_orderbooks(self, timestamp: int) -> None:
-        order_books = {
-            ticker: await self.get_onchain_orderbook(ticker) for ticker in self.tickers
-        }
-
-        with db.get_db_session() as session:
-            for ticker, orderbook in order_books.items():
-                ob_liq_record = db.CLOBLiqudity(
-                    dex=self.identifier,
-                    pair=ticker,
-                    market_address=ticker,
-                    bids=orderbook["bids"],
-                    asks=orderbook["asks"],
-                    timestamp=timestamp,
-                )
-                session.add(ob_liq_record)
-            session.commit()
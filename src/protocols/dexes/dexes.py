@@ -2,12 +2,18 @@
 Module containg logic for fetching Solana onchain liquidity - 
 both AMM and CLOB (in which case it also pushes it the database).
 """
+import asyncio
 import logging
 import os
 import time
 import traceback
+from typing import Iterator
+
+from solana.rpc.commitment import Commitment
+from solana.rpc.api import Client as SolanaClient
 
 from src.protocols.dexes.clob import CLOB
+from src.protocols.dexes.liquidity_history import iter_liquidity, prune_liquidity, store_liquidity
 
 # Ordebook-based DEXes
 from src.protocols.dexes.clob import Phoenix
@@ -15,8 +21,13 @@ from src.protocols.dexes.clob import OpenBook
 from src.protocols.dexes.clob import GooseFx
 import db
 
-# Collect and store orderbook liquidity every 5 minutes
+# Collect and store orderbook liquidity every 20 minutes
 COLLECT_INTERVAL_SECONDS: int = 20 * 60
+# Maximum number of orderbooks fetched at once, accross all CLOBs
+MAX_CONCURRENT_REQUESTS: int = 10
+# Full orderbooks are kept for 8 days (liquidity normalization uses the last week), older data
+# is available in the compact history table
+ORDERBOOK_LIQUIDITY_RETENTION_SECONDS: int = 8 * 86_400
 
 AUTHENTICATED_RPC_URL = os.environ.get("AUTHENTICATED_RPC_URL")
 if AUTHENTICATED_RPC_URL is None:
@@ -43,16 +54,55 @@ class CLOBs:
     List of CLOB to update orderbooks for provided during initialization.
     """
 
-    def __init__(self, clob_list: list[CLOB]) -> None:
+    def __init__(self, clob_list: list[CLOB], max_concurrent_requests: int = MAX_CONCURRENT_REQUESTS) -> None:
         self.clob_list = clob_list
+        self.max_concurrent_requests = max_concurrent_requests
 
-    async def update_orderbooks(self) -> None:
+    @staticmethod
+    async def _get_orderbooks(
+        dex: CLOB, semaphore: asyncio.Semaphore
+    ) -> tuple[dict[str, dict[str, list[tuple[float, float]]]], float]:
+        """
+        Fetches orderbooks of single CLOB dex and measures how long it took.
         """
-        Updates orderbooks of all provided CLOB dexes
+        time_start = time.time()
+        order_books = await dex.get_orderbooks(semaphore)
+        return order_books, time.time() - time_start
+
+    async def update_orderbooks(self) -> dict[str, float]:
+        """
+        Updates orderbooks of all provided CLOB dexes. Orderbooks of all markets are fetched concurrently
+        and stored at once with a common timestamp.
+
+        Returns:
+        - dict: Dictionary mapping CLOB identifiers to the time (in seconds) it took to fetch their orderbooks.
         """
         timestamp = int(time.time())
-        for dex in self.clob_list:
-            await dex.update_orderbooks(timestamp)
+        semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+
+        results = await asyncio.gather(
+            *(self._get_orderbooks(dex, semaphore) for dex in self.clob_list),
+            return_exceptions=True,
+        )
+
+        records = []
+        latencies = {}
+        for dex, result in zip(self.clob_list, results):
+            if isinstance(result, BaseException):
+                err_msg = "".join(traceback.format_exception(result))
+                logging.error(f"Unable to fetch {dex.identifier} orderbooks:\n {err_msg}")
+                continue
+
+            order_books, latency = result
+            latencies[dex.identifier] = latency
+            logging.info(f"Fetched {len(order_books)} {dex.identifier} orderbooks in {latency:.2f} seconds")
+            records.extend(dex.get_records(order_books, timestamp))
+
+        with db.get_db_session() as session:
+            store_liquidity(records, session)
+            session.commit()
+
+        return latencies
 
 
 async def update_ob_dex_data():
@@ -60,15 +110,18 @@ async def update_ob_dex_data():
     Updates CLOB liquidity once.
     """
     try:
+        # OpenBook and GooseFx share one RPC client, Phoenix SDK manages its own async client.
+        client = SolanaClient(endpoint=AUTHENTICATED_RPC_URL, commitment=Commitment("finalized"))
         clobs = CLOBs(
             [
                 Phoenix(endpoint=AUTHENTICATED_RPC_URL),
-                OpenBook(endpoint=AUTHENTICATED_RPC_URL),
-                GooseFx(endpoint=AUTHENTICATED_RPC_URL),
+                OpenBook(endpoint=AUTHENTICATED_RPC_URL, client=client),
+                GooseFx(endpoint=AUTHENTICATED_RPC_URL, client=client),
             ]
         )
         await clobs.update_orderbooks()
         logging.info("Successfuly updated CLOB liquidity")
+        prune_liquidity(db.CLOBLiqudity, ORDERBOOK_LIQUIDITY_RETENTION_SECONDS, int(time.time()))
     except Exception as err:  # pylint: disable=W0718
         # We want to log any error but we want the collector
         # to keep on running.
@@ -100,21 +153,13 @@ async def update_ob_dex_data_continuously():
         time.sleep(max(0, COLLECT_INTERVAL_SECONDS - execution_time))
 
 
-def load_ob_dex_data(start_timestamp: int) -> list[db.CLOBLiqudity]:
+def load_ob_dex_data(start_timestamp: int, end_timestamp: int | None = None) -> Iterator[db.CLOBLiqudity]:
 
     """
-    Returns un-agreggated CLOB liquidity data starting from start_timestamp
+    Streams un-agreggated CLOB liquidity data between start_timestamp and end_timestamp, reconstructed
+    from the compact history. Entries are ordered by market and timestamp.
     """
-    with db.get_db_session() as session:
-        entries = (
-            session.query(
-                db.CLOBLiqudity,
-            )
-            .filter(db.CLOBLiqudity.timestamp >= start_timestamp)
-            .all()
-        )
-
-    return entries
+    return iter_liquidity(db.CLOBLiqudity, start_timestamp, end_timestamp)
 
 
 # TODO: To be implemented. pylint: disable=W0511
@@ -0,0 +1,375 @@
+"""
+Module containing compact storage of orderbook-like liquidity history.
+
+`CLOBLiqudity` and `DexNormalizedLiquidity` tables keep full bids/asks arrays and serve the latest snapshots. Their
+history is additionally stored in `CLOBLiquidityHistory` and `DexNormalizedLiquidityHistory` tables, where bids and
+asks are zlib-compressed float32 arrays of (price, size) levels. Every `KEYFRAME_INTERVAL`-th snapshot of a market is a
+keyframe containing the full book, other snapshots contain only levels that changed since the previous snapshot
+(a NaN size marks a removed level). Once history is stored, old rows of the full tables can be pruned with
+`prune_liquidity`.
+"""
+import logging
+import math
+import zlib
+from dataclasses import dataclass
+from typing import Iterator, Type
+
+import numpy as np
+import sqlalchemy
+from sqlalchemy.orm.session import Session
+
+import db
+
+
+LOG = logging.getLogger(__name__)
+
+# Full book is stored at least every `KEYFRAME_INTERVAL` snapshots of a market (once a day for 20 minute snapshots).
+KEYFRAME_INTERVAL: int = 72
+
+Levels = list[tuple[float, float]]
+AnyLiquidityModel = db.CLOBLiqudity | db.DexNormalizedLiquidity
+AnyLiquidityHistoryModel = Type[db.CLOBLiquidityHistory] | Type[db.DexNormalizedLiquidityHistory]
+
+# Maps liquidity models to their history models.
+HISTORY_MODELS: dict[type, AnyLiquidityHistoryModel] = {
+    db.CLOBLiqudity: db.CLOBLiquidityHistory,
+    db.DexNormalizedLiquidity: db.DexNormalizedLiquidityHistory,
+}
+# Columns identifying a market, i.e. primary key without the timestamp.
+KEY_COLUMNS: dict[type, tuple[str, ...]] = {
+    db.CLOBLiqudity: ("dex", "pair", "market_address"),
+    db.DexNormalizedLiquidity: ("dex", "market_address", "token_x_address", "token_y_address"),
+}
+
+
+def encode_levels(levels: Levels | np.ndarray) -> bytes:
+    """
+    Encodes price levels as a zlib-compressed float32 array.
+    """
+    return zlib.compress(np.asarray(levels, dtype=np.float32).reshape(-1, 2).tobytes())
+
+
+def decode_levels(data: bytes) -> np.ndarray:
+    """
+    Decodes price levels encoded by `encode_levels` to an array of shape (number of levels, 2).
+    """
+    return np.frombuffer(zlib.decompress(data), dtype=np.float32).reshape(-1, 2)
+
+
+def get_levels_delta(previous: np.ndarray, current: np.ndarray) -> np.ndarray | None:
+    """
+    Computes levels which changed between two snapshots of one side of a book. Removed levels have NaN size.
+    Returns None if the delta can't be computed, i.e. when price levels of the current snapshot aren't unique.
+    """
+    current_levels = dict(current.tolist())
+    if len(current_levels) != len(current):
+        return None
+
+    previous_levels = dict(previous.tolist())
+    delta = [
+        (price, size)
+        for price, size in current_levels.items()
+        if previous_levels.get(price) != size
+    ]
+    delta.extend((price, math.nan) for price in previous_levels if price not in current_levels)
+    return np.asarray(delta, dtype=np.float32).reshape(-1, 2)
+
+
+def apply_levels_delta(levels: np.ndarray, delta: np.ndarray, descending: bool) -> np.ndarray:
+    """
+    Applies levels delta computed by `get_levels_delta` to one side of a book.
+    """
+    book = dict(levels.tolist())
+    for price, size in delta.tolist():
+        if math.isnan(size):
+            book.pop(price, None)
+        else:
+            book[price] = size
+    return np.asarray(sorted(book.items(), reverse=descending), dtype=np.float32).reshape(-1, 2)
+
+
+@dataclass
+class BookState:
+    bids: np.ndarray
+    asks: np.ndarray
+    # Number of snapshots stored since the last keyframe
+    snapshots_since_keyframe: int = 0
+
+
+def _get_key(entry, key_columns: tuple[str, ...]) -> tuple[str, ...]:
+    return tuple(getattr(entry, column) for column in key_columns)
+
+
+def replay_liquidity_history(
+    session: Session,
+    model: type,
+    start_timestamp: int | None = None,
+    end_timestamp: int | None = None,
+    **filters: str,
+) -> Iterator[tuple[int, tuple[str, ...], BookState]]:
+    """
+    Reconstructs books from the history of the given liquidity model. Replay starts at the latest keyframe
+    preceding `start_timestamp` (or the latest keyframe of every market if `start_timestamp` is None) and yields
+    (timestamp, market key, book) for every stored snapshot up to `end_timestamp`, ordered by market and timestamp.
+    Snapshots preceding `start_timestamp` are yielded too, so that callers can pick up the state at any timestamp.
+
+    Parameters:
+    - session: DB session
+    - model: `db.CLOBLiqudity` or `db.DexNormalizedLiquidity`
+    - start_timestamp: timestamp from which snapshots are needed
+    - end_timestamp: timestamp (inclusive) up to which snapshots are needed
+    - filters: equality filters on key columns, e.g. `dex='PHOENIX'`
+    """
+    history_model = HISTORY_MODELS[model]
+    key_columns = KEY_COLUMNS[model]
+    columns = [getattr(history_model, column) for column in key_columns]
+
+    keyframes_query = session.query(
+        *columns, sqlalchemy.func.max(history_model.timestamp).label("keyframe_timestamp")
+    ).filter(history_model.is_keyframe.is_(True))
+    if start_timestamp is not None:
+        keyframes_query = keyframes_query.filter(history_model.timestamp <= start_timestamp)
+    for column, value in filters.items():
+        keyframes_query = keyframes_query.filter(getattr(history_model, column) == value)
+    keyframes = keyframes_query.group_by(*columns).subquery()
+
+    # Markets without a keyframe preceding `start_timestamp` are replayed from their first snapshot, which is
+    # always a keyframe.
+    query = session.query(history_model).outerjoin(
+        keyframes,
+        sqlalchemy.and_(*(column == keyframes.c[column.key] for column in columns)),
+    ).filter(
+        sqlalchemy.or_(
+            keyframes.c.keyframe_timestamp.is_(None),
+            history_model.timestamp >= keyframes.c.keyframe_timestamp,
+        )
+    )
+    if start_timestamp is None:
+        query = query.filter(keyframes.c.keyframe_timestamp.isnot(None))
+    if end_timestamp is not None:
+        query = query.filter(history_model.timestamp <= end_timestamp)
+    for column, value in filters.items():
+        query = query.filter(getattr(history_model, column) == value)
+    query = query.order_by(*columns, history_model.timestamp)
+
+    states: dict[tuple[str, ...], BookState] = {}
+    for entry in query.yield_per(1_000):
+        key = _get_key(entry, key_columns)
+        bids = decode_levels(entry.bids)
+        asks = decode_levels(entry.asks)
+
+        if entry.is_keyframe:
+            state = BookState(bids=bids, asks=asks)
+        elif key in states:
+            previous_state = states[key]
+            state = BookState(
+                bids=apply_levels_delta(previous_state.bids, bids, descending=True),
+                asks=apply_levels_delta(previous_state.asks, asks, descending=False),
+                snapshots_since_keyframe=previous_state.snapshots_since_keyframe + 1,
+            )
+        else:
+            LOG.warning(f"Skipping delta of {key} at {entry.timestamp}, no preceding keyframe.")
+            continue
+
+        states[key] = state
+        yield entry.timestamp, key, state
+
+
+def _to_liquidity_model(model: type, timestamp: int, key: tuple[str, ...], state: BookState) -> AnyLiquidityModel:
+    return model(
+        timestamp=timestamp,
+        bids=state.bids.tolist(),
+        asks=state.asks.tolist(),
+        **dict(zip(KEY_COLUMNS[model], key)),
+    )
+
+
+def iter_liquidity(
+    model: type,
+    start_timestamp: int,
+    end_timestamp: int | None = None,
+    **filters: str,
+) -> Iterator[AnyLiquidityModel]:
+    """
+    Streams reconstructed snapshots in the given time range as (transient) entries of the given liquidity model,
+    ordered by market and timestamp.
+    """
+    with db.get_db_session() as session:
+        for timestamp, key, state in replay_liquidity_history(
+            session, model, start_timestamp, end_timestamp, **filters
+        ):
+            if timestamp >= start_timestamp:
+                yield _to_liquidity_model(model, timestamp, key, state)
+
+
+def get_liquidity_at(model: type, timestamp: int, **filters: str) -> list[AnyLiquidityModel]:
+    """
+    Reconstructs the latest snapshot of every market at the given timestamp as (transient) entries of the given
+    liquidity model. For `db.DexNormalizedLiquidity` the result can be used in place of `get_normalized_liquidity`.
+    """
+    latest: dict[tuple[str, ...], tuple[int, BookState]] = {}
+    with db.get_db_session() as session:
+        for snapshot_timestamp, key, state in replay_liquidity_history(
+            session, model, timestamp, timestamp, **filters
+        ):
+            latest[key] = (snapshot_timestamp, state)
+
+    return [
+        _to_liquidity_model(model, snapshot_timestamp, key, state)
+        for key, (snapshot_timestamp, state) in latest.items()
+    ]
+
+
+class LiquidityHistoryWriter:
+    """
+    Converts entries of a liquidity model to history entries. Keeps the last stored book of every market in memory,
+    the state is loaded from the database when the writer is used for the first time. Books of history entries added
+    to a session become the last stored books only once the session is committed, so that deltas are never computed
+    against books which were rolled back.
+    """
+
+    def __init__(self, model: type) -> None:
+        self.model = model
+        self.history_model = HISTORY_MODELS[model]
+        self.key_columns = KEY_COLUMNS[model]
+        self.states: dict[tuple[str, ...], BookState] | None = None
+
+    def load_states(self, session: Session) -> None:
+        self.states = {
+            key: state
+            for _, key, state in replay_liquidity_history(session, self.model)
+        }
+
+    def get_pending_states(self, session: Session) -> dict[tuple[str, ...], BookState]:
+        """
+        Returns books of history entries added to the session but not committed yet. They replace the last stored
+        books when the session is committed and are discarded when it is rolled back.
+        """
+        info_key = (LiquidityHistoryWriter, self.model)
+        if info_key not in session.info:
+            session.info[info_key] = {}
+
+            def apply_pending_states(session: Session) -> None:
+                assert self.states is not None
+                self.states.update(session.info[info_key])
+                session.info[info_key].clear()
+
+            def discard_pending_states(session: Session) -> None:
+                session.info[info_key].clear()
+
+            sqlalchemy.event.listen(session, "after_commit", apply_pending_states)
+            sqlalchemy.event.listen(session, "after_rollback", discard_pending_states)
+        return session.info[info_key]
+
+    def get_history_entries(
+        self, entries: list[AnyLiquidityModel], session: Session
+    ) -> list[db.CLOBLiquidityHistory | db.DexNormalizedLiquidityHistory]:
+        if self.states is None:
+            self.load_states(session)
+        assert self.states is not None
+        pending_states = self.get_pending_states(session)
+
+        history_entries = []
+        for entry in entries:
+            key = _get_key(entry, self.key_columns)
+            bids = np.asarray(entry.bids or [], dtype=np.float32).reshape(-1, 2)
+            asks = np.asarray(entry.asks or [], dtype=np.float32).reshape(-1, 2)
+
+            previous_state = pending_states.get(key, self.states.get(key))
+            bids_delta = asks_delta = None
+            if previous_state is not None and previous_state.snapshots_since_keyframe + 1 < KEYFRAME_INTERVAL:
+                bids_delta = get_levels_delta(previous_state.bids, bids)
+                asks_delta = get_levels_delta(previous_state.asks, asks)
+
+            # Store full book if there is no usable state or if the delta isn't smaller than the book.
+            is_keyframe = (
+                bids_delta is None
+                or asks_delta is None
+                or len(bids_delta) + len(asks_delta) >= len(bids) + len(asks)
+            )
+            if is_keyframe:
+                pending_states[key] = BookState(bids=bids, asks=asks)
+            else:
+                assert previous_state is not None
+                pending_states[key] = BookState(
+                    bids=bids,
+                    asks=asks,
+                    snapshots_since_keyframe=previous_state.snapshots_since_keyframe + 1,
+                )
+
+            history_entries.append(
+                self.history_model(
+                    timestamp=entry.timestamp,
+                    is_keyframe=is_keyframe,
+                    bids=encode_levels(bids if is_keyframe else bids_delta),
+                    asks=encode_levels(asks if is_keyframe else asks_delta),
+                    **dict(zip(self.key_columns, key)),
+                )
+            )
+        return history_entries
+
+
+_WRITERS: dict[type, LiquidityHistoryWriter] = {}
+
+
+def store_liquidity(entries: list[AnyLiquidityModel], session: Session) -> None:
+    """
+    Stores entries of a liquidity model together with their compact history. Doesn't commit the session, the history
+    of further entries is based on these entries only once the session is committed.
+    """
+    if not entries:
+        return
+
+    model = type(entries[0])
+    if model not in _WRITERS:
+        _WRITERS[model] = LiquidityHistoryWriter(model)
+
+    session.add_all(entries)
+    session.add_all(_WRITERS[model].get_history_entries(entries, session))
+
+
+def prune_liquidity(model: type, retention_seconds: int, now: int) -> None:
+    """
+    Deletes entries of the given liquidity model older than the retention period. Their history is kept in the
+    history table.
+    """
+    with db.get_db_session() as session:
+        deleted = session.query(model).filter(model.timestamp < now - retention_seconds).delete(
+            synchronize_session=False
+        )
+        session.commit()
+    LOG.info(f"Pruned {deleted} entries of {model.__tablename__}")
+
+
+def backfill_liquidity_history(model: type, batch_size: int = 1_000) -> None:
+    """
+    Stores history of entries of the given liquidity model which precede the first stored history entry. Meant to
+    be run once before old entries get pruned.
+    """
+    history_model = HISTORY_MODELS[model]
+    writer = LiquidityHistoryWriter(model)
+    # Start from empty books, so that the first backfilled snapshot of every market is a keyframe.
+    writer.states = {}
+
+    with db.get_db_session() as session, db.get_db_session() as write_session:
+        first_history_timestamp = session.query(sqlalchemy.func.min(history_model.timestamp)).scalar()
+        query = session.query(model)
+        if first_history_timestamp is not None:
+            query = query.filter(model.timestamp < first_history_timestamp)
+        query = query.order_by(model.timestamp)
+
+        batch = []
+        stored = 0
+        for entry in query.yield_per(batch_size):
+            batch.append(entry)
+            if len(batch) < batch_size:
+                continue
+            write_session.add_all(writer.get_history_entries(batch, write_session))
+            write_session.commit()
+            stored += len(batch)
+            batch = []
+            LOG.info(f"Backfilled {stored} entries of {model.__tablename__}")
+
+        write_session.add_all(writer.get_history_entries(batch, write_session))
+        write_session.commit()
+        LOG.info(f"Backfilled {stored + len(batch)} entries of {model.__tablename__}")
@@ -1,5 +1,5 @@
 import os
-import math
+import asyncio
 import time
 import logging
 import traceback
@@ -10,21 +10,34 @@ import logging
 from solana.rpc.async_api import AsyncClient
 from solders.pubkey import Pubkey
 import numpy as np
-import pandas as pd
+from sqlalchemy import text
 
 import db
 from src.protocols.dexes.amms.utils import convert_amm_reserves_to_bids_asks
 from src.protocols.dexes.amms.utils import get_tokens_address_to_info_map
 from src.protocols.dexes.amms.utils import get_tokens_symbol_to_info_map
 from src.protocols.dexes.amms.utils import get_mint_decimals
+from src.protocols.dexes.liquidity_history import prune_liquidity, store_liquidity
 
 LOG = logging.getLogger(__name__)
 NORMALIZE_INTERVAL_SECONDS: int = 20 * 60  # Five minutes
+# Full normalized liquidity is kept for 2 days, older data is available in the compact history table
+NORMALIZED_LIQUIDITY_RETENTION_SECONDS: int = 2 * 86_400
+# Pairs whose token amounts didn't change are normalized again after this time, so that their latest normalized
+# snapshot is never pruned
+NORMALIZED_LIQUIDITY_REFRESH_SECONDS: int = 86_400
+# Maximum number of AmmLiquidity entries normalized concurrently
+MAX_CONCURRENT_HANDLERS: int = 10
 
 AUTHENTICATED_RPC_URL = os.environ.get("AUTHENTICATED_RPC_URL")
 if AUTHENTICATED_RPC_URL is None:
     raise ValueError("No AUTHENTICATED_RPC_URL env var")
 
+# Decimals of tokens not present in API, fetched onchain, by token address
+_onchain_token_decimals: dict[str, int] = {}
+# Token X amount, token Y amount and normalization timestamp of the last normalized AmmLiquidity entry by pair
+_last_normalized_amounts: dict[tuple[str, str, str, str], tuple[int | None, int | None, int]] = {}
+
 
 def get_last_entries_per_dex_per_pair() -> list[db.AmmLiquidity]:
     """
@@ -57,7 +70,41 @@ def get_last_entries_per_dex_per_pair() -> list[db.AmmLiquidity]:
 
 
 async def get_onchain_token_decimals(token_address: Pubkey) -> int:
-    return await get_mint_decimals(token_address, AsyncClient(AUTHENTICATED_RPC_URL))
+    """
+    Fetches decimals of the token onchain, once per token.
+    """
+    if str(token_address) not in _onchain_token_decimals:
+        async with AsyncClient(AUTHENTICATED_RPC_URL) as client:
+            _onchain_token_decimals[str(token_address)] = await get_mint_decimals(token_address, client)
+    return _onchain_token_decimals[str(token_address)]
+
+
+def _get_pair_key(entry: db.AmmLiquidity) -> tuple[str, str, str, str]:
+    return (entry.dex, entry.market_address, entry.token_x_address, entry.token_y_address)
+
+
+def is_entry_changed(entry: db.AmmLiquidity, timestamp: int) -> bool:
+    """
+    Checks whether the entry needs to be normalized, i.e. whether its token amounts changed since the last normalized
+    snapshot of the pair or the snapshot is older than `NORMALIZED_LIQUIDITY_REFRESH_SECONDS`.
+
+    Parameters:
+    - entry: AmmLiquidity table entry
+    - timestamp: timestamp of the current normalization
+
+    Returns:
+    - True if the entry needs to be normalized
+    """
+    last_normalized = _last_normalized_amounts.get(_get_pair_key(entry))
+    if last_normalized is None:
+        return True
+
+    token_x_amount, token_y_amount, normalized_timestamp = last_normalized
+    return (
+        entry.token_x_amount != token_x_amount
+        or entry.token_y_amount != token_y_amount
+        or timestamp - normalized_timestamp >= NORMALIZED_LIQUIDITY_REFRESH_SECONDS
+    )
 
 
 async def common_raw_amm_data_handler(
@@ -152,14 +199,15 @@ def upload_normalized_liquidity(data: list[db.DexNormalizedLiquidity]):
         return
 
     with db.get_db_session() as sesh:
-        sesh.add_all(data)
+        store_liquidity(data, sesh)
         sesh.commit()
 
 
 async def normalize_amm_liquidity():
     """
     Fetches latest values of AmmLiquidity, converts them to DexNormalizedLiquidity
-    and uploads them to database.
+    and uploads them to database. Pairs whose token amounts didn't change since their
+    last normalized snapshot are skipped, the other ones are converted concurrently.
     """
     try:
         tokens = get_tokens_address_to_info_map()
@@ -167,7 +215,14 @@ async def normalize_amm_liquidity():
 
         timestamp = int(time.time())
 
-        normalized_data = []
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_HANDLERS)
+
+        async def normalize_entry(entry, handler):
+            async with semaphore:
+                return entry, await handler(entry, timestamp, tokens)
+
+        tasks = []
+        unchanged = 0
 
         for entry in entries:
 
@@ -184,119 +239,157 @@ async def normalize_amm_liquidity():
                 LOG.error(f"Unable to find normalization handler for {entry.dex}")
                 continue
 
-            normalized_entry = await handler(entry, timestamp, tokens)
+            if not is_entry_changed(entry, timestamp):
+                unchanged += 1
+                continue
+
+            tasks.append(normalize_entry(entry, handler))
+
+        LOG.info(f"Normalizing {len(tasks)} AMM pairs, {unchanged} unchanged pairs skipped.")
+
+        normalized_data = []
+        normalized_entries = []
+
+        for entry, normalized_entry in await asyncio.gather(*tasks):
 
             if not normalized_entry:
                 LOG.error("Received None entry when normalizing.")
                 continue
 
             normalized_data.append(normalized_entry)
+            normalized_entries.append(entry)
 
         upload_normalized_liquidity(normalized_data)
 
+        for entry in normalized_entries:
+            _last_normalized_amounts[_get_pair_key(entry)] = (
+                entry.token_x_amount,
+                entry.token_y_amount,
+                timestamp,
+            )
+
     except Exception as e:  # pylint: disable=broad-exception-caught
         tb_str = traceback.format_exc()
         # Log the error message along with the traceback
         LOG.error(f"An error occurred: {e}\nTraceback:\n{tb_str}")
 
 
-def get_week_of_clob_data() -> pd.DataFrame:
+# Median volume within 5% of the mid price over the last week and the latest mid price of every (dex, pair). Volume of
+# a snapshot is the amount of bids and asks priced within 5% of its mid price (relative to the larger of the two
+# prices), the amount of the best bid and ask if there is none, and 0 if either side of the book is empty.
+CLOB_LIQUIDITY_STATS_QUERY = f"""
+WITH snapshots AS (
+    SELECT
+        dex,
+        pair,
+        "timestamp",
+        bids,
+        asks,
+        CASE
+            WHEN cardinality(bids) > 0 AND cardinality(asks) > 0 THEN (bids[1][1] + asks[1][1]) / 2
+        END AS mid_price
+    FROM {db.SCHEMA}.{db.CLOBLiqudity.__tablename__}
+    WHERE "timestamp" >= :since AND pair NOT LIKE '%PERP%'
+),
+volumes AS (
+    SELECT
+        snapshots.dex,
+        snapshots.pair,
+        snapshots."timestamp",
+        snapshots.mid_price,
+        CASE
+            WHEN snapshots.mid_price IS NULL THEN 0
+            ELSE COALESCE(NULLIF(levels.volume, 0), snapshots.bids[1][2] + snapshots.asks[1][2])
+        END AS volume
+    FROM snapshots
+    CROSS JOIN LATERAL (
+        SELECT COALESCE(SUM(book.amount), 0) AS volume
+        FROM (
+            SELECT snapshots.bids[i][1] AS price, snapshots.bids[i][2] AS amount
+            FROM generate_subscripts(snapshots.bids, 1) AS i
+            UNION ALL
+            SELECT snapshots.asks[i][1], snapshots.asks[i][2]
+            FROM generate_subscripts(snapshots.asks, 1) AS i
+        ) AS book
+        WHERE ABS(book.price - snapshots.mid_price) <= 0.05 * GREATEST(ABS(book.price), ABS(snapshots.mid_price))
+    ) AS levels
+)
+SELECT
+    dex,
+    pair,
+    percentile_cont(0.5) WITHIN GROUP (ORDER BY volume) AS week_median_volume,
+    (array_agg(mid_price ORDER BY "timestamp" DESC))[1] AS mid_price
+FROM volumes
+GROUP BY dex, pair
+"""
+
+
+def get_week_of_clob_liquidity_stats() -> list[tuple[str, str, float, float | None]]:
+    """
+    Aggregates the last week of CLOB liquidity in the database.
+
+    Returns:
+    - (dex, pair, median volume within 5% of the mid price, latest mid price) for every dex and pair, except for perps
+    """
     one_week_ago = time.time() - 7 * 86_400
     with db.get_db_session() as sesh:
-        distinct_pairs = (
-            sesh.query(db.CLOBLiqudity.dex, db.CLOBLiqudity.pair)
-            .distinct(db.CLOBLiqudity.dex, db.CLOBLiqudity.pair)
-            .all()
-        )
-        all_data = []
-        
-        for dex, pair in distinct_pairs:
-            week_data = (
-                sesh.query(db.CLOBLiqudity)
-                .filter(db.CLOBLiqudity.dex == dex)
-                .filter(db.CLOBLiqudity.pair == pair)
-                .filter(db.CLOBLiqudity.timestamp >= one_week_ago)
-            )
-
-            df = pd.read_sql(week_data.statement, sesh.bind)
-            all_data.append(df)
-            
-    df = pd.concat(all_data)
-    df = df[~df['pair'].str.contains('PERP')]
-    return df
-
-def get_volume_at_five_percent(row: pd.Series) -> float:
-    bids = row['bids']
-    asks = row['asks']
-    if not bids or not asks:
-        return 0
-        
-    mid_price = (bids[0][0] + asks[0][0]) / 2
-
-    volume = 0
-    for price, amount in (bids + asks): 
-        if math.isclose(price, mid_price, rel_tol=0.05):
-            volume += amount
+        return [
+            tuple(row)
+            for row in sesh.execute(text(CLOB_LIQUIDITY_STATS_QUERY), {'since': one_week_ago}).all()
+        ]
 
-    if volume == 0:
-        return (bids[0][1] + asks[0][1]) 
 
-    return volume
-
-def normalize_clob_liqudity(clob_data: pd.DataFrame) -> list[db.DexNormalizedLiquidity]:
+def normalize_clob_liqudity(
+    clob_stats: list[tuple[str, str, float, float | None]]
+) -> list[db.DexNormalizedLiquidity]:
     symbols = get_tokens_symbol_to_info_map()
     normalized_entries = []
     now = int(time.time())
-    for dex, dex_df in list(clob_data.groupby('dex')):
-        for pair, pair_df in list(dex_df.groupby('pair')):
-            week_median_volume = pair_df.apply(lambda x: get_volume_at_five_percent(x), axis = 1).median()
-            base_token, quote_token = pair.split('/')
+    for dex, pair, week_median_volume, mid_price in clob_stats:
+        base_token, quote_token = pair.split('/')
+
+        if not mid_price:
+            logging.info(f'No mid price found for {dex}: {pair}')
+            continue
+
+        if not symbols.get(base_token) or not symbols.get(quote_token):
+            logging.info(f"No address found for either of: {pair}")
+            continue
+        base_address = symbols[base_token]['address']
+        quote_address = symbols[quote_token]['address']
+
+        NUM_LEVELS = 1_000
+        # Create 1k price levels from -99% to 99%
+        new_price_levels = np.linspace(mid_price * 0.01, mid_price * 1.99, NUM_LEVELS)
+
+        volume_per_level = week_median_volume / (NUM_LEVELS * 0.05)
+
+        new_bids = [
+            (price, volume_per_level) for price in new_price_levels
+            if  price < mid_price
+        ]
+        new_asks = [
+            (price, volume_per_level) for price in new_price_levels
+            if price > mid_price
+        ]
+        new_entry = db.DexNormalizedLiquidity(
+            timestamp = now,
+            dex = dex,
+            market_address = pair,
+            token_x_address = base_address,
+            token_y_address = quote_address,
+            bids = new_bids,
+            asks = new_asks
+        )
 
-            mid_price = pair_df.iloc[pair_df['timestamp'].idxmax()].to_frame().apply(lambda x: (x['bids'][0][0] + x['asks'][0][0]) / 2 if x['bids'] and x['asks'] else 0).iloc[0]
+        normalized_entries.append(new_entry)
 
-            if not mid_price: 
-                logging.info(f'No mid price found for {dex}: {pair}')
-                continue
-
-            if not symbols.get(base_token) or not symbols.get(quote_token):
-                logging.info(f"No address found for either of: {pair}")
-                continue
-            base_address = symbols[base_token]['address']
-            quote_address = symbols[quote_token]['address']
-
-            NUM_LEVELS = 1_000               
-            # Create 1k price levels from -99% to 99%
-            new_price_levels = np.linspace(mid_price * 0.01, mid_price * 1.99, NUM_LEVELS)
-            
-            volume_per_level = week_median_volume / (NUM_LEVELS * 0.05)
-
-            new_bids = [
-                (price, volume_per_level) for price in new_price_levels 
-                if  price < mid_price
-            ]
-            new_asks = [
-                (price, volume_per_level) for price in new_price_levels 
-                if price > mid_price
-            ]
-            new_entry = db.DexNormalizedLiquidity(
-                timestamp = now,
-                dex = dex,
-                market_address = pair,
-                token_x_address = base_address,
-                token_y_address = quote_address,
-                bids = new_bids,
-                asks = new_asks
-            )       
-
-            normalized_entries.append(new_entry)
-
-            
     return normalized_entries
 
 def normalize_clob_dex_liqudity():
     try: 
-        df = get_week_of_clob_data()
-        normalized = normalize_clob_liqudity(df)
+        clob_stats = get_week_of_clob_liquidity_stats()
+        normalized = normalize_clob_liqudity(clob_stats)
         upload_normalized_liquidity(normalized)
     except Exception as e:
         tb_str = traceback.format_exc()
@@ -313,6 +406,7 @@ async def normalize_dex_data_continuously():
 
         await normalize_amm_liquidity()
         normalize_clob_dex_liqudity()
+        prune_liquidity(db.DexNormalizedLiquidity, NORMALIZED_LIQUIDITY_RETENTION_SECONDS, int(time_start))
 
         execution_time = time.time() - time_start
 
@@ -1,8 +1,12 @@
+import asyncio
+import itertools
 import os
 import logging
 import time
 
 import solana.rpc.api
+import sqlalchemy
+from solana.rpc.async_api import AsyncClient
 from solana.exceptions import SolanaRpcException
 from solders.rpc.responses import RpcConfirmedTransactionStatusWithSignature
 from solders.signature import Signature
@@ -10,12 +14,16 @@ from solders.transaction_status import EncodedConfirmedTransactionWithStatusMeta
 
 import db
 import src.protocols.addresses
+from src.collection.shared.rate_limiter import RateLimiter
+from src.metrics import REGISTRY, ROWS_WRITTEN, STAGE_DURATION
 
 
 
 LOGGER = logging.getLogger(__name__)
 
 TX_BATCH_SIZE = 1000
+# Number of blocks fetched concurrently when filling `transaction_data` column.
+BLOCK_BATCH_SIZE = 200
 
 
 
@@ -36,7 +44,8 @@ class TransactionCollector:
         self.rate_limit = rate_limit
 
         self.solana_client: solana.rpc.api.Client = solana.rpc.api.Client(self.authenticated_rpc_url)
-        self._call_timestamps: list[int] = []
+        self.async_solana_client: AsyncClient = AsyncClient(self.authenticated_rpc_url)
+        self.rate_limiter = RateLimiter(self.rate_limit)
         self._oldest_signatures: dict[str, Signature | None] = {address: None for address in self.addresses.values()}
         self._signatures_completed: dict[str, bool] = {address: False for address in self.addresses.values()}
         self._oldest_completed_slots: dict[str, int] = {address: 0 for address in self.addresses.values()}
@@ -45,24 +54,15 @@ class TransactionCollector:
 
     def _rate_limit_calls(self) -> None:
         """
-        This method implements a rate-limiting mechanism to control the frequency of API calls.
-        It ensures that the number of API calls does not exceed a predefined limit per second.
-        If the limit is reached, it will pause the execution momentarily before allowing further API calls.
+        Wait until an API call can be made without exceeding the rate limit shared by all collectors.
         """
-        # Check if the number of calls made in the last second exceeds the maximum limit.
-        while len(self._call_timestamps) >= self.rate_limit:
-            # Calculate the time passed since the first call in the timestamp list.
-            time_passed = time.time() - self._call_timestamps[0]
-
-            if time_passed > 1:
-                # More than a second has passed since the first call, remove it from the list.
-                self._call_timestamps.pop(0)
-            else:
-                # Wait for the remainder of the second before allowing more calls.
-                time.sleep(1 - time_passed)
+        self.rate_limiter.acquire()
 
-        # Record the timestamp of the current call.
-        self._call_timestamps.append(time.time())
+    async def _async_rate_limit_calls(self) -> None:
+        """
+        Asynchronous version of `_rate_limit_calls`.
+        """
+        await self.rate_limiter.async_acquire()
 
     def _fetch_signatures(
         self, 
@@ -87,7 +87,7 @@ class TransactionCollector:
             signatures = response.value
         except SolanaRpcException as e:  # Most likely to catch 503 here. If something else - we stuck in loop TODO fix
             LOGGER.error(f"SolanaRpcException: {e}")
-            time.sleep(2)
+            self.rate_limiter.back_off(2)
             return self._fetch_signatures(protocol=protocol, address=address)
 
         if len(signatures) < TX_BATCH_SIZE:
@@ -142,39 +142,54 @@ class TransactionCollector:
         address: str,
     ) -> None:
         """
-        Write transaction signatures to db.
+        Write transaction signatures to db. Signatures are inserted with one statement returning their IDs, which are
+        then used to insert errors and memos.
         :param transactions: fetched transactions
         """
+        # store only transactions from slot with complete transaction history fetched.
+        transactions_to_store = list(
+            itertools.takewhile(lambda x: x.slot >= self._oldest_completed_slots[address], transactions)
+        )
         with db.get_db_session() as session:
-            for transaction in transactions:
-                # store only transactions from slot with complete transaction history fetched.
-                if transaction.slot < self._oldest_completed_slots[address]:
-                    break
-
-                tx_status_record = db.TransactionStatusWithSignature(
-                    signature=str(transaction.signature),
-                    source=address,
-                    slot=transaction.slot,
-                    block_time=transaction.block_time
-                )
-                session.add(tx_status_record)
-                session.flush()  # Flush here to get the ID
+            if transactions_to_store:
+                ids = session.execute(
+                    sqlalchemy.insert(db.TransactionStatusWithSignature).returning(
+                        db.TransactionStatusWithSignature.id,
+                        sort_by_parameter_order=True,
+                    ),
+                    [
+                        {
+                            'signature': str(transaction.signature),
+                            'source': address,
+                            'slot': transaction.slot,
+                            'block_time': transaction.block_time,
+                        }
+                        for transaction in transactions_to_store
+                    ],
+                ).scalars().all()
                 # store errors and/or memos to db if any
-                if transaction.err:
-                    tx_error_record = db.TransactionStatusError(
-                        error_body=transaction.err.to_json(),
-                        tx_signatures_id=tx_status_record.id,
-                    )
-                    session.add(tx_error_record)
-                if transaction.memo:
-                    tx_memo_record = db.TransactionStatusMemo(
-                        memo_body=transaction.memo,
-                        tx_signatures_id=tx_status_record.id,
-                    )
-                    session.add(tx_memo_record)
-
-            self._oldest_signatures[address] = transaction.signature
+                errors = [
+                    {'error_body': transaction.err.to_json(), 'tx_signatures_id': tx_signatures_id}
+                    for tx_signatures_id, transaction in zip(ids, transactions_to_store)
+                    if transaction.err
+                ]
+                if errors:
+                    session.execute(sqlalchemy.insert(db.TransactionStatusError), errors)
+                memos = [
+                    {'memo_body': transaction.memo, 'tx_signatures_id': tx_signatures_id}
+                    for tx_signatures_id, transaction in zip(ids, transactions_to_store)
+                    if transaction.memo
+                ]
+                if memos:
+                    session.execute(sqlalchemy.insert(db.TransactionStatusMemo), memos)
             session.commit()
+        REGISTRY.inc(ROWS_WRITTEN, len(transactions_to_store), table=db.TransactionStatusWithSignature.__tablename__)
+
+        # The next batch is fetched before the oldest stored signature, so that the signatures of the incomplete slot
+        # are fetched again.
+        self._oldest_signatures[address] = (
+            transactions_to_store[-1].signature if transactions_to_store else transactions[-1].signature
+        )
 
     def collect_signatures(self) -> Signature:
         """
@@ -194,20 +209,20 @@ class TransactionCollector:
                 )
             )
 
-    def _fetch_transactions_from_block(self, slot: int) -> list[EncodedConfirmedTransactionWithStatusMeta]:
-        self._rate_limit_calls()
+    async def _async_fetch_transactions_from_block(self, slot: int) -> list[EncodedTransactionWithStatusMeta]:
+        await self._async_rate_limit_calls()
 
         # Fetch block data.
         try:
-            block = self.solana_client.get_block(
+            block = await self.async_solana_client.get_block(
                 slot=slot,
                 encoding='jsonParsed',
                 max_supported_transaction_version=0,
             )
         except SolanaRpcException as e:
             LOGGER.error(f"SolanaRpcException: {e}")
-            time.sleep(1)
-            return self._fetch_transactions_from_block(slot)
+            await self.rate_limiter.async_back_off(1)
+            return await self._async_fetch_transactions_from_block(slot)
 
         # Keep only transactions with protocol (program) public key involved.
         transactions = [tx for tx in block.value.transactions if self._is_transaction_relevant(tx)]
@@ -215,64 +230,91 @@ class TransactionCollector:
 
     def collect_transactions(self) -> None:
         """
-        Fill transaction data to `tx_signatures.tx_raw` column if missing.
+        Fill transaction data to `transactions.transaction_data` column if missing.
+        """
+        asyncio.run(self._async_collect_transactions())
+
+    async def _async_collect_transactions(self) -> None:
+        """
+        Fetch blocks with transactions missing `transaction_data` concurrently, `BLOCK_BATCH_SIZE` blocks at once, and store
+        transaction data of each batch with a single update.
+        """
+        for protocol, address in self.addresses.items():
+            # Slots are fetched in ascending order, so that a slot whose transactions can't be found in its block is
+            # not fetched again.
+            last_slot = -1
+            while not self._transactions_completed[address]:
+                slots = await asyncio.to_thread(self._get_slots_without_transaction_data, address, last_slot)
+                if not slots:
+                    self._transactions_completed[address] = True
+                    continue
+                last_slot = slots[-1]
+
+                start_time = time.time()
+                blocks = await asyncio.gather(
+                    *(self._async_fetch_transactions_from_block(slot) for slot in slots)
+                )
+                fetch_time = time.time() - start_time
+                REGISTRY.observe(STAGE_DURATION, fetch_time, stage='block_fetch')
+                new_transaction_data = [
+                    (str(transaction.transaction.signatures[0]), address, transaction.to_json())
+                    for transactions in blocks
+                    for transaction in transactions
+                ]
+                updated_count = await asyncio.to_thread(self._update_transaction_data, new_transaction_data)
+                elapsed_time = time.time() - start_time
+                LOGGER.info(
+                    f"Protocol = {protocol}: fetched {len(slots)} slots in {fetch_time:.2f} seconds "
+                    f"({len(slots) / fetch_time:.2f} slots per second), stored {updated_count} transactions, "
+                    f"{elapsed_time:.2f} seconds in total."
+                )
+
+    @staticmethod
+    def _get_slots_without_transaction_data(address: str, min_slot: int) -> list[int]:
+        """
+        Get up to `BLOCK_BATCH_SIZE` lowest slots after `min_slot` with transactions of the given address whose
+        `transaction_data` is NULL.
         """
-        block_counter = 0
-        start_time = time.time()
         with db.get_db_session() as session:
-            for protocol, address in self.addresses.items():
-                while not self._transactions_completed[address]:
-                    # Retrieve 200 transactions where tx_raw is NULL and source matches the address.
-                    slots = session.query(
-                        db.TransactionStatusWithSignature.id,
-                        db.TransactionStatusWithSignature.slot,
-                    ).filter(
-                        db.TransactionStatusWithSignature.tx_raw.is_(None),
-                        db.TransactionStatusWithSignature.source == address,
-                    ).limit(200).all()
-
-                    if not slots:
-                        self._transactions_completed[address] = True
-
-                    # Fetch each slot one by one.
-                    for slot in {slot for _, slot in slots}:
-                        transactions = self._fetch_transactions_from_block(slot)
-
-                        for transaction in transactions:
-                            # Update `tx_raw` column for each transaction.
-                            signature = transaction.transaction.signatures[0]
-                            self._update_tx_raw(
-                                signature=signature,
-                                address=address,
-                                new_tx_raw=transaction.to_json(),
-                            )
-
-                        block_counter += 1
-
-                    # Log every 10,000 slots
-                    if block_counter % 10_000 == 0:
-                        elapsed_time = time.time() - start_time
-                        LOGGER.info(f"Processed {block_counter} slots in {elapsed_time:.2f} seconds")
-
-    def _update_tx_raw(self, signature: Signature, address: str, new_tx_raw: str) -> None:
+            slots = session.query(
+                db.TransactionStatusWithSignature.slot,
+            ).filter(
+                db.TransactionStatusWithSignature.transaction_data.is_(None),
+                db.TransactionStatusWithSignature.source == address,
+                db.TransactionStatusWithSignature.slot > min_slot,
+            ).distinct().order_by(
+                db.TransactionStatusWithSignature.slot,
+            ).limit(BLOCK_BATCH_SIZE).all()
+        return [slot for slot, in slots]
+
+    @staticmethod
+    def _update_transaction_data(new_transaction_data: list[tuple[str, str, str]]) -> int:
         """
-        Update tx_signature (tx_raw) for given signature, if tx_raw is null, otherwise does nothing.
-        :param signature: Signature
-        :param new_tx_raw: jsonfyed transaction data
+        Update `transaction_data` of records with NULL `transaction_data` from (signature, source, transaction data)
+        tuples, with a single `UPDATE ... FROM (VALUES ...)` statement.
+        :param new_transaction_data: signatures and sources of the records with jsonfyed transaction data
+        :return: number of updated records
         """
+        if not new_transaction_data:
+            return 0
+        values = sqlalchemy.values(
+            sqlalchemy.column('signature', sqlalchemy.String),
+            sqlalchemy.column('source', sqlalchemy.String),
+            sqlalchemy.column('transaction_data', sqlalchemy.String),
+            name='new_transaction_data',
+        ).data(new_transaction_data)
         with db.get_db_session() as session:
-            # Query for the record with the given signature and source
-            record = session.query(db.TransactionStatusWithSignature).filter(
-                db.TransactionStatusWithSignature.tx_raw.is_(None)
-            ).filter_by(signature=str(signature), source=address).first()
-
-            # Check if the record exists.
-            if record:
-                # Update the tx_raw field.
-                record.tx_raw = new_tx_raw
-
-                # Commit the changes.
-                session.commit()
+            result = session.execute(
+                sqlalchemy.update(db.TransactionStatusWithSignature).where(
+                    db.TransactionStatusWithSignature.signature == values.c.signature,
+                    db.TransactionStatusWithSignature.source == values.c.source,
+                    db.TransactionStatusWithSignature.transaction_data.is_(None),
+                ).values(transaction_data=values.c.transaction_data),
+                execution_options={'synchronize_session': False},
+            )
+            session.commit()
+        REGISTRY.inc(ROWS_WRITTEN, result.rowcount, table=db.TransactionStatusWithSignature.__tablename__)
+        return result.rowcount
 
     def _is_transaction_relevant(
         self,
@@ -219,18 +219,26 @@ def get_liquidable_debt(
             logging.error(f'No liquidable debt found for protocols: {protocols}, pair: {token_pair}')
             return None
 
-        df = pd.concat(data)
+    return aggregate_liquidable_debt(data)
 
-        if not df.shape[0]:
-            return None
 
-        aggregated_data = (
-            df.groupby(["collateral_token", "debt_token", "collateral_token_price"])
-            .agg({"amount": "sum"})
-            .reset_index()
-        )
+def aggregate_liquidable_debt(data: list[pd.DataFrame]) -> pd.DataFrame | None:
+    """
+    Sums liquidable debts of several protocols at each collateral token price.
+    """
+    if not data:
+        return None
 
-    return aggregated_data
+    df = pd.concat(data)
+
+    if not df.shape[0]:
+        return None
+
+    return (
+        df.groupby(["collateral_token", "debt_token", "collateral_token_price"])
+        .agg({"amount": "sum"})
+        .reset_index()
+    )
 
 
 def get_normalized_liquidity(tokens: TokensSelected) -> list[db.DexNormalizedLiquidity]:
@@ -439,8 +447,26 @@ def get_main_chart_data(
     prices: dict[str, float | None],
 ) -> pd.DataFrame | None:
 
-    collateral_token = token_selection.collateral
-    collateral_token_price = prices.get(collateral_token.address)
+    data = get_debt_token_supply_data(token_selection, prices)
+    if data is None:
+        return None
+
+    # TODO: use protocols
+    liquidable_dept = get_liquidable_debt(protocols=protocols, token_pair=token_selection)
+    if liquidable_dept is None:
+        logging.error(f'No liquidable debt found for: {token_selection}')
+        return None
+
+    return add_liquidable_debt(data, liquidable_dept)
+
+
+def get_debt_token_supply_data(
+    token_selection: TokensSelected,
+    prices: dict[str, float | None],
+) -> pd.DataFrame | None:
+    """
+    Computes the supply of the debt token available on DEXes at each point of the collateral token price range.
+    """
     liquidity_entries = get_normalized_liquidity(token_selection)
     if len(liquidity_entries) == 0:
         logging.error(f'No liquidity entries found for {token_selection}')
@@ -460,16 +486,16 @@ def get_main_chart_data(
     data["debt_token_supply"] = data["collateral_token_price"].apply(
         lambda x: get_debt_token_supply_at_price_point(adjusted_entries, x, debt_token_price)
     )
+    return data
 
-    # TODO: use protocols
-    liquidable_dept = get_liquidable_debt(protocols=protocols, token_pair=token_selection)
-    if liquidable_dept is None:
-        logging.error(f'No liquidable debt found for: {token_selection}')
-        return None
-        
+
+def add_liquidable_debt(data: pd.DataFrame, liquidable_debt: pd.DataFrame) -> pd.DataFrame:
+    """
+    Merges liquidable debt to the debt token supply data, price points without any liquidable debt get zero.
+    """
     data = pd.merge(
         data,
-        liquidable_dept[['collateral_token_price', 'amount']],
+        liquidable_debt[['collateral_token_price', 'amount']],
         left_on='collateral_token_price',
         right_on='collateral_token_price',
         how='left',
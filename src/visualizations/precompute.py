@@ -0,0 +1,287 @@
+"""
+Shared precomputation layer for the dashboard.
+
+A single worker computes chart-ready frames and writes them as uncompressed Arrow IPC files to a directory shared by
+all dashboard replicas (`DASHBOARD_DATA_DIR`). Replicas memory-map these files instead of querying the database and
+the Jupiter API on their own, so adding replicas does not add database load. When a frame is missing or stale, the
+dashboard falls back to computing the data itself.
+"""
+import datetime
+import itertools
+import json
+import logging
+import os
+import time
+
+import pandas as pd
+import pyarrow.feather
+import streamlit as st
+
+import db
+import src.visualizations.loans_table
+import src.visualizations.main_chart
+import src.visualizations.protocol_stats
+from src.prices import PricesType, get_prices_for_tokens
+from src.protocols.dexes.amms.utils import get_tokens_address_to_info_map
+
+
+LOGGER = logging.getLogger(__name__)
+
+DASHBOARD_DATA_DIR = os.environ.get("DASHBOARD_DATA_DIR", "/tmp/derisk-dashboard")
+# Frames older than this are considered stale and ignored by the dashboard.
+MAX_FRAME_AGE = datetime.timedelta(minutes=int(os.environ.get("DASHBOARD_MAX_FRAME_AGE_MINUTES", 120)))
+PRECOMPUTE_INTERVAL = datetime.timedelta(minutes=20)
+
+# Protocols the dashboard offers, frames are precomputed for every non-empty subset of them.
+PROTOCOLS = ["kamino", "solend", "marginfi"]
+# Main chart data is precomputed only for pairs of tokens with at least this TVL (USD), other pairs are computed on
+# demand by the dashboard.
+MIN_TVL = 10_000
+DEFAULT_TOKENS = [
+    "So11111111111111111111111111111111111111112",  # SOL
+    "EPjFWdd5AufqSSqeM2qN1xzybapC8G4wEGGkZwyTDt1v",  # USDC
+]
+
+TOKENS_INFO = "tokens_info"
+PRICES = "prices"
+TOKENS_WITH_TVL = "tokens_with_tvl"
+USER_HEALTH_RATIOS = "user_health_ratios"
+MAIN_CHART = "main_chart"
+
+# Columns of the health ratios frame holding dicts, these are stored as JSON strings.
+HOLDINGS_COLUMNS = ["Collaterals", "Debts"]
+USER_HEALTH_RATIOS_COLUMNS = [
+    "User",
+    "Health Factor",
+    "Standardized Health Factor",
+    "Collateral (USD)",
+    "Risk. Adj. Collateral",
+    "Debt (USD)",
+    "Risk. Adj. Debt",
+    "Protocol",
+    *HOLDINGS_COLUMNS,
+]
+
+
+def get_protocols_key(protocols: list[str]) -> str:
+    return "-".join(sorted(set(protocols)))
+
+
+def get_token_pair_key(token_pair: src.visualizations.main_chart.TokensSelected) -> str:
+    return f"{token_pair.collateral.address}_{token_pair.loan.address}"
+
+
+def get_frame_path(*key: str) -> str:
+    return os.path.join(DASHBOARD_DATA_DIR, *key) + ".arrow"
+
+
+def store_frame(df: pd.DataFrame, *key: str):
+    """
+    Writes the frame under the given key. The file is written next to its destination and then renamed, so that
+    readers never see a partially written frame.
+    """
+    path = get_frame_path(*key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    # Uncompressed files can be memory-mapped without copying.
+    pyarrow.feather.write_feather(df.reset_index(drop=True), tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+
+
+def load_frame(*key: str) -> pd.DataFrame | None:
+    """
+    Memory-maps the frame stored under the given key. Returns None if the frame doesn't exist or is stale.
+    """
+    path = get_frame_path(*key)
+    try:
+        age = time.time() - os.path.getmtime(path)
+    except OSError:
+        return None
+
+    if age > MAX_FRAME_AGE.total_seconds():
+        LOGGER.warning(f"Precomputed frame {path} is stale ({age:.0f}s old).")
+        return None
+
+    return pyarrow.feather.read_table(path, memory_map=True).to_pandas()
+
+
+def load_tokens_info() -> src.visualizations.protocol_stats.TokensInfoType | None:
+    df = load_frame(TOKENS_INFO)
+    if df is None:
+        return None
+    return {
+        address: {"symbol": symbol, "name": name, "decimals": int(decimals)}
+        for address, symbol, name, decimals in df[["address", "symbol", "name", "decimals"]].itertuples(index=False)
+    }
+
+
+def load_prices() -> PricesType | None:
+    df = load_frame(PRICES)
+    if df is None:
+        return None
+    return {address: None if pd.isna(price) else float(price) for address, price in zip(df["address"], df["price"])}
+
+
+def load_tokens_with_tvl() -> list[tuple[str, float]] | None:
+    df = load_frame(TOKENS_WITH_TVL)
+    if df is None:
+        return None
+    return list(zip(df["address"], df["tvl"]))
+
+
+def load_user_health_ratios(protocols: list[str]) -> pd.DataFrame | None:
+    """
+    Loads health ratios of the given protocols. Returns None if any of the protocols hasn't been precomputed.
+    Protocols without data are stored as empty frames, these are left out.
+    """
+    data = []
+    for protocol in protocols:
+        df = load_frame(USER_HEALTH_RATIOS, protocol)
+        if df is None:
+            return None
+        for column in HOLDINGS_COLUMNS:
+            df[column] = df[column].map(json.loads)
+        data.append(df)
+
+    if not data:
+        return None
+    non_empty_data = [df for df in data if not df.empty]
+    if not non_empty_data:
+        return data[0]
+    return pd.concat(non_empty_data)
+
+
+def load_main_chart_data(
+    protocols: list[str],
+    token_pair: src.visualizations.main_chart.TokensSelected,
+) -> pd.DataFrame | None:
+    """
+    Loads main chart data for the given protocols and token pair. Returns None if the data hasn't been precomputed
+    and an empty frame if it has, but there is no liquidity or liquidable debt for the pair.
+    """
+    return load_frame(MAIN_CHART, get_protocols_key(protocols), get_token_pair_key(token_pair))
+
+
+def precompute_user_health_ratios():
+    with db.get_db_session() as session:
+        for protocol in PROTOCOLS:
+            df = src.visualizations.loans_table.load_user_health_ratios_single_protocol(session, protocol)
+            if df is None:
+                LOGGER.error(f'Unable to get user health ratios data for protocol "{protocol}"')
+                # Store an empty frame, so that the dashboard skips the protocol without querying the database.
+                df = pd.DataFrame(columns=USER_HEALTH_RATIOS_COLUMNS)
+
+            df = df.copy()
+            for column in HOLDINGS_COLUMNS:
+                df[column] = df[column].map(json.dumps)
+            store_frame(df, USER_HEALTH_RATIOS, protocol)
+
+
+def precompute_main_chart_data(
+    token_pair: src.visualizations.main_chart.TokensSelected,
+    prices: PricesType,
+):
+    """
+    Stores main chart data of the token pair for every subset of protocols. Liquidity and the liquidable debt of
+    each protocol are loaded only once, the subsets are combined in memory.
+    """
+    protocol_sets = [
+        list(protocols)
+        for size in range(1, len(PROTOCOLS) + 1)
+        for protocols in itertools.combinations(PROTOCOLS, size)
+    ]
+    pair_key = get_token_pair_key(token_pair)
+
+    supply_data = src.visualizations.main_chart.get_debt_token_supply_data(token_pair, prices)
+    if supply_data is None:
+        for protocols in protocol_sets:
+            store_frame(pd.DataFrame(), MAIN_CHART, get_protocols_key(protocols), pair_key)
+        return
+
+    liquidable_debts = {}
+    with db.get_db_session() as session:
+        for protocol in PROTOCOLS:
+            debt = src.visualizations.main_chart.get_liquidable_debt_single_protocol(
+                session,
+                protocol,
+                token_pair.collateral.address,
+                token_pair.loan.address,
+            )
+            if debt is not None:
+                liquidable_debts[protocol] = debt
+
+    for protocols in protocol_sets:
+        liquidable_debt = src.visualizations.main_chart.aggregate_liquidable_debt(
+            [liquidable_debts[protocol] for protocol in protocols if protocol in liquidable_debts]
+        )
+        if liquidable_debt is None:
+            data = pd.DataFrame()
+        else:
+            data = src.visualizations.main_chart.add_liquidable_debt(supply_data, liquidable_debt).astype(float)
+        store_frame(data, MAIN_CHART, get_protocols_key(protocols), pair_key)
+
+
+def precompute_dashboard_data():
+    """
+    Computes and stores all frames the dashboard reads.
+    """
+    # Streamlit caches functions in the process memory even without a running app, clear them so that every round
+    # works with fresh data.
+    st.cache_data.clear()
+
+    tokens_available = src.visualizations.protocol_stats.get_unique_token_supply_mints() or DEFAULT_TOKENS
+    tokens_info = get_tokens_address_to_info_map()
+    tokens_prices = get_prices_for_tokens(tokens_available)
+    tokens_with_tvl = src.visualizations.protocol_stats.get_lending_tokens_with_tvl(tokens_prices, tokens_info)
+
+    store_frame(
+        pd.DataFrame(
+            [
+                {"address": address, "symbol": info["symbol"], "name": info["name"], "decimals": info["decimals"]}
+                for address, info in tokens_info.items()
+            ]
+        ),
+        TOKENS_INFO,
+    )
+    store_frame(
+        pd.DataFrame({"address": list(tokens_prices.keys()), "price": list(tokens_prices.values())}),
+        PRICES,
+    )
+    store_frame(
+        pd.DataFrame(
+            {
+                "address": [address for address, _ in tokens_with_tvl],
+                "tvl": [float(tvl) for _, tvl in tokens_with_tvl],
+            }
+        ),
+        TOKENS_WITH_TVL,
+    )
+    LOGGER.info("Stored token info, prices and TVLs.")
+
+    precompute_user_health_ratios()
+    LOGGER.info("Stored user health ratios.")
+
+    tokens = src.visualizations.main_chart.token_addresses_to_Token_list(
+        [address for address, tvl in tokens_with_tvl if tvl > MIN_TVL],
+        tokens_info,
+    )
+    tokens = [token for token in tokens if tokens_prices.get(token.address)]
+    token_pairs = [
+        src.visualizations.main_chart.TokensSelected(collateral=collateral, loan=loan)
+        for collateral, loan in itertools.product(tokens, tokens)
+        if collateral != loan
+    ]
+    for ix, token_pair in enumerate(token_pairs):
+        precompute_main_chart_data(token_pair, tokens_prices)
+        LOGGER.info(f"Stored main chart data for {ix + 1} out of {len(token_pairs)} token pairs.")
+
+
+def precompute_dashboard_data_continuously():
+    LOGGER.info("Starting dashboard data precomputation.")
+
+    while True:
+        start_time = time.time()
+        precompute_dashboard_data()
+        processing_time = time.time() - start_time
+        LOGGER.info(f"Dashboard data precomputed in {processing_time:.2f}s.")
+        time.sleep(max(0, PRECOMPUTE_INTERVAL.total_seconds() - processing_time))
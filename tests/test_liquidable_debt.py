@@ -0,0 +1,66 @@
+""" Tests of liquidable debts computed with the index of liquidation prices """
+import pandas
+import pytest
+
+# The module needs the full environment, e.g. streamlit for `get_token_range`.
+liquidable_debt = pytest.importorskip('src.loans.liquidable_debt')
+
+
+def get_loan_states() -> pandas.DataFrame:
+    """
+    Solend loan states with SOL collateral and USDC debt: a loan which is never liquidable, loans liquidable below
+    the current price, an already liquidable loan and a loan borrowing more SOL than it deposited.
+    """
+    return pandas.DataFrame(
+        {
+            'collateral_usd_risk_adjusted_cSOL': [1_000.0, 800.0, 500.0, 300.0, 100.0],
+            'collateral_usd_risk_adjusted_cUSDC': [2_000.0, 100.0, 0.0, 50.0, 400.0],
+            'debt_usd_risk_adjusted_USDC': [500.0, 600.0, 450.0, 400.0, 100.0],
+            'debt_usd_risk_adjusted_SOL': [0.0, 0.0, 20.0, 0.0, 250.0],
+            'debt_usd_USDC': [500.0, 600.0, 450.0, 400.0, 100.0],
+        },
+        index=['never', 'below', 'close', 'liquidable', 'short'],
+    )
+
+
+def test_liquidable_debts_match_price_grid():
+    """ Test """
+    loan_states = get_loan_states()
+    collateral_token_price = 100.0
+
+    def compute_liquidable_debt_at_price(loans: pandas.DataFrame, price: float) -> float:
+        return liquidable_debt.compute_liquidable_debt_for_price_target(
+            loan_states=loans,
+            debt_token='USDC',
+            collateral_mints=['cSOL'],
+            collateral_underlying_token='SOL',
+            original_price=collateral_token_price,
+            target_price=price,
+        )
+
+    liquidation_prices = liquidable_debt.compute_liquidation_prices(
+        collateral_usd=loan_states[['collateral_usd_risk_adjusted_cSOL', 'collateral_usd_risk_adjusted_cUSDC']].sum(
+            axis=1,
+        ).to_numpy(dtype=float),
+        collateral_token_usd=loan_states['collateral_usd_risk_adjusted_cSOL'].to_numpy(dtype=float),
+        debt_usd=loan_states[['debt_usd_risk_adjusted_USDC', 'debt_usd_risk_adjusted_SOL']].sum(axis=1).to_numpy(
+            dtype=float,
+        ),
+        collateral_token_debt_usd=loan_states['debt_usd_risk_adjusted_SOL'].to_numpy(dtype=float),
+        collateral_token_price=collateral_token_price,
+    )
+    liquidable_debts = liquidable_debt.compute_liquidable_debts(
+        loan_states=loan_states,
+        liquidation_prices=liquidation_prices,
+        collateral_token_price=collateral_token_price,
+        compute_liquidable_debt_at_price=compute_liquidable_debt_at_price,
+    )
+
+    # Every loan evaluated at every price level, as before the index.
+    price_grid = pandas.DataFrame({'collateral_token_price': liquidable_debt.get_token_range(collateral_token_price)})
+    price_grid['amount'] = price_grid['collateral_token_price'].apply(
+        lambda price: compute_liquidable_debt_at_price(loan_states.copy(), price)
+    ).astype(float).diff().abs()
+
+    pandas.testing.assert_frame_equal(liquidable_debts, price_grid)
+    assert liquidable_debts['amount'].sum() > 0